@@ -0,0 +1,2 @@
+from src.constants import dsp
+from src.constants import inputs
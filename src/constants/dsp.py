@@ -1 +1,6 @@
-DEFAULT_RATE = 48000
\ No newline at end of file
+DEFAULT_RATE = 48000
+
+# Time weightings (in s)
+
+TIME_WEIGHTING_FAST = 0.125
+TIME_WEIGHTING_SLOW = 1.0
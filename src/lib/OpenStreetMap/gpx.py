@@ -1,13 +1,16 @@
-import sys
-import os
 import gpxpy
 import gpxpy.gpx
+import gpxpy.gpxfield
+import xml.etree.ElementTree as ET
 from pathlib import Path
-import folium
+from typing import Callable, Iterator, NamedTuple
 import webbrowser
-
-sys.path.append(Path(os.getcwd()).as_posix())
 from src.lib import colors
+from src.lib.lazyImport import lazyImport
+
+folium = lazyImport("folium")
+# Not imported by folium itself, bound on its own so that it loads even when folium was imported first
+foliumPlugins = lazyImport("folium.plugins")
 
 
 class WAYPOINT_PROPERTIES:
@@ -17,6 +20,21 @@ class WAYPOINT_PROPERTIES:
     HIDDEN = "hidden"
 
 
+class WaypointRecord(NamedTuple):
+    """Lightweight waypoint, with its osmand extensions. Time is kept as its gpx (ISO 8601) text."""
+    name: str
+    latitude: float
+    longitude: float
+    icon: str = None
+    color: str = None
+    background: str = None
+    hidden: str = None
+    elevation: float = None
+    time: str = None
+    description: str = None
+    type: str = None
+
+
 def openGpx(gpxPath: Path) -> gpxpy.gpx.GPX:
     """Open gpx file and parse it.
 
@@ -26,11 +44,69 @@ def openGpx(gpxPath: Path) -> gpxpy.gpx.GPX:
     Returns:
         gpxpy.gpx.GPX: Parsed gpx file.
     """
-    gpx_file = open(gpxPath, 'r')
-    gpx = gpxpy.parse(gpx_file)
+    with open(gpxPath, 'r') as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
     return gpx
 
 
+def getXmlLocalName(tag: str) -> str:
+    """Returns xml tag without its namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def iterGpxWaypoints(gpxPath: Path, cityFilter: str = None, nameFilter: Callable[[str], bool] = None) -> Iterator[WaypointRecord]:
+    """Streams the waypoints of a gpx file without building gpxpy objects.
+    Parsed elements are freed as soon as their waypoint is read, so memory stays flat on large files.
+
+    Args:
+        gpxPath (Path): Path of gpx file.
+        cityFilter (str, optional): Only keeps waypoints named with this city prefix (CITY_number). Defaults to None.
+        nameFilter (Callable[[str], bool], optional): Only keeps waypoints whose name passes this test. Defaults to None.
+
+    Yields:
+        Iterator[WaypointRecord]: Waypoints, in file order.
+    """
+    cityPrefix = cityFilter.upper() + '_' if cityFilter is not None else None
+    with open(gpxPath, 'rb') as gpx_file:
+        context = ET.iterparse(gpx_file, events=("start", "end"))
+        _, root = next(context)
+        for event, element in context:
+            if event != "end" or getXmlLocalName(element.tag) != "wpt":
+                continue
+            name = None
+            fields = {}
+            properties = {}
+            for child in element:
+                localName = getXmlLocalName(child.tag)
+                if localName == "name":
+                    name = child.text
+                elif localName in ("ele", "time", "desc", "type"):
+                    fields[localName] = child.text
+                elif localName == "extensions":
+                    for extension in child:
+                        properties[getXmlLocalName(extension.tag)] = extension.text
+            keep = True
+            if cityPrefix is not None:
+                keep = name is not None and name.upper().startswith(cityPrefix)
+            if keep and nameFilter is not None:
+                keep = nameFilter(name)
+            if keep:
+                yield WaypointRecord(
+                    name=name,
+                    latitude=float(element.get("lat")),
+                    longitude=float(element.get("lon")),
+                    icon=properties.get(WAYPOINT_PROPERTIES.ICON),
+                    color=properties.get(WAYPOINT_PROPERTIES.COLOR),
+                    background=properties.get(WAYPOINT_PROPERTIES.BACKGROUND),
+                    hidden=properties.get(WAYPOINT_PROPERTIES.HIDDEN),
+                    elevation=float(fields["ele"]) if fields.get("ele") else None,
+                    time=fields.get("time"),
+                    description=fields.get("desc"),
+                    type=fields.get("type"),
+                    )
+            root.clear()
+
+
 def saveGpx(gpx: gpxpy.gpx.GPX, path: Path) -> None:
     """Saves gpx file
 
@@ -74,22 +150,128 @@ def replaceWaypointProperty(waypoint: gpxpy.gpx.GPXWaypoint, property: WAYPOINT_
     return waypoint
 
 
-def visualizeGpx(gpx):
-    m = folium.Map(location=[0, 0], zoom_start=10)
+def getWaypointRecords(gpx: gpxpy.gpx.GPX) -> list[WaypointRecord]:
+    """Converts the waypoints of a parsed gpx file into lightweight waypoints.
+
+    Args:
+        gpx (gpxpy.gpx.GPX): Gpx parsed file.
+
+    Returns:
+        list[WaypointRecord]: Waypoints, in file order.
+    """
+    records = []
     for waypoint in gpx.waypoints:
-        lastWaypointLocation = [waypoint.latitude, waypoint.longitude]
-        name = waypoint.name if waypoint.name else "Waypoint"
-        color = getWaypointProperty(waypoint, 'color')
-        desaturatedColor = colors.saturateHEX(color, 0.85)
-        folium.CircleMarker(
-            [waypoint.latitude, waypoint.longitude],
-            radius=6,
-            color=desaturatedColor,
-            fill_color=color,
-            fill=True,
-            fill_opacity=1,
-            popup=name
-            ).add_to(m)
-    m.location = lastWaypointLocation
-    m.save("waypoints_map.html")
-    webbrowser.open("waypoints_map.html")
+        properties = {getXmlLocalName(extension.tag): extension.text for extension in waypoint.extensions}
+        records.append(WaypointRecord(
+            name=waypoint.name,
+            latitude=waypoint.latitude,
+            longitude=waypoint.longitude,
+            icon=properties.get(WAYPOINT_PROPERTIES.ICON),
+            color=properties.get(WAYPOINT_PROPERTIES.COLOR),
+            background=properties.get(WAYPOINT_PROPERTIES.BACKGROUND),
+            hidden=properties.get(WAYPOINT_PROPERTIES.HIDDEN),
+            elevation=waypoint.elevation,
+            time=gpxpy.gpxfield.format_time(waypoint.time) if waypoint.time is not None else None,
+            description=waypoint.description,
+            type=waypoint.type,
+            ))
+    return records
+
+
+def getWaypointLayerName(name: str) -> str:
+    """Returns the layer of a waypoint on the map, its city prefix for names like CITY_number."""
+    if not name or '_' not in name:
+        return "Waypoints"
+    return name.split('_', 1)[0].upper()
+
+
+class MAP_MODES:
+    MARKERS = "markers"
+    GEOJSON = "geojson"
+    CLUSTER = "cluster"
+
+
+CLUSTER_CALLBACK = """\
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {radius: 6, color: row[3], fillColor: row[4], fill: true, fillOpacity: 1});
+    marker.bindPopup(row[2]);
+    return marker;
+};
+"""
+
+
+def visualizeGpx(gpx: gpxpy.gpx.GPX, mode: str = MAP_MODES.GEOJSON, desaturation: float = 0.85,
+                 outputPath: Path = "waypoints_map.html", openBrowser: bool = True) -> "folium.Map":
+    """Draws the waypoints of a gpx file on an html map, one toggleable layer per city.
+
+    Markers mode adds one marker per waypoint and suits small files. Geojson mode embeds each city as a
+    single layer whose styles are shared between waypoints of a same color, and cluster mode builds the
+    markers in the browser, grouped by zoom level, so that large files stay light to save and to display.
+
+    Args:
+        gpx (gpxpy.gpx.GPX): Gpx parsed file, or a list of WaypointRecord.
+        mode (str, optional): One of MAP_MODES. Defaults to MAP_MODES.GEOJSON.
+        desaturation (float, optional): Saturation factor of the marker outlines. Defaults to 0.85.
+        outputPath (Path, optional): Path of the saved map. Defaults to "waypoints_map.html".
+        openBrowser (bool, optional): Opens the saved map in the browser. Defaults to True.
+
+    Returns:
+        folium.Map: Drawn map.
+    """
+    records = getWaypointRecords(gpx) if isinstance(gpx, gpxpy.gpx.GPX) else list(gpx)
+    # Outline colors are computed once per fill color, that is once per invader state
+    outlineColors = {color: colors.getSaturatedHEX(color, desaturation) if color else None
+                     for color in {record.color for record in records}}
+    layers = {}
+    for record in records:
+        layers.setdefault(getWaypointLayerName(record.name), []).append(record)
+
+    m = folium.Map(location=[0, 0], zoom_start=10)
+    for layerName in sorted(layers.keys()):
+        layerRecords = layers[layerName]
+        if mode == MAP_MODES.CLUSTER:
+            data = [
+                [record.latitude, record.longitude, record.name or "Waypoint", outlineColors[record.color], record.color]
+                for record in layerRecords
+                ]
+            foliumPlugins.FastMarkerCluster(data, callback=CLUSTER_CALLBACK, name=layerName).add_to(m)
+        elif mode == MAP_MODES.GEOJSON:
+            features = [{
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [record.longitude, record.latitude]},
+                "properties": {"name": record.name or "Waypoint", "color": outlineColors[record.color], "fillColor": record.color},
+                } for record in layerRecords]
+            folium.GeoJson(
+                {"type": "FeatureCollection", "features": features},
+                name=layerName,
+                marker=folium.CircleMarker(radius=6, fill=True, fill_opacity=1),
+                style_function=lambda feature: {
+                    "color": feature["properties"]["color"], "fillColor": feature["properties"]["fillColor"]
+                    },
+                popup=folium.GeoJsonPopup(fields=["name"], labels=False),
+                ).add_to(m)
+        elif mode == MAP_MODES.MARKERS:
+            featureGroup = folium.FeatureGroup(name=layerName).add_to(m)
+            for record in layerRecords:
+                folium.CircleMarker(
+                    [record.latitude, record.longitude],
+                    radius=6,
+                    color=outlineColors[record.color],
+                    fill_color=record.color,
+                    fill=True,
+                    fill_opacity=1,
+                    popup=record.name or "Waypoint"
+                    ).add_to(featureGroup)
+        else:
+            raise ValueError(f"Unknown map mode {mode}, expected one of {MAP_MODES.MARKERS}, {MAP_MODES.GEOJSON} or {MAP_MODES.CLUSTER}")
+    if records:
+        latitudes = [record.latitude for record in records]
+        longitudes = [record.longitude for record in records]
+        m.fit_bounds([[min(latitudes), min(longitudes)], [max(latitudes), max(longitudes)]])
+    folium.LayerControl(collapsed=len(layers) > 10).add_to(m)
+    if outputPath is not None:
+        m.save(outputPath)
+        if openBrowser:
+            webbrowser.open(Path(outputPath).resolve().as_uri())
+    return m
@@ -0,0 +1,117 @@
+import os
+import hashlib
+import logging
+import numpy as np
+from pathlib import Path
+from src.lib.OpenStreetMap.invadersTable import InvadersTable
+
+
+CACHE_SUFFIX = ".npz"
+CACHE_VERSION = 2
+
+
+def getCachePath(gpxPath: Path, cacheFolder: Path = None) -> Path:
+    """Returns the path of the sidecar cache of a gpx file.
+
+    Args:
+        gpxPath (Path): Path of the gpx file.
+        cacheFolder (Path, optional): Folder of the cache. Defaults to None, the folder of the gpx file.
+
+    Returns:
+        Path: Path of the cache, next to the gpx file unless a cache folder is given.
+    """
+    gpxPath = Path(gpxPath)
+    if cacheFolder is not None:
+        return Path(cacheFolder)/(gpxPath.name + CACHE_SUFFIX)
+    return gpxPath.with_name(gpxPath.name + CACHE_SUFFIX)
+
+
+def computeFileHash(path: Path) -> str:
+    """Computes the sha256 hash of a file content.
+
+    Args:
+        path (Path): Path of the file.
+
+    Returns:
+        str: Hex digest of the content.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _getFileKey(gpxPath: Path) -> dict:
+    stat = os.stat(gpxPath)
+    return {"path": Path(gpxPath).resolve().as_posix(), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def saveInvadersTableCache(table: InvadersTable, gpxPath: Path, fileHash: str = None, cacheFolder: Path = None) -> None:
+    """Saves a table parsed from a gpx file into its sidecar cache, keyed by the gpx path, size, mtime and hash.
+
+    Args:
+        table (InvadersTable): Table parsed from the gpx file.
+        gpxPath (Path): Path of the gpx file.
+        fileHash (str, optional): Hash of the gpx file if already computed. Defaults to None.
+        cacheFolder (Path, optional): Folder of the cache, created if needed. Defaults to None, the folder of the gpx file.
+    """
+    fileKey = _getFileKey(gpxPath)
+    if fileHash is None:
+        fileHash = computeFileHash(gpxPath)
+    cachePath = getCachePath(gpxPath, cacheFolder)
+    cachePath.parent.mkdir(parents=True, exist_ok=True)
+    temporaryPath = cachePath.with_name(cachePath.name + ".tmp" + CACHE_SUFFIX)
+    np.savez(
+        temporaryPath,
+        cacheVersion=np.array(CACHE_VERSION),
+        gpxPath=np.array(fileKey["path"]),
+        gpxSize=np.array(fileKey["size"]),
+        gpxMtime=np.array(fileKey["mtime"]),
+        gpxHash=np.array(fileHash),
+        **table.toArrays(),
+        )
+    os.replace(temporaryPath, cachePath)
+
+
+def loadInvadersTable(gpxPath: Path, cityFilter: str = None, useCache: bool = True, cacheFolder: Path = None) -> InvadersTable:
+    """Loads the invaders of a gpx file, from its sidecar cache when it is still valid.
+    The cache is valid if the gpx path, size and mtime did not change, or if its content hash did not change.
+    Otherwise the gpx file is parsed again and the cache rewritten.
+
+    Args:
+        gpxPath (Path): Path of the gpx file.
+        cityFilter (str, optional): Name of the city. Defaults to None.
+        useCache (bool, optional): If False, always parses the gpx file. Defaults to True.
+        cacheFolder (Path, optional): Folder of the cache. Defaults to None, the folder of the gpx file.
+
+    Returns:
+        InvadersTable: Table of invaders.
+    """
+    table = None
+    fileHash = None
+    cachePath = getCachePath(gpxPath, cacheFolder)
+    if useCache and cachePath.exists():
+        fileKey = _getFileKey(gpxPath)
+        try:
+            with np.load(cachePath) as cache:
+                if int(cache["cacheVersion"]) == CACHE_VERSION and str(cache["gpxPath"]) == fileKey["path"] \
+                        and int(cache["gpxSize"]) == fileKey["size"]:
+                    if int(cache["gpxMtime"]) == fileKey["mtime"]:
+                        table = InvadersTable.fromArrays(cache)
+                    else:
+                        fileHash = computeFileHash(gpxPath)
+                        if str(cache["gpxHash"]) == fileHash:
+                            table = InvadersTable.fromArrays(cache)
+                            # Content did not change, refresh the key so that next loads skip hashing
+                            saveInvadersTableCache(table, gpxPath, fileHash, cacheFolder)
+        except (OSError, KeyError, ValueError) as error:
+            logging.warning(f"Ignoring unreadable cache {cachePath}: {error}")
+            table = None
+    if table is None:
+        table = InvadersTable.fromGpx(gpxPath)
+        if useCache:
+            saveInvadersTableCache(table, gpxPath, fileHash, cacheFolder)
+    if cityFilter is not None:
+        table = table.selectCity(cityFilter)
+    return table
@@ -0,0 +1,187 @@
+import os
+import json
+import logging
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import src.lib.OpenStreetMap.gpx as gpxLib
+from src.lib.lazyImport import lazyImport
+
+# Bound lazily, invadersTable depending on invadersEditor which imports this module
+gpxCache = lazyImport("src.lib.OpenStreetMap.gpxCache")
+invadersTable = lazyImport("src.lib.OpenStreetMap.invadersTable")
+
+
+MANIFEST_SUFFIX = ".manifest.json"
+CACHE_FOLDER_SUFFIX = ".cache"
+MANIFEST_VERSION = 1
+MAX_INVADER_NUMBER = 10000
+
+
+class CONFLICT_POLICIES:
+    FIRST = "first"
+    NEWEST = "newest"
+    COLORED = "colored"
+
+
+def getManifestPath(outputPath: Path) -> Path:
+    """Returns the path of the manifest of a merged gpx file, next to it."""
+    outputPath = Path(outputPath)
+    return outputPath.with_name(outputPath.name + MANIFEST_SUFFIX)
+
+
+def getCacheFolder(outputPath: Path) -> Path:
+    """Returns the folder of the caches of the inputs of a merged gpx file, next to it.
+    Inputs are cached there rather than next to themselves, so that merges leave the input files alone."""
+    outputPath = Path(outputPath)
+    return outputPath.with_name(outputPath.name + CACHE_FOLDER_SUFFIX)
+
+
+def _loadGpxArrays(gpxPath: str, cacheFolder: str) -> dict:
+    """Parses a gpx file in a worker process, through its cache, into picklable arrays."""
+    return gpxCache.loadInvadersTable(gpxPath, cacheFolder=cacheFolder).toArrays()
+
+
+def _getFileEntry(gpxPath: Path, previousEntry: dict = None) -> dict:
+    """Returns the size, mtime and hash of a file, the hash being only computed if size or mtime changed."""
+    stat = os.stat(gpxPath)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if previousEntry is not None and previousEntry["size"] == entry["size"] and previousEntry["mtime"] == entry["mtime"]:
+        entry["hash"] = previousEntry["hash"]
+    else:
+        entry["hash"] = gpxCache.computeFileHash(gpxPath)
+    return entry
+
+
+def _saveManifest(manifestPath: Path, policy: str, files: dict) -> None:
+    manifestPath.write_text(
+        json.dumps({"version": MANIFEST_VERSION, "policy": policy, "files": files}, indent=1), encoding="utf-8"
+        )
+
+
+def _getInvaderKeys(table: "invadersTable.InvadersTable", cityCodes: dict) -> np.ndarray:
+    """Returns the global (city, number) key of each row, the number being compared without its zero padding."""
+    codeMap = np.array([cityCodes.setdefault(city, len(cityCodes)) for city in table.cities.values] or [0], dtype=np.int64)
+    return codeMap[table.cityCodes]*MAX_INVADER_NUMBER + table.numbers
+
+
+def mergeInvadersTables(tables: list, priorities: list = None, policy: str = CONFLICT_POLICIES.NEWEST) -> tuple:
+    """Merges tables of invaders, keeping a single row per (city, number).
+
+    Conflicts are solved deterministically: with FIRST the row of the first table wins, with NEWEST the row of the
+    table of highest priority wins, and with COLORED rows with a state other than OK (e.g. flashed) win,
+    then the priority decides. Remaining ties go to the first table.
+
+    Args:
+        tables (list): Tables to merge.
+        priorities (list, optional): Priority of each table, e.g. the mtime of its file. Defaults to the table order.
+        policy (str, optional): One of CONFLICT_POLICIES. Defaults to CONFLICT_POLICIES.NEWEST.
+
+    Returns:
+        tuple: Merged table, sorted by city and number, and the number of dropped duplicates.
+    """
+    if priorities is None:
+        priorities = range(len(tables))
+    cityCodes = {}
+    keys = np.concatenate([_getInvaderKeys(table, cityCodes) for table in tables] or [np.empty(0, dtype=np.int64)])
+    tableIndexes = np.repeat(np.arange(len(tables)), [len(table) for table in tables])
+    merged = invadersTable.InvadersTable.concatenate(tables)
+    priorities = np.asarray(list(priorities), dtype=np.float64)[tableIndexes] if len(tables) else np.empty(0)
+    if policy == CONFLICT_POLICIES.FIRST:
+        sortKeys = [tableIndexes, keys]
+    elif policy == CONFLICT_POLICIES.NEWEST:
+        sortKeys = [tableIndexes, -priorities, keys]
+    elif policy == CONFLICT_POLICIES.COLORED:
+        isDefault = merged.stateCodes == invadersTable.STATES.index("OK")
+        sortKeys = [tableIndexes, -priorities, isDefault, keys]
+    else:
+        raise ValueError(f"Unknown conflict policy {policy}, expected one of {CONFLICT_POLICIES.FIRST}, "
+                         f"{CONFLICT_POLICIES.NEWEST} or {CONFLICT_POLICIES.COLORED}")
+    # Rows sorted by key then by preference, the first row of each key wins
+    order = np.lexsort(sortKeys)
+    _, firstIndexes = np.unique(keys[order], return_index=True)
+    winners = order[firstIndexes]
+    cityNames = np.array(merged.cities.values or [""], dtype=object)[merged.cityCodes[winners]]
+    winners = winners[np.lexsort([merged.numbers[winners], cityNames.astype(str)])] if len(winners) else winners
+    return merged.select(winners), len(keys) - len(winners)
+
+
+def mergeGpxFolder(folderPath: Path, name: str, policy: str = CONFLICT_POLICIES.NEWEST, maxWorkers: int = None,
+                   incremental: bool = True) -> Path:
+    """Merges the invaders of all the gpx files of a folder into the gpx file name.gpx of the same folder.
+
+    Files are parsed in a process pool, through caches kept in a folder next to the merged file (see
+    getCacheFolder). With incremental merges, a manifest next to the merged file records the size, mtime and
+    hash of the inputs: the merge is skipped if no input changed since, and only changed files are parsed
+    again otherwise. The merged waypoints keep all their gpx fields, e.g. elevation, time and description.
+
+    Args:
+        folderPath (Path): Folder of the gpx files.
+        name (str): Name of the merged gpx, also its file name. It is never an input of the merge.
+        policy (str, optional): One of CONFLICT_POLICIES. Defaults to CONFLICT_POLICIES.NEWEST.
+        maxWorkers (int, optional): Number of worker processes. Defaults to the number of cpus.
+        incremental (bool, optional): If False, all files are parsed and merged again. Defaults to True.
+
+    Returns:
+        Path: Path of the merged gpx.
+    """
+    folderPath = Path(folderPath)
+    outputPath = folderPath/(name + '.gpx')
+    manifestPath = getManifestPath(outputPath)
+    cacheFolder = getCacheFolder(outputPath)
+    inputPaths = sorted(
+        path for path in folderPath.iterdir()
+        if path.suffix.lower() == '.gpx' and path.is_file() and path.name != outputPath.name
+        )
+
+    previousFiles = {}
+    if incremental and manifestPath.exists() and outputPath.exists():
+        try:
+            manifest = json.loads(manifestPath.read_text(encoding="utf-8"))
+            if manifest.get("version") == MANIFEST_VERSION and manifest.get("policy") == policy:
+                previousFiles = manifest["files"]
+        except (OSError, ValueError, KeyError) as error:
+            logging.warning(f"Ignoring unreadable manifest {manifestPath}: {error}")
+    files = {path.name: _getFileEntry(path, previousFiles.get(path.name)) for path in inputPaths}
+    changedPaths = [
+        path for path in inputPaths
+        if previousFiles.get(path.name, {}).get("hash") != files[path.name]["hash"]
+        ]
+    if previousFiles and not changedPaths and files.keys() == previousFiles.keys():
+        # Touched files only matter to the newest policy, through their mtimes
+        if policy != CONFLICT_POLICIES.NEWEST or all(files[key]["mtime"] == previousFiles[key]["mtime"] for key in files):
+            if files != previousFiles:
+                _saveManifest(manifestPath, policy, files)
+            logging.info(f"{outputPath} is up to date")
+            return outputPath
+
+    tables = {}
+    if len(changedPaths) > 1 and maxWorkers != 1:
+        with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+            arraysList = executor.map(
+                _loadGpxArrays, [path.as_posix() for path in changedPaths], [cacheFolder.as_posix()]*len(changedPaths)
+                )
+            for path, arrays in zip(changedPaths, arraysList):
+                tables[path.name] = invadersTable.InvadersTable.fromArrays(arrays)
+    else:
+        for path in changedPaths:
+            tables[path.name] = gpxCache.loadInvadersTable(path, cacheFolder=cacheFolder)
+    # Unchanged files are read back from their caches
+    for path in inputPaths:
+        if path.name not in tables:
+            tables[path.name] = gpxCache.loadInvadersTable(path, cacheFolder=cacheFolder)
+    # Caches of the inputs removed since the last merge
+    cacheNames = {gpxCache.getCachePath(path, cacheFolder).name for path in inputPaths}
+    for cachePath in cacheFolder.glob("*" + gpxCache.CACHE_SUFFIX):
+        if cachePath.name not in cacheNames:
+            cachePath.unlink()
+    logging.info(f"Merging {len(inputPaths)} gpx files, {len(changedPaths)} changed")
+
+    merged, nDuplicates = mergeInvadersTables(
+        [tables[path.name] for path in inputPaths], [files[path.name]["mtime"] for path in inputPaths], policy
+        )
+    if nDuplicates:
+        logging.warning(f"{nDuplicates} duplicates solved with the {policy} policy")
+    gpxLib.saveGpx(merged.toGpx(name=name), outputPath)
+    _saveManifest(manifestPath, policy, files)
+    return outputPath
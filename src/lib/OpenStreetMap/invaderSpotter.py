@@ -0,0 +1,318 @@
+import re
+import time
+import html as htmlLib
+import logging
+import threading
+import contextlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator
+from urllib.parse import urlsplit
+from src.lib.OpenStreetMap.responseCache import ResponseCache, CacheMissError, DEFAULT_TTL
+from src.lib.lazyImport import lazyImport
+
+requests = lazyImport("requests")
+
+
+SPOTTER_URL = "https://www.invader-spotter.art"
+LISTING_PAGE = "/listing.php"
+NEWS_PAGE = "/news.php"
+CITIES_PAGE = "/villes.php"
+DEFAULT_CACHE_PATH = Path.home()/".cache"/"invaderSpotter"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+LISTING_ROW_PATTERN = re.compile(r'<tr\b[^>]*\bclass=["\']?haut\b[^>]*>(.*?)</tr\s*>', re.DOTALL | re.IGNORECASE)
+ROW_NODE_PATTERN = re.compile(r'<t[dh]\b.*?</t[dh]\s*>|[^<]+', re.DOTALL | re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]*>')
+STATE_END_PATTERN = re.compile(r' !|Instagram')
+DATE_PATTERN = re.compile(r'Date[^:]*:\s*((?:\d{1,2}/)?\d{1,2}/\d{2,4})')
+
+
+def parseListingRows(html: str) -> list:
+    """Extracts the invader rows of a listing page with precompiled patterns, without building any html tree.
+    Fields are read from the second node of each row, as in the site layout.
+
+    Args:
+        html (str): Listing page.
+
+    Returns:
+        list: List of (name, state, date) of the invaders, date being None if not found.
+    """
+    rows = []
+    for rowMatch in LISTING_ROW_PATTERN.finditer(html):
+        nodes = ROW_NODE_PATTERN.finditer(rowMatch.group(1))
+        node = next(nodes, None)
+        node = next(nodes, None)
+        if node is None:
+            continue
+        text = htmlLib.unescape(TAG_PATTERN.sub('', node.group(0)))
+        name = text.split(' ', 1)[0]
+        state = text.split('Date', 1)[0].rpartition(':  ')[2]
+        stateEnd = STATE_END_PATTERN.search(state)
+        if stateEnd is not None:
+            state = state[:stateEnd.start()]
+        date = DATE_PATTERN.search(text)
+        rows.append((name, state, date.group(1) if date is not None else None))
+    return rows
+
+
+def parseListingPage(html: str) -> dict:
+    """Parses the invaders of a listing page.
+
+    Args:
+        html (str): Listing page.
+
+    Returns:
+        dict: Dict of invader states by name, empty past the last page.
+    """
+    stateDict = {}
+    for name, state, _ in parseListingRows(html):
+        logging.info("%s : %s", name, state)
+        stateDict[name] = state
+    return stateDict
+
+
+class RateLimiter:
+    """Spaces requests to a same host by a minimum interval, shared by all threads."""
+
+    def __init__(self, requestsPerSecond: float):
+        self.interval = 1/requestsPerSecond if requestsPerSecond else 0
+        self._lock = threading.Lock()
+        self._nextSlots = {}
+
+    def acquire(self, host: str) -> None:
+        """Blocks until a request to host is allowed.
+
+        Args:
+            host (str): Host of the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._nextSlots.get(host, now))
+            self._nextSlots[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class InvaderSpotterClient:
+    """Client of invader-spotter.art, sharing a pooled session between worker threads.
+
+    Requests are rate limited per host, timed out and retried with exponential backoff.
+    Listing pages of several cities are fetched concurrently, each city fetching a few pages ahead
+    until its first empty page. With a response cache, fresh pages are served without request
+    and stale ones are revalidated with conditional requests.
+    """
+
+    def __init__(self, baseUrl: str = SPOTTER_URL, maxWorkers: int = 8, requestsPerSecond: float = 10,
+                 timeout: float = 10, retries: int = 3, backoff: float = 0.5, lookahead: int = 2,
+                 cache: ResponseCache = None):
+        """
+        Args:
+            baseUrl (str, optional): Url of the site. Defaults to SPOTTER_URL.
+            maxWorkers (int, optional): Number of concurrent requests. Defaults to 8.
+            requestsPerSecond (float, optional): Maximum request rate per host. Defaults to 10.
+            timeout (float, optional): Timeout of each request (in s). Defaults to 10.
+            retries (int, optional): Number of retries of a failed request. Defaults to 3.
+            backoff (float, optional): Delay before the first retry, doubled at each retry (in s). Defaults to 0.5.
+            lookahead (int, optional): Number of listing pages of a city requested ahead. Defaults to 2.
+            cache (ResponseCache, optional): Persistent cache of the pages. Defaults to None.
+        """
+        self.baseUrl = baseUrl.rstrip('/')
+        self.maxWorkers = maxWorkers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.lookahead = lookahead
+        self.cache = cache
+        self.rateLimiter = RateLimiter(requestsPerSecond)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=maxWorkers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Referer": self.baseUrl + CITIES_PAGE, "Origin": self.baseUrl})
+
+    def close(self) -> None:
+        """Saves the response cache, if any, and closes the session."""
+        if self.cache is not None:
+            self.cache.flush()
+        self.session.close()
+
+    def __enter__(self) -> "InvaderSpotterClient":
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
+
+    def request(self, method: str, path: str, data: dict = None, headers: dict = None) -> "requests.Response":
+        """Sends a request, retried on connection errors and on server errors.
+
+        Args:
+            method (str): GET or POST.
+            path (str): Path of the page on the site.
+            data (dict, optional): Form data. Defaults to None.
+            headers (dict, optional): Additional headers. Defaults to None.
+
+        Returns:
+            requests.Response: Response of the site.
+        """
+        url = self.baseUrl + path
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            self.rateLimiter.acquire(host)
+            try:
+                response = self.session.request(method, url, data=data, headers=headers, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} for {url}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                error = exception
+            if attempt < self.retries:
+                delay = self.backoff*2**attempt
+                logging.warning(f"{error}, retrying in {delay} s")
+                time.sleep(delay)
+        raise error
+
+    def fetchText(self, method: str, path: str, data: dict = None) -> str:
+        """Fetches a page, through the response cache if any.
+
+        Args:
+            method (str): GET or POST.
+            path (str): Path of the page on the site.
+            data (dict, optional): Form data. Defaults to None.
+
+        Returns:
+            str: Page content.
+        """
+        if self.cache is None:
+            return self.request(method, path, data=data).text
+        key = ResponseCache.getKey(method, self.baseUrl + path, data)
+        cached = self.cache.get(key)
+        if cached is not None and (cached["fresh"] or self.cache.offline):
+            return cached["body"]
+        if self.cache.offline:
+            raise CacheMissError(f"{method} {path} {data} is not cached")
+        headers = {}
+        if cached is not None and cached["etag"] is not None:
+            headers["If-None-Match"] = cached["etag"]
+        if cached is not None and cached["lastModified"] is not None:
+            headers["If-Modified-Since"] = cached["lastModified"]
+        response = self.request(method, path, data=data, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            self.cache.refresh(key)
+            return cached["body"]
+        self.cache.put(key, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return response.text
+
+    def fetchListingPage(self, city: str, page: int) -> str:
+        """Fetches a listing page of a city.
+
+        Args:
+            city (str): City prefix.
+            page (int): Index of the page, starting at 0.
+
+        Returns:
+            str: Listing page.
+        """
+        data = {"ville": city, "arron": "00", "mode": "lst", "rang": "10"}
+        if page > 0:
+            data["page"] = str(int(page+1))
+        return self.fetchText("POST", LISTING_PAGE, data=data)
+
+    def fetchNewsPage(self) -> str:
+        """Fetches the news page."""
+        return self.fetchText("GET", NEWS_PAGE)
+
+    def iterStateInfos(self, cities: list) -> Iterator[tuple]:
+        """Gets the states of all the invaders of several cities, each city being yielded as soon as
+        all its pages are fetched, while the other ones are still being fetched.
+
+        Args:
+            cities (list): City prefixes, each city being yielded once even if repeated.
+
+        Yields:
+            Iterator[tuple]: City prefix and its dict of invader states by name, in completion order.
+        """
+        cities = list(dict.fromkeys(cities))
+        pagesDict = {city: {} for city in cities}
+        lastPages = {}
+        nextPages = {}
+        pendingCounts = {city: 0 for city in cities}
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+
+            def submit(city):
+                page = nextPages[city]
+                nextPages[city] = page + 1
+                future = executor.submit(lambda: parseListingPage(self.fetchListingPage(city, page)))
+                pending[future] = (city, page)
+                pendingCounts[city] += 1
+
+            for city in cities:
+                nextPages[city] = 0
+                for _ in range(self.lookahead):
+                    submit(city)
+            while pending:
+                done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    city, page = pending.pop(future)
+                    pendingCounts[city] -= 1
+                    pageStates = future.result()
+                    if pageStates == {}:
+                        lastPages[city] = min(page, lastPages.get(city, page))
+                    else:
+                        pagesDict[city][page] = pageStates
+                        if city not in lastPages:
+                            submit(city)
+                    if city in lastPages and pendingCounts[city] == 0:
+                        stateDict = {}
+                        for page in sorted(pagesDict[city].keys()):
+                            if page < lastPages[city]:
+                                stateDict.update(pagesDict[city][page])
+                        yield city, stateDict
+
+    def getStateInfos(self, cities: list) -> dict:
+        """Gets the states of all the invaders of several cities.
+
+        Args:
+            cities (list): City prefixes.
+
+        Returns:
+            dict: Dict of invader states by name.
+        """
+        cityStateDicts = dict(self.iterStateInfos(cities))
+        stateDict = {}
+        for city in cities:
+            stateDict.update(cityStateDicts.get(city, {}))
+        return stateDict
+
+
+def createCachedClient(cachePath: Path = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL, offline: bool = False,
+                       **clientOptions) -> InvaderSpotterClient:
+    """Creates a client keeping the pages in a persistent response cache, so that repeated runs send no
+    request while pages are fresh, and only conditional requests once they are stale.
+
+    Args:
+        cachePath (Path, optional): Folder of the cache, None for a client without cache. Defaults to DEFAULT_CACHE_PATH.
+        ttl (float, optional): Time during which a page is served without request (in s). Defaults to 1 day.
+        offline (bool, optional): If True, pages are only served from cache. Defaults to False.
+        **clientOptions: Other arguments of InvaderSpotterClient, e.g. baseUrl or maxWorkers.
+
+    Returns:
+        InvaderSpotterClient: Client, to be closed once done so that cache access times are saved.
+    """
+    cache = ResponseCache(cachePath, ttl=ttl, offline=offline) if cachePath is not None else None
+    return InvaderSpotterClient(cache=cache, **clientOptions)
+
+
+def openClient(client: InvaderSpotterClient = None) -> contextlib.AbstractContextManager:
+    """Returns a context of a client, of a new cached client closed on exit if client is None.
+
+    Args:
+        client (InvaderSpotterClient, optional): Client, left open on exit. Defaults to None.
+
+    Returns:
+        contextlib.AbstractContextManager: Context giving the client.
+    """
+    if client is not None:
+        return contextlib.nullcontext(client)
+    return createCachedClient()
@@ -0,0 +1,173 @@
+import time
+import hashlib
+import threading
+import tempfile
+from pathlib import Path
+from urllib.parse import parse_qs
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import src.lib.OpenStreetMap.invaderSpotter as invaderSpotter
+from src.lib.OpenStreetMap.responseCache import ResponseCache, DEFAULT_TTL
+
+
+EMPTY_LISTING_PAGE = "<html><body><table></table></body></html>"
+NEWS_FILE_NAME = "news.html"
+# Synthetic pages in the layout of the site, with anonymised invaders: not captures of the live site's markup
+FIXTURE_PAGES_PATH = Path(__file__).resolve().parents[3]/"ressources"/"invaderSpotter"
+
+
+def getListingFileName(city: str, page: int) -> str:
+    """Returns the file name of a saved listing page (page index starting at 0)."""
+    return f"{city}_{page}.html"
+
+
+def recordPages(client: invaderSpotter.InvaderSpotterClient, cities: list, folderPath: Path) -> None:
+    """Records the listing pages of cities and the news page from a live site, to be replayed offline.
+
+    Args:
+        client (invaderSpotter.InvaderSpotterClient): Client of the live site.
+        cities (list): City prefixes.
+        folderPath (Path): Folder of the recorded pages.
+    """
+    folderPath = Path(folderPath)
+    folderPath.mkdir(parents=True, exist_ok=True)
+    for city in cities:
+        page = 0
+        while True:
+            html = client.fetchListingPage(city, page)
+            (folderPath/getListingFileName(city, page)).write_text(html, encoding="utf-8")
+            if invaderSpotter.parseListingPage(html) == {}:
+                break
+            page += 1
+    (folderPath/NEWS_FILE_NAME).write_text(client.fetchNewsPage(), encoding="utf-8")
+
+
+def getListingCities(folderPath: Path = FIXTURE_PAGES_PATH) -> list:
+    """Returns the city prefixes of the listing pages saved in a folder, recorded or generated."""
+    return sorted({pagePath.stem.rsplit('_', 1)[0] for pagePath in Path(folderPath).glob("*_*.html")})
+
+
+def generateListingPages(folderPath: Path, invadersByCity: dict, perPage: int = 10) -> None:
+    """Writes synthetic listing pages, for offline runs without saved pages.
+
+    Args:
+        folderPath (Path): Folder of the generated pages.
+        invadersByCity (dict): Number of invaders by city prefix.
+        perPage (int, optional): Invaders per page. Defaults to 10.
+    """
+    folderPath = Path(folderPath)
+    folderPath.mkdir(parents=True, exist_ok=True)
+    states = ["OK", "Dégradé", "Détruit !", "Non visible", "Un peu dégradé"]
+    for city, nInvaders in invadersByCity.items():
+        nPages = -(-nInvaders//perPage)
+        for page in range(nPages):
+            rows = []
+            for number in range(page*perPage + 1, min((page + 1)*perPage, nInvaders) + 1):
+                rows.append(
+                    f'<tr class="haut"><td><img src="photos/{city}_{number:02d}.jpg"></td>'
+                    f'<td><b>{city}_{number:02d} [20 pts]</b><br>Dernier état connu :  {states[number % len(states)]}'
+                    f'<br>Date et source : 01/01/2020</td></tr>'
+                    )
+            html = f"<html><body><table>{''.join(rows)}</table></body></html>"
+            (folderPath/getListingFileName(city, page)).write_text(html, encoding="utf-8")
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """Serves saved pages, recorded or generated, as invader-spotter.art would, past the last page listings are empty.
+    Pages carry an ETag and conditional requests of unchanged pages are answered 304.
+    """
+    folderPath = Path(".")
+    latency = 0.0
+    requestCount = 0
+
+    def _sendPage(self, html: str, lastModified: float = None) -> None:
+        type(self).requestCount += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = html.encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        if lastModified is not None:
+            self.send_header("Last-Modified", formatdate(lastModified, usegmt=True))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != invaderSpotter.LISTING_PAGE:
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        city = form.get("ville", [""])[0]
+        page = int(form.get("page", ["1"])[0]) - 1
+        pagePath = self.folderPath/getListingFileName(city, page)
+        if pagePath.exists():
+            self._sendPage(pagePath.read_text(encoding="utf-8"), pagePath.stat().st_mtime)
+        else:
+            self._sendPage(EMPTY_LISTING_PAGE)
+
+    def do_GET(self):
+        newsPath = self.folderPath/NEWS_FILE_NAME
+        if self.path != invaderSpotter.NEWS_PAGE or not newsPath.exists():
+            self.send_error(404)
+            return
+        self._sendPage(newsPath.read_text(encoding="utf-8"), newsPath.stat().st_mtime)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startReplayServer(folderPath: Path, port: int = 0, latency: float = 0.0) -> tuple:
+    """Starts a local stand-in of invader-spotter.art replaying saved pages, in a background thread.
+
+    Args:
+        folderPath (Path): Folder of the saved pages, recorded or generated, e.g. FIXTURE_PAGES_PATH.
+        port (int, optional): Port of the server, 0 picks a free one. Defaults to 0.
+        latency (float, optional): Delay added to each response, to mimic the network (in s). Defaults to 0.
+
+    Returns:
+        tuple: Server, to shutdown when done, and its base url.
+    """
+    handler = type("ReplayHandler", (ReplayRequestHandler,), {"folderPath": Path(folderPath), "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    # Offline throughput of a multi-city refresh on the synthetic fixture pages, serial against concurrent
+    cities = getListingCities()
+    expectedStates = {}
+    for pagePath in FIXTURE_PAGES_PATH.glob("*_*.html"):
+        expectedStates.update(invaderSpotter.parseListingPage(pagePath.read_text(encoding="utf-8")))
+    server, baseUrl = startReplayServer(FIXTURE_PAGES_PATH, latency=0.05)
+    for maxWorkers in [1, 8]:
+        client = invaderSpotter.InvaderSpotterClient(
+            baseUrl=baseUrl, maxWorkers=maxWorkers, requestsPerSecond=None, lookahead=2 if maxWorkers > 1 else 1
+            )
+        start = time.perf_counter()
+        stateDict = client.getStateInfos(cities)
+        elapsed = time.perf_counter() - start
+        assert stateDict == expectedStates
+        print(f"{maxWorkers} workers: {len(stateDict)} invaders of {len(cities)} cities in {elapsed:.2f} s")
+    # Repeated runs through a response cache, fresh then stale (revalidated with 304)
+    with tempfile.TemporaryDirectory() as folder:
+        for ttl in [DEFAULT_TTL, 0]:
+            with ResponseCache(Path(folder)/f"cache{ttl}", ttl=ttl) as cache:
+                client = invaderSpotter.InvaderSpotterClient(baseUrl=baseUrl, requestsPerSecond=None, cache=cache)
+                client.getStateInfos(cities)
+                server.RequestHandlerClass.requestCount = 0
+                start = time.perf_counter()
+                stateDict = client.getStateInfos(cities)
+                elapsed = time.perf_counter() - start
+            print(f"cached run (ttl {ttl} s): {server.RequestHandlerClass.requestCount} requests in {elapsed:.2f} s")
+    server.shutdown()
@@ -1,13 +1,15 @@
 import logging
 import re
-import os
 import csv
-import requests
 import gpxpy
 import gpxpy.gpx
 import src.lib.OpenStreetMap.gpx as gpxLib
+import src.lib.OpenStreetMap.invaderSpotter as invaderSpotter
+import src.lib.OpenStreetMap.gpxMerge as gpxMerge
 from pathlib import Path
-from bs4 import BeautifulSoup
+from src.lib.lazyImport import lazyImport
+
+bs4 = lazyImport("bs4")
 
 
 COLOR_DICT = {
@@ -25,6 +27,17 @@ COLOR_DICT = {
 COLOR_REPLACEMENT_DICT = {
     "neutral": "OK",
 }
+STATE_FROM_COLOR = {color: COLOR_REPLACEMENT_DICT.get(state, state) for state, color in reversed(COLOR_DICT.items())}
+NEWS_STATE_DICT = {
+    'Destruction': "Détruit",
+    'Réactivation': "OK",
+    'Restauration': "OK",
+}
+# Cues whose new state is unknown, a degradation being any of the degraded states
+NEWS_UNRESOLVED_CUES = ['Dégradation', 'statut']
+NEWS_CUES = list(NEWS_STATE_DICT.keys()) + NEWS_UNRESOLVED_CUES
+NEWS_INVADER_PATTERN = re.compile(r'(?<![A-Za-z0-9_])[A-Za-z]{1,4}_\d{1,4}(?!\d)')
+NEWS_WORD_PATTERN = re.compile(r'\w+')
 
 
 def createInvaderGpx(name: str):
@@ -141,15 +154,14 @@ def getFlashedInfoFromGPX(gpxPath: Path) -> dict:
         dict: Dict of invaders and their flash state.
     """
     infosDict = {}
-    gpx = gpxLib.openGpx(gpxPath)
-    for waypoint in gpx.waypoints:
+    for waypoint in gpxLib.iterGpxWaypoints(gpxPath):
         splitName = waypoint.name.split(',')[0]
         splitName = splitName.split(' ')[-1]
         if 'PA' not in splitName.split('_') and 'VRS' not in splitName.split('_'):
             if '_' in waypoint.name:
                 splitName = waypoint.name.split('_')[-1]
             splitName = 'PA_' + splitName
-        waypointColor = gpxLib.getWaypointProperty(waypoint=waypoint, property=gpxLib.WAYPOINT_PROPERTIES.COLOR)
+        waypointColor = waypoint.color
         if waypointColor == '#88e030':
             status = 'flashed'
             color = '#88e030'
@@ -165,21 +177,21 @@ def getFlashedInfoFromGPX(gpxPath: Path) -> dict:
     return infosDict
 
 
-def groupGpxIntoOne(folderPath: Path, name):
-    invadersDict = {}
-    for fileName in os.listdir(folderPath):
-        if fileName.split('.')[-1] == 'gpx':
-            fileInvadersDict = getGpxInvaders(gpxPath=folderPath/fileName)
-            for city in fileInvadersDict.keys():
-                if city not in invadersDict.keys():
-                    invadersDict[city] = {}
-                for number in fileInvadersDict[city].keys():
-                    if number not in invadersDict[city].keys():
-                        invadersDict[city][number] = fileInvadersDict[city][number]
-                    else:
-                        logging.warning(f'duplicate found on {city}_{number}')
-    gpx = createGpxFromInvadersDict(invadersDict=invadersDict, name=name)
-    gpxLib.saveGpx(gpx, folderPath/ (name+'.gpx'))
+def groupGpxIntoOne(folderPath: Path, name, policy: str = gpxMerge.CONFLICT_POLICIES.NEWEST, maxWorkers: int = None,
+                    incremental: bool = True) -> Path:
+    """Merges the invaders of all the gpx files of a folder into name.gpx, see gpxMerge.mergeGpxFolder.
+
+    Args:
+        folderPath (Path): Folder of the gpx files.
+        name (str): Name of the merged gpx, also its file name.
+        policy (str, optional): One of gpxMerge.CONFLICT_POLICIES. Defaults to CONFLICT_POLICIES.NEWEST.
+        maxWorkers (int, optional): Number of worker processes. Defaults to the number of cpus.
+        incremental (bool, optional): If False, all files are parsed and merged again. Defaults to True.
+
+    Returns:
+        Path: Path of the merged gpx.
+    """
+    return gpxMerge.mergeGpxFolder(folderPath, name, policy=policy, maxWorkers=maxWorkers, incremental=incremental)
 
 
 def createGpxFromInvadersDict(invadersDict, name):
@@ -192,87 +204,99 @@ def createGpxFromInvadersDict(invadersDict, name):
     return gpx
 
 
-def getInvaderSpotterStateInfos(cityDict: dict):
-    url = "https://www.invader-spotter.art/listing.php"
-    stateDict = {}
-    for city in cityDict.keys():
-        page = 0
-        i = 0
-        while i != 1:
-            if page == 0:
-                r = requests.post(
-                    url="https://www.invader-spotter.art/listing.php",
-                    data={"ville": city, "arron": "00", "mode": "lst", "rang": "10"},
-                    headers={"Referer": "https://www.invader-spotter.art/villes.php", "Origin": "https://www.invader-spotter.art"}
-                )
-            else:
-                r = requests.post(
-                    url="https://www.invader-spotter.art/listing.php",
-                    data={"ville": city, "arron": "00", "mode": "lst", "rang": "10", "page": str(int(page+1))},
-                    headers={"Referer": "https://www.invader-spotter.art/villes.php", "Origin": "https://www.invader-spotter.art"}
-                )
-            soup = BeautifulSoup(r.text, "html.parser")
-            elements = soup.find_all("tr", {"class": "haut"})
-            if elements != []:
-                for element in elements:
-                    content = element.contents[1]
-                    state = content.text.split('Date')[0]
-                    state = state.split(':  ')[-1]
-                    name = content.text.split(' ')[0]
-                    if '!' in state:
-                        state = state.split(' !')[0]
-                    if 'Instagram' in state:
-                        state = state.split('Instagram')[0]
-                    logging.info(name + " : " + state)
-                    stateDict[name] = state
-                page += 1
-            else:
-                i = 1
-    return stateDict
+def getInvaderSpotterStateInfos(cityDict: dict, client: invaderSpotter.InvaderSpotterClient = None) -> dict:
+    """Gets the states of the invaders of all the cities of a dict from invader-spotter.art.
+
+    Args:
+        cityDict (dict): Dict of invaders by city.
+        client (invaderSpotter.InvaderSpotterClient, optional): Client of the site. Defaults to a new client
+            caching the pages in invaderSpotter.DEFAULT_CACHE_PATH.
+
+    Returns:
+        dict: Dict of invader states by name.
+    """
+    with invaderSpotter.openClient(client) as client:
+        return client.getStateInfos(list(cityDict.keys()))
+
+
+def findStatusFromNews(newsLine: str, cue: str) -> list:
+    """Finds the invaders cited in the sentences of a news line containing a cue.
+    Names and cues are found whatever the punctuation around them, e.g. "PA_12," or "(PA_12)".
 
+    Args:
+        newsLine (str): Line of the news page.
+        cue (str): Word of the news, e.g. "Destruction".
 
-def findStatusFromNews(newsLine: str, cue: str):
+    Returns:
+        list: Names of the invaders.
+    """
     invadersList = []
-    pattern = r'^[A-Za-z]{1,4}_\d{1,4}$'
-    newsLineSplitted = newsLine.split('.')
-    for split in newsLineSplitted:
-        if cue in split.split(' '):
-            for word in split.split(' '):
-                match = re.match(pattern, word)
-                if match is not None:
-                    invadersList.append(match.string)
+    for split in newsLine.split('.'):
+        if cue in NEWS_WORD_PATTERN.findall(split):
+            invadersList.extend(NEWS_INVADER_PATTERN.findall(split))
     return invadersList
 
 
-def getInvaderSpotterNews(month: int, year: int):
-    newsDict = {
-        'Destruction': [],
-        'Réactivation': [],
-        'Dégradation': [],
-        'Restauration': [],
-        'statut': [],
-    }
-    url = "https://www.invader-spotter.art/news.php"
+def parseInvaderSpotterNews(html: str) -> dict:
+    """Parses the invaders cited in the news page, for every month of the page.
+
+    Args:
+        html (str): News page.
+
+    Returns:
+        dict: Dict of news dicts (invaders by news cue) by month (YYYYMM).
+    """
+    monthsDict = {}
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    for element in soup.find_all("div", id=re.compile(r'^mois\d{6}$')):
+        newsDict = monthsDict.setdefault(element["id"][len("mois"):], {cue: [] for cue in NEWS_CUES})
+        for newsLine in element.contents:
+            if newsLine != '\n':
+                newsLine = newsLine.text
+                for cue in newsDict.keys():
+                    statusList = findStatusFromNews(newsLine, cue)
+                    for invader in statusList:
+                        newsDict[cue].append(invader)
+    return monthsDict
+
+
+def getStateDictFromNews(newsDict: dict) -> tuple:
+    """Converts a news dict into the new states of the invaders it cites.
+
+    Args:
+        newsDict (dict): Dict of invaders by news cue.
+
+    Returns:
+        tuple: Dict of invader states by name, and list of invaders whose new state is unknown.
+    """
     stateDict = {}
-    r = requests.get(
-        url="https://www.invader-spotter.art/news.php"
-    )
-    soup = BeautifulSoup(r.text, "html.parser")
-    if len(str(month)) < 2:
-        month = '0' + str(month)
-    else:
-        month = str(month)
-    dateStr = "mois" + str(year) + month
-    elements = soup.find_all("div", {"id": dateStr})
-    if elements != []:
-        for element in elements:
-            for newsLine in element.contents:
-                if newsLine != '\n':
-                    newsLine = newsLine.text
-                    for cue in newsDict.keys():
-                        statusList = findStatusFromNews(newsLine, cue)
-                        for invader in statusList:
-                            newsDict[cue].append(invader)
+    unresolvedList = [invader for cue in NEWS_UNRESOLVED_CUES for invader in newsDict.get(cue, [])]
+    for cue, state in NEWS_STATE_DICT.items():
+        for invader in newsDict.get(cue, []):
+            if invader in stateDict and stateDict[invader] != state:
+                unresolvedList.append(invader)
+            stateDict[invader] = state
+    for invader in unresolvedList:
+        stateDict.pop(invader, None)
+    return stateDict, unresolvedList
+
+
+def getInvaderSpotterNews(month: int, year: int, client: invaderSpotter.InvaderSpotterClient = None) -> dict:
+    """Gets the new states of the invaders cited in the news of a month.
+
+    Args:
+        month (int): Month of the news.
+        year (int): Year of the news.
+        client (invaderSpotter.InvaderSpotterClient, optional): Client of the site. Defaults to a new client
+            caching the pages in invaderSpotter.DEFAULT_CACHE_PATH.
+
+    Returns:
+        dict: Dict of invader states by name.
+    """
+    with invaderSpotter.openClient(client) as client:
+        monthsDict = parseInvaderSpotterNews(client.fetchNewsPage())
+    newsDict = monthsDict.get(f"{year}{int(month):02d}", {})
+    stateDict, _ = getStateDictFromNews(newsDict)
     return stateDict
 
 
@@ -299,20 +323,12 @@ def updateInvadersDictFromStateDict(invadersDict: dict, stateDict: dict, showFla
 
 
 def getInvaderStateFromColor(hexColor):
-    if hexColor in COLOR_DICT.values():
-        key_list = list(COLOR_DICT.keys())
-        val_list = list(COLOR_DICT.values())
-        position = val_list.index(hexColor)
-        state = key_list[position]
-        if state in COLOR_REPLACEMENT_DICT.keys():
-            state = COLOR_REPLACEMENT_DICT[state]
-    else:
-        state = COLOR_DICT["OK"]
-    return state
+    """Returns the state of a waypoint color from the precomputed reverse of COLOR_DICT, unknown colors being OK."""
+    if isinstance(hexColor, str):
+        hexColor = hexColor.lower()
+    return STATE_FROM_COLOR.get(hexColor, "OK")
 
 def getWaypointFormat(gpxPath):
-    infosDict = {}
-    gpx_file = open(gpxPath, 'r')
-    gpx = gpxpy.parse(gpx_file)
+    gpx = gpxLib.openGpx(gpxPath)
     waypoint = gpx.waypoints[0]
     return waypoint.extensions
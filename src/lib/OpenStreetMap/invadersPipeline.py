@@ -0,0 +1,179 @@
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import src.lib.OpenStreetMap.gpx as gpxLib
+import src.lib.OpenStreetMap.gpxCache as gpxCache
+import src.lib.OpenStreetMap.invaderSpotter as invaderSpotter
+import src.lib.OpenStreetMap.routePlanner as routePlanner
+import src.lib.OpenStreetMap.stateSync as stateSync
+from src.lib.OpenStreetMap.invadersTable import InvadersTable
+from src.lib.OpenStreetMap.responseCache import DEFAULT_TTL
+
+
+ALL_CITIES = "all"
+PIPELINE_STAGES = ["parse", "fetch", "update", "map"]
+
+
+class PipelineTimings:
+    """Thread safe record of the time spent by each stage of the pipeline, per city."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []
+        self.start = time.perf_counter()
+
+    def add(self, stage: str, city: str, start: float, end: float) -> None:
+        """Records a task of a stage.
+
+        Args:
+            stage (str): Name of the stage.
+            city (str): City prefix, None for tasks of all the cities.
+            start (float): Start time of the task (perf_counter, in s).
+            end (float): End time of the task (perf_counter, in s).
+        """
+        with self._lock:
+            self.records.append((stage, city, start - self.start, end - self.start))
+
+    def getReport(self) -> str:
+        """Formats the time each stage was active, with its first start and last end, then the time spent per city."""
+        lines = [f"{'stage':10s} {'active':>8s} {'from':>8s} {'to':>8s}"]
+        for stage in PIPELINE_STAGES:
+            intervals = sorted((start, end) for recordStage, _, start, end in self.records if recordStage == stage)
+            if not intervals:
+                continue
+            # Length of the union of the tasks, concurrent tasks being counted once
+            active, lastEnd = 0.0, intervals[0][0]
+            for start, end in intervals:
+                active += max(end - max(start, lastEnd), 0)
+                lastEnd = max(lastEnd, end)
+            lines.append(f"{stage:10s} {active:7.2f}s {intervals[0][0]:7.2f}s {max(end for _, end in intervals):7.2f}s")
+        cities = sorted({record[1] for record in self.records if record[1] is not None})
+        cityStages = [stage for stage in PIPELINE_STAGES if any(record[0] == stage and record[1] is not None for record in self.records)]
+        if cities:
+            lines.append(f"{'city':10s}" + "".join(f" {stage:>8s}" for stage in cityStages))
+        for city in cities:
+            durations = {stage: 0.0 for stage in cityStages}
+            for stage, recordCity, start, end in self.records:
+                if recordCity == city:
+                    durations[stage] += end - start
+            lines.append(f"{city:10s}" + "".join(f" {durations[stage]:7.2f}s" for stage in cityStages))
+        lines.append(f"{'total':10s} {max((record[3] for record in self.records), default=0):7.2f}s")
+        return "\n".join(lines)
+
+
+def _fetchStates(cities: list, snapshotPath: Path, client: invaderSpotter.InvaderSpotterClient,
+                 statesQueue: queue.Queue, timings: PipelineTimings) -> None:
+    """Fetch stage, producing (city, stateDict) items as soon as each city is fetched, then a None sentinel."""
+    try:
+        if snapshotPath is not None:
+            start = time.perf_counter()
+            stateDict = stateSync.syncInvaderStates(cities, snapshotPath, client=client)
+            timings.add("fetch", None, start, time.perf_counter())
+            cityStateDicts = {city: {} for city in cities}
+            for name, state in stateDict.items():
+                cityStateDicts.setdefault(stateSync.getInvaderCity(name), {})[name] = state
+            for city in cities:
+                statesQueue.put((city, cityStateDicts[city]))
+        else:
+            start = time.perf_counter()
+            for city, cityStateDict in client.iterStateInfos(cities):
+                end = time.perf_counter()
+                # Cities are fetched concurrently, each is charged from the start of the stage
+                timings.add("fetch", city, start, end)
+                statesQueue.put((city, cityStateDict))
+    finally:
+        statesQueue.put(None)
+
+
+def runInvadersMapPipeline(gpxPath: Path, cities: list, snapshotPath: Path = None, showFlashed: bool = False,
+                           client: invaderSpotter.InvaderSpotterClient = None, mapMode: str = gpxLib.MAP_MODES.GEOJSON,
+                           outputPath: Path = "waypoints_map.html", openBrowser: bool = True,
+                           routePath: Path = None, cachePath: Path = invaderSpotter.DEFAULT_CACHE_PATH,
+                           ttl: float = DEFAULT_TTL, offline: bool = False) -> tuple:
+    """Builds the map of the invaders of several cities with their states from invader-spotter.art.
+
+    Stages overlap: the gpx is parsed while the states of the requested cities are fetched, and each city is
+    updated, its waypoints prepared and its route planned, as soon as its states arrive, while the other cities are still fetched.
+    The map of all the cities is built last.
+
+    Args:
+        gpxPath (Path): Path of the invaders gpx.
+        cities (list): City prefixes, or ["all"] for all the cities of the gpx.
+        snapshotPath (Path, optional): Path of the states snapshot, refreshed from news when given. Defaults to None.
+        showFlashed (bool, optional): If True, flashed invaders keep their color. Defaults to False.
+        client (invaderSpotter.InvaderSpotterClient, optional): Client of the site. Defaults to a new client
+            caching the pages in cachePath.
+        mapMode (str, optional): One of gpxLib.MAP_MODES. Defaults to gpxLib.MAP_MODES.GEOJSON.
+        outputPath (Path, optional): Path of the saved map. Defaults to "waypoints_map.html".
+        openBrowser (bool, optional): Opens the saved map in the browser. Defaults to True.
+        routePath (Path, optional): Path of the gpx of the routes through the invaders left to flash,
+            one route per city, planned when given. Defaults to None.
+        cachePath (Path, optional): Folder of the pages cache of the default client, None for no cache.
+            Defaults to invaderSpotter.DEFAULT_CACHE_PATH.
+        ttl (float, optional): Time during which cached pages are used without request (in s). Defaults to 1 day.
+        offline (bool, optional): If True, the default client only uses cached pages. Defaults to False.
+
+    Returns:
+        tuple: Updated table of the invaders of the cities, and the timings of the pipeline.
+    """
+    if client is None:
+        with invaderSpotter.createCachedClient(cachePath, ttl=ttl, offline=offline) as client:
+            return runInvadersMapPipeline(
+                gpxPath, cities, snapshotPath=snapshotPath, showFlashed=showFlashed, client=client, mapMode=mapMode,
+                outputPath=outputPath, openBrowser=openBrowser, routePath=routePath,
+                )
+    timings = PipelineTimings()
+    statesQueue = queue.Queue()
+
+    def parse():
+        start = time.perf_counter()
+        table = gpxCache.loadInvadersTable(gpxPath)
+        timings.add("parse", None, start, time.perf_counter())
+        return table
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        tableFuture = executor.submit(parse)
+        allCities = [city.upper() for city in cities if city.lower() != ALL_CITIES]
+        if len(allCities) < len(cities):
+            # All the cities are only known once the gpx is parsed
+            allCities = tableFuture.result().getCityNames()
+        fetchFuture = executor.submit(_fetchStates, allCities, snapshotPath, client, statesQueue, timings)
+
+        cityTables = {}
+        cityRecords = {}
+        routes = {}
+        while (item := statesQueue.get()) is not None:
+            city, cityStateDict = item
+            table = tableFuture.result()
+            start = time.perf_counter()
+            cityTable = table.selectCity(city).updateFromStateDict(stateDict=cityStateDict, showFlashed=showFlashed)
+            cityTables[city] = cityTable
+            cityRecords[city] = cityTable.toRecords()
+            if routePath is not None:
+                routes[city] = routePlanner.getRouteRows(cityTable)
+            timings.add("update", city, start, time.perf_counter())
+            logging.info(f"{city}: {len(cityTable)} invaders updated")
+        fetchFuture.result()
+
+    start = time.perf_counter()
+    table = InvadersTable.concatenate([cityTables[city] for city in allCities if city in cityTables])
+    records = [record for city in allCities for record in cityRecords.get(city, [])]
+    gpxLib.visualizeGpx(records, mode=mapMode, outputPath=outputPath, openBrowser=openBrowser)
+    if routePath is not None:
+        routeGpx = None
+        for city in allCities:
+            if city not in routes:
+                continue
+            cityRouteGpx = routePlanner.createRouteGpx(cityTables[city], routes[city], name=f'Space Invaders route {city}')
+            if routeGpx is None:
+                routeGpx = cityRouteGpx
+            else:
+                routeGpx.waypoints.extend(cityRouteGpx.waypoints)
+                routeGpx.routes.extend(cityRouteGpx.routes)
+        if routeGpx is not None:
+            gpxLib.saveGpx(routeGpx, routePath)
+    timings.add("map", None, start, time.perf_counter())
+    return table, timings
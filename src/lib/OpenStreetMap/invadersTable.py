@@ -0,0 +1,464 @@
+import re
+import json
+import numpy as np
+import gpxpy
+import gpxpy.gpx
+import gpxpy.gpxfield
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Iterable
+import src.lib.OpenStreetMap.gpx as gpxLib
+import src.lib.OpenStreetMap.invadersEditor as invadersEditor
+
+
+OSMAND_NAMESPACE = "https://osmand.net"
+INVADER_NAME_PATTERN = re.compile(r'^([A-Za-z]{1,4})_(\d{1,4})$')
+STATES = list(invadersEditor.COLOR_DICT.keys())
+
+
+def _getStateCode(hexColor: str) -> int:
+    """Returns the state code of a waypoint color, unknown colors being OK."""
+    state = invadersEditor.getInvaderStateFromColor(hexColor)
+    return STATES.index(state) if state in STATES else STATES.index("OK")
+
+
+def _getTextColumn(values: list) -> np.ndarray:
+    """Returns a column of optional texts as a NumPy string array, missing texts being empty."""
+    return np.array([value or "" for value in values], dtype=str)
+
+
+class _Categories:
+    """Interned values of a categorical column, coded by their insertion order."""
+
+    def __init__(self, values: list = None):
+        self.values = []
+        self.codes = {}
+        for value in values or []:
+            self.getCode(value)
+
+    def getCode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def encode(self, values: Iterable) -> np.ndarray:
+        return np.fromiter((self.getCode(value) for value in values), dtype=np.int16)
+
+
+class InvadersTable:
+    """Columnar table of invaders.
+
+    Each invader is a row of NumPy columns: interned city codes, integer numbers, coordinates and
+    categorical color, state, icon, background and hidden codes. The other gpx fields of the waypoints
+    (elevation, time, description and type) are kept too, so that tables round-trip through gpx files.
+    Rows are found from their name in O(1), and colors or states of many rows are updated at once.
+    """
+
+    def __init__(self, cities: list = None, cityCodes=(), numbers=(), numberWidths=(), latitudes=(), longitudes=(),
+                 colors: list = None, colorCodes=(), stateCodes=(), icons: list = None, iconCodes=(),
+                 backgrounds: list = None, backgroundCodes=(), hidden: list = None, hiddenCodes=(),
+                 elevations=None, times=None, descriptions=None, types: list = None, typeCodes=None):
+        self.cities = _Categories(cities)
+        self.colors = _Categories(colors)
+        self.icons = _Categories(icons)
+        self.backgrounds = _Categories(backgrounds)
+        self.hidden = _Categories(hidden)
+        self.types = _Categories(types)
+        self.cityCodes = np.asarray(cityCodes, dtype=np.int16)
+        self.numbers = np.asarray(numbers, dtype=np.int32)
+        self.numberWidths = np.asarray(numberWidths, dtype=np.int8)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.colorCodes = np.asarray(colorCodes, dtype=np.int16)
+        self.stateCodes = np.asarray(stateCodes, dtype=np.int16)
+        self.iconCodes = np.asarray(iconCodes, dtype=np.int16)
+        self.backgroundCodes = np.asarray(backgroundCodes, dtype=np.int16)
+        self.hiddenCodes = np.asarray(hiddenCodes, dtype=np.int16)
+        # Tables built without the extra gpx fields get missing ones
+        nRows = len(self.numbers)
+        self.elevations = np.asarray(elevations if elevations is not None else np.full(nRows, np.nan), dtype=np.float64)
+        self.times = np.asarray(times if times is not None else np.full(nRows, ""), dtype=str)
+        self.descriptions = np.asarray(descriptions if descriptions is not None else np.full(nRows, ""), dtype=str)
+        if typeCodes is None:
+            typeCodes = np.full(nRows, self.types.getCode(None))
+        self.typeCodes = np.asarray(typeCodes, dtype=np.int16)
+        self._buildRowIndex()
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def _buildRowIndex(self) -> None:
+        self._rowIndex = {
+            (self.cities.values[cityCode], int(number)): row
+            for row, (cityCode, number) in enumerate(zip(self.cityCodes.tolist(), self.numbers.tolist()))
+        }
+
+    @classmethod
+    def fromRecords(cls, records: Iterable[gpxLib.WaypointRecord]) -> "InvadersTable":
+        """Builds a table from waypoint records, waypoints not named as invaders (CITY_number) are skipped.
+
+        Args:
+            records (Iterable[gpxLib.WaypointRecord]): Waypoint records, as yielded by gpxLib.iterGpxWaypoints.
+
+        Returns:
+            InvadersTable: Table of invaders.
+        """
+        table = cls()
+        columns = {key: [] for key in [
+            "city", "number", "width", "latitude", "longitude", "color", "icon", "background", "hidden",
+            "elevation", "time", "description", "type",
+            ]}
+        for record in records:
+            cityName, number = invadersEditor.findCityNameAndNumber(record)
+            if cityName is None or (cityName, int(number)) in table._rowIndex:
+                continue
+            table._rowIndex[(cityName, int(number))] = len(columns["number"])
+            columns["city"].append(cityName)
+            columns["number"].append(int(number))
+            columns["width"].append(len(number))
+            columns["latitude"].append(record.latitude)
+            columns["longitude"].append(record.longitude)
+            columns["color"].append(record.color)
+            columns["icon"].append(record.icon)
+            columns["background"].append(record.background)
+            columns["hidden"].append(record.hidden)
+            columns["elevation"].append(record.elevation if record.elevation is not None else np.nan)
+            columns["time"].append(record.time)
+            columns["description"].append(record.description)
+            columns["type"].append(record.type)
+        table.cityCodes = table.cities.encode(columns["city"])
+        table.numbers = np.array(columns["number"], dtype=np.int32)
+        table.numberWidths = np.array(columns["width"], dtype=np.int8)
+        table.latitudes = np.array(columns["latitude"], dtype=np.float64)
+        table.longitudes = np.array(columns["longitude"], dtype=np.float64)
+        table.colorCodes = table.colors.encode(columns["color"])
+        colorStateCodes = np.array([_getStateCode(color) for color in table.colors.values], dtype=np.int16)
+        table.stateCodes = colorStateCodes[table.colorCodes]
+        table.iconCodes = table.icons.encode(columns["icon"])
+        table.backgroundCodes = table.backgrounds.encode(columns["background"])
+        table.hiddenCodes = table.hidden.encode(columns["hidden"])
+        table.elevations = np.array(columns["elevation"], dtype=np.float64)
+        table.times = _getTextColumn(columns["time"])
+        table.descriptions = _getTextColumn(columns["description"])
+        table.typeCodes = table.types.encode(columns["type"])
+        return table
+
+    @classmethod
+    def fromGpx(cls, gpxPath: Path, cityFilter: str = None) -> "InvadersTable":
+        """Builds a table from a gpx file, streamed without building gpxpy objects.
+
+        Args:
+            gpxPath (Path): Path of the gpx file.
+            cityFilter (str, optional): Name of the city. Defaults to None.
+
+        Returns:
+            InvadersTable: Table of invaders.
+        """
+        return cls.fromRecords(gpxLib.iterGpxWaypoints(gpxPath, cityFilter=cityFilter))
+
+    @classmethod
+    def fromInvadersDict(cls, invadersDict: dict) -> "InvadersTable":
+        """Builds a table from a dict of invaders by city, as returned by invadersEditor.getGpxInvaders.
+
+        Args:
+            invadersDict (dict): Dict of gpxpy waypoints by number by city.
+
+        Returns:
+            InvadersTable: Table of invaders.
+        """
+        records = []
+        for city in invadersDict.keys():
+            for waypoint in invadersDict[city].values():
+                properties = {gpxLib.getXmlLocalName(extension.tag): extension.text for extension in waypoint.extensions}
+                records.append(gpxLib.WaypointRecord(
+                    name=waypoint.name,
+                    latitude=waypoint.latitude,
+                    longitude=waypoint.longitude,
+                    icon=properties.get(gpxLib.WAYPOINT_PROPERTIES.ICON),
+                    color=properties.get(gpxLib.WAYPOINT_PROPERTIES.COLOR),
+                    background=properties.get(gpxLib.WAYPOINT_PROPERTIES.BACKGROUND),
+                    hidden=properties.get(gpxLib.WAYPOINT_PROPERTIES.HIDDEN),
+                    elevation=waypoint.elevation,
+                    time=gpxpy.gpxfield.format_time(waypoint.time) if waypoint.time is not None else None,
+                    description=waypoint.description,
+                    type=waypoint.type,
+                    ))
+        return cls.fromRecords(records)
+
+    @classmethod
+    def fromArrays(cls, arrays: dict) -> "InvadersTable":
+        """Builds a table from the arrays returned by toArrays.
+
+        Args:
+            arrays (dict): Dict of columns and json encoded categories.
+
+        Returns:
+            InvadersTable: Table of invaders.
+        """
+        categories = json.loads(str(arrays["categories"]))
+        return cls(
+            cities=categories["cities"], cityCodes=arrays["cityCodes"], numbers=arrays["numbers"],
+            numberWidths=arrays["numberWidths"], latitudes=arrays["latitudes"], longitudes=arrays["longitudes"],
+            colors=categories["colors"], colorCodes=arrays["colorCodes"], stateCodes=arrays["stateCodes"],
+            icons=categories["icons"], iconCodes=arrays["iconCodes"],
+            backgrounds=categories["backgrounds"], backgroundCodes=arrays["backgroundCodes"],
+            hidden=categories["hidden"], hiddenCodes=arrays["hiddenCodes"],
+            elevations=arrays["elevations"], times=arrays["times"], descriptions=arrays["descriptions"],
+            types=categories["types"], typeCodes=arrays["typeCodes"],
+            )
+
+    @classmethod
+    def concatenate(cls, tables: list) -> "InvadersTable":
+        """Stacks the rows of several tables, duplicates included, re-encoding their categories.
+
+        Args:
+            tables (list): Tables to stack.
+
+        Returns:
+            InvadersTable: Table of all the rows, in table order.
+        """
+        table = cls()
+        columns = {key: [] for key in ["cityCodes", "colorCodes", "iconCodes", "backgroundCodes", "hiddenCodes", "typeCodes"]}
+        for other in tables:
+            for column, categories, otherCategories in [
+                ("cityCodes", table.cities, other.cities),
+                ("colorCodes", table.colors, other.colors),
+                ("iconCodes", table.icons, other.icons),
+                ("backgroundCodes", table.backgrounds, other.backgrounds),
+                ("hiddenCodes", table.hidden, other.hidden),
+                ("typeCodes", table.types, other.types),
+            ]:
+                codeMap = np.array([categories.getCode(value) for value in otherCategories.values] or [0], dtype=np.int16)
+                columns[column].append(codeMap[getattr(other, column)])
+        for column, codes in columns.items():
+            setattr(table, column, np.concatenate(codes).astype(np.int16) if codes else np.empty(0, dtype=np.int16))
+        for column in ["numbers", "numberWidths", "latitudes", "longitudes", "stateCodes", "elevations", "times", "descriptions"]:
+            setattr(table, column, np.concatenate([getattr(other, column) for other in tables] or [getattr(table, column)]))
+        table._buildRowIndex()
+        return table
+
+    def toArrays(self) -> dict:
+        """Returns the columns of the table and its json encoded categories, as NumPy arrays to be saved with numpy.savez."""
+        categories = {
+            "cities": self.cities.values,
+            "colors": self.colors.values,
+            "icons": self.icons.values,
+            "backgrounds": self.backgrounds.values,
+            "hidden": self.hidden.values,
+            "types": self.types.values,
+        }
+        return {
+            "categories": np.array(json.dumps(categories)),
+            "cityCodes": self.cityCodes,
+            "numbers": self.numbers,
+            "numberWidths": self.numberWidths,
+            "latitudes": self.latitudes,
+            "longitudes": self.longitudes,
+            "colorCodes": self.colorCodes,
+            "stateCodes": self.stateCodes,
+            "iconCodes": self.iconCodes,
+            "backgroundCodes": self.backgroundCodes,
+            "hiddenCodes": self.hiddenCodes,
+            "elevations": self.elevations,
+            "times": self.times,
+            "descriptions": self.descriptions,
+            "typeCodes": self.typeCodes,
+        }
+
+    def getRow(self, name: str) -> int:
+        """Gets the row of an invader from its name (CITY_number), whatever its zero padding.
+
+        Args:
+            name (str): Name of the invader.
+
+        Returns:
+            int: Row of the invader, None if it is not in the table.
+        """
+        match = INVADER_NAME_PATTERN.match(name)
+        if match is None:
+            return None
+        return self._rowIndex.get((match.group(1).upper(), int(match.group(2))))
+
+    def getRows(self, names: Iterable[str]) -> np.ndarray:
+        """Gets the rows of the invaders of a list of names, names not in the table are skipped.
+
+        Args:
+            names (Iterable[str]): Names of the invaders.
+
+        Returns:
+            np.ndarray: Rows of the invaders.
+        """
+        rows = (self.getRow(name) for name in names)
+        return np.fromiter((row for row in rows if row is not None), dtype=np.int64)
+
+    def getName(self, row: int) -> str:
+        """Returns the name (CITY_number) of the invader of a row."""
+        number = int(self.numbers[row])
+        return f"{self.cities.values[self.cityCodes[row]]}_{number:0{int(self.numberWidths[row])}d}"
+
+    @property
+    def names(self) -> list:
+        """Names of all the invaders."""
+        return [self.getName(row) for row in range(len(self))]
+
+    def getColumn(self, column: str) -> list:
+        """Decodes a categorical column (city, color, state, icon, background, hidden or type) into its values."""
+        if column == "state":
+            return [STATES[code] for code in self.stateCodes.tolist()]
+        categories = {
+            "city": (self.cities, self.cityCodes),
+            "color": (self.colors, self.colorCodes),
+            "icon": (self.icons, self.iconCodes),
+            "background": (self.backgrounds, self.backgroundCodes),
+            "hidden": (self.hidden, self.hiddenCodes),
+            "type": (self.types, self.typeCodes),
+        }[column]
+        return [categories[0].values[code] for code in categories[1].tolist()]
+
+    def setColors(self, rows: np.ndarray, colors) -> None:
+        """Sets the color of rows, states are left unchanged.
+
+        Args:
+            rows (np.ndarray): Rows (indexes or boolean mask) to update.
+            colors (str, list): Hex color of all the rows, or one hex color per row.
+        """
+        if isinstance(colors, str):
+            self.colorCodes[rows] = self.colors.getCode(colors)
+        else:
+            self.colorCodes[rows] = self.colors.encode(colors)
+
+    def setStates(self, rows: np.ndarray, states) -> None:
+        """Sets the state of rows and their colors from COLOR_DICT.
+
+        Args:
+            rows (np.ndarray): Rows (indexes or boolean mask) to update.
+            states (str, list): State of all the rows, or one state per row (keys of COLOR_DICT).
+        """
+        stateToColorCode = np.array([self.colors.getCode(invadersEditor.COLOR_DICT[state]) for state in STATES], dtype=np.int16)
+        if isinstance(states, str):
+            stateCodes = STATES.index(states)
+        else:
+            stateCodes = np.array([STATES.index(state) for state in states], dtype=np.int16)
+        self.stateCodes[rows] = stateCodes
+        self.colorCodes[rows] = stateToColorCode[stateCodes]
+
+    def updateFromStateDict(self, stateDict: dict, showFlashed: bool = True) -> "InvadersTable":
+        """Vectorized equivalent of invadersEditor.updateInvadersDictFromStateDict.
+        Invaders missing from the state dict are set OK.
+
+        Args:
+            stateDict (dict): Dict of invader states by name.
+            showFlashed (bool, optional): If True, flashed invaders keep their color. Defaults to True.
+
+        Returns:
+            InvadersTable: The updated table.
+        """
+        updated = np.ones(len(self), dtype=bool)
+        if showFlashed is True:
+            updated = self.stateCodes != STATES.index("flashed")
+        newStates = np.full(len(self), STATES.index("OK"), dtype=np.int16)
+        for name, state in stateDict.items():
+            row = self.getRow(name)
+            if row is not None:
+                newStates[row] = STATES.index(state)
+        self.setStates(updated, [STATES[code] for code in newStates[updated].tolist()])
+        return self
+
+    def select(self, rows: np.ndarray) -> "InvadersTable":
+        """Returns a new table with only some rows.
+
+        Args:
+            rows (np.ndarray): Rows (indexes or boolean mask) to keep.
+
+        Returns:
+            InvadersTable: Table of the selected rows.
+        """
+        return InvadersTable(
+            cities=self.cities.values, cityCodes=self.cityCodes[rows], numbers=self.numbers[rows],
+            numberWidths=self.numberWidths[rows], latitudes=self.latitudes[rows], longitudes=self.longitudes[rows],
+            colors=self.colors.values, colorCodes=self.colorCodes[rows], stateCodes=self.stateCodes[rows],
+            icons=self.icons.values, iconCodes=self.iconCodes[rows],
+            backgrounds=self.backgrounds.values, backgroundCodes=self.backgroundCodes[rows],
+            hidden=self.hidden.values, hiddenCodes=self.hiddenCodes[rows],
+            elevations=self.elevations[rows], times=self.times[rows], descriptions=self.descriptions[rows],
+            types=self.types.values, typeCodes=self.typeCodes[rows],
+            )
+
+    def getCityNames(self) -> list:
+        """Returns the names of the cities having invaders in the table."""
+        return [self.cities.values[code] for code in np.unique(self.cityCodes).tolist()]
+
+    def selectCity(self, city: str) -> "InvadersTable":
+        """Returns a new table with only the invaders of a city."""
+        code = self.cities.codes.get(city.upper(), -1)
+        return self.select(self.cityCodes == code)
+
+    def getWaypoint(self, row: int) -> gpxpy.gpx.GPXWaypoint:
+        """Builds the gpxpy waypoint of a row, with its gpx fields and osmand extensions."""
+        elevation = float(self.elevations[row])
+        time = str(self.times[row])
+        waypoint = gpxpy.gpx.GPXWaypoint(
+            latitude=float(self.latitudes[row]), longitude=float(self.longitudes[row]),
+            elevation=None if np.isnan(elevation) else elevation,
+            time=gpxpy.gpxfield.parse_time(time) if time else None,
+            name=self.getName(row),
+            description=str(self.descriptions[row]) or None,
+            type=self.types.values[self.typeCodes[row]],
+            )
+        for property, categories, codes in [
+            (gpxLib.WAYPOINT_PROPERTIES.ICON, self.icons, self.iconCodes),
+            (gpxLib.WAYPOINT_PROPERTIES.BACKGROUND, self.backgrounds, self.backgroundCodes),
+            (gpxLib.WAYPOINT_PROPERTIES.COLOR, self.colors, self.colorCodes),
+            (gpxLib.WAYPOINT_PROPERTIES.HIDDEN, self.hidden, self.hiddenCodes),
+        ]:
+            value = categories.values[codes[row]]
+            if value is not None:
+                extension = ET.Element(f"{{{OSMAND_NAMESPACE}}}{property}")
+                extension.text = value
+                waypoint.extensions.append(extension)
+        return waypoint
+
+    def toRecords(self) -> list:
+        """Builds the waypoint records of the table, in row order, e.g. to be drawn with gpxLib.visualizeGpx."""
+        columns = [
+            self.latitudes.tolist(), self.longitudes.tolist(),
+            [self.icons.values[code] for code in self.iconCodes.tolist()],
+            [self.colors.values[code] for code in self.colorCodes.tolist()],
+            [self.backgrounds.values[code] for code in self.backgroundCodes.tolist()],
+            [self.hidden.values[code] for code in self.hiddenCodes.tolist()],
+            [None if np.isnan(elevation) else elevation for elevation in self.elevations.tolist()],
+            [time or None for time in self.times.tolist()],
+            [description or None for description in self.descriptions.tolist()],
+            [self.types.values[code] for code in self.typeCodes.tolist()],
+        ]
+        return [gpxLib.WaypointRecord(name, *values) for name, *values in zip(self.names, *columns)]
+
+    def toInvadersDict(self) -> dict:
+        """Builds the dict of gpxpy waypoints by number by city used by invadersEditor."""
+        invadersDict = {}
+        for row in range(len(self)):
+            city = self.cities.values[self.cityCodes[row]]
+            number = f"{int(self.numbers[row]):0{int(self.numberWidths[row])}d}"
+            invadersDict.setdefault(city, {})[number] = self.getWaypoint(row)
+        return invadersDict
+
+    def toGpx(self, name: str) -> gpxpy.gpx.GPX:
+        """Builds the gpx of the table, to be saved with gpxLib.saveGpx.
+        Waypoints keep their type, those without one are typed with the name of the gpx.
+
+        Args:
+            name (str): Name of the gpx.
+
+        Returns:
+            gpxpy.gpx.GPX: Gpx of the invaders.
+        """
+        gpx = invadersEditor.createInvaderGpx(name)
+        for cityInvaders in self.toInvadersDict().values():
+            for waypoint in cityInvaders.values():
+                if waypoint.type is None:
+                    waypoint.type = name
+                gpx.waypoints.append(waypoint)
+        return gpx
@@ -0,0 +1,231 @@
+import re
+import json
+import numpy as np
+from pathlib import Path
+from typing import Iterable
+from src.lib.OpenStreetMap.invadersTable import InvadersTable, STATES
+
+
+INVADER_KEY_PATTERN = re.compile(r'(?<![A-Za-z])([A-Za-z]{1,4})_(\d{1,4})(?!\d)')
+FLASHED_STATES = {"flashed"}
+DESTROYED_STATES = {"Détruit", "destroyed"}
+REPORT_SECTIONS = {
+    "newlyFlashed": "Newly flashed",
+    "newlyDestroyed": "Newly destroyed",
+    "reactivated": "Reactivated",
+    "changed": "State changed",
+    "added": "New invaders",
+    "removed": "Removed invaders",
+    "flashedDestroyed": "Flashed but destroyed",
+    "flashedNotInGpx": "Flashed but not marked in gpx",
+}
+
+
+def getInvaderKey(name: str, defaultCity: str = None) -> tuple:
+    """Normalizes an invader name into its canonical key, whatever its case, zero padding or surrounding text.
+    Names without a city prefix, such as bare numbers, take the default city.
+
+    Args:
+        name (str): Name of the invader, e.g. "PA_0012", "pa_12" or "Space Invader PA_12, Paris".
+        defaultCity (str, optional): City prefix of names without one. Defaults to None.
+
+    Returns:
+        tuple: (CITY, number) key, None if the name is not an invader.
+    """
+    if name is None:
+        return None
+    match = INVADER_KEY_PATTERN.search(name)
+    if match is not None:
+        return match.group(1).upper(), int(match.group(2))
+    number = name.strip().rsplit('_', 1)[-1]
+    if defaultCity is not None and number.isdigit() and int(number) > 0:
+        return defaultCity.upper(), int(number)
+    return None
+
+
+def formatInvaderKey(key: tuple) -> str:
+    """Returns the name (CITY_number) of a canonical key, numbers being padded to 2 digits as on invader-spotter.art."""
+    return f"{key[0]}_{key[1]:02d}"
+
+
+def getStatesFromStateDict(stateDict: dict) -> dict:
+    """Normalizes a dict of invader states by name, as scraped by invaderSpotter.
+
+    Args:
+        stateDict (dict): Dict of invader states by name.
+
+    Returns:
+        dict: Dict of invader states by canonical key.
+    """
+    states = {}
+    for name, state in stateDict.items():
+        key = getInvaderKey(name)
+        if key is not None:
+            states[key] = state
+    return states
+
+
+def getStatesFromTable(table: InvadersTable) -> dict:
+    """Gets the states of the invaders of a table, as given by their gpx colors.
+
+    Args:
+        table (InvadersTable): Table of the invaders.
+
+    Returns:
+        dict: Dict of invader states by canonical key.
+    """
+    cityNames = np.array(table.cities.values or [""], dtype=object)[table.cityCodes]
+    states = np.array(STATES, dtype=object)[table.stateCodes]
+    return dict(zip(zip(cityNames.tolist(), table.numbers.tolist()), states.tolist()))
+
+
+def getNamesFromTable(table: InvadersTable) -> dict:
+    """Returns the gpx names (CITY_number, with their zero padding) of the invaders of a table by canonical key."""
+    cityNames = np.array(table.cities.values or [""], dtype=object)[table.cityCodes]
+    return dict(zip(zip(cityNames.tolist(), table.numbers.tolist()), table.names))
+
+
+def getFlashedFromCSV(csvDict: dict) -> set:
+    """Gets the flashed invaders of a csv, as opened by invadersEditor.openInvaderCSV.
+
+    Args:
+        csvDict (dict): Dict of flashed invader numbers by city.
+
+    Returns:
+        set: Canonical keys of the flashed invaders.
+    """
+    return {
+        key for city, numbers in csvDict.items() for number in numbers
+        if (key := getInvaderKey(number, defaultCity=city)) is not None
+    }
+
+
+def _getKeysInStates(states: dict, stateSet: set) -> set:
+    return {key for key, state in states.items() if state in stateSet}
+
+
+def selectCities(states: dict, cities: Iterable[str]) -> dict:
+    """Returns the states of the invaders of some cities.
+
+    Args:
+        states (dict): Dict of states by canonical key.
+        cities (Iterable[str]): City prefixes.
+
+    Returns:
+        dict: Dict of states by canonical key, for the invaders of the cities.
+    """
+    cities = {city.upper() for city in cities}
+    return {key: state for key, state in states.items() if key[0] in cities}
+
+
+def reconcileInvaderStates(scrapedStates: dict, gpxStates: dict = None, flashedKeys: Iterable[tuple] = (),
+                           previousStates: dict = None, cities: Iterable[str] = None) -> dict:
+    """Joins the sources of invader states on their canonical keys and diffs them with the previous run.
+
+    Invaders flashed in the gpx or in the flash lists are flashed, the other ones take their scraped state,
+    or their gpx state if they were not scraped. With cities, the previous run is only compared on the
+    invaders of these cities, so that runs on other cities are not reported as removed invaders.
+
+    Args:
+        scrapedStates (dict): Dict of scraped states by canonical key.
+        gpxStates (dict, optional): Dict of gpx color states by canonical key. Defaults to None.
+        flashedKeys (Iterable[tuple], optional): Canonical keys of invaders known to be flashed, e.g. from a csv.
+            Defaults to ().
+        previousStates (dict, optional): Dict of reconciled states by canonical key of the previous run. Defaults to None.
+        cities (Iterable[str], optional): City prefixes reconciled in this run. Defaults to None, all the cities.
+
+    Returns:
+        dict: Reconciled states by canonical key under "states", and a sorted list of canonical keys
+            for each REPORT_SECTIONS entry.
+    """
+    gpxStates = gpxStates or {}
+    previousStates = previousStates or {}
+    if cities is not None:
+        previousStates = selectCities(previousStates, cities)
+    flashedKeys = set(flashedKeys)
+    gpxFlashed = _getKeysInStates(gpxStates, FLASHED_STATES)
+    flashed = flashedKeys | gpxFlashed
+    states = dict(gpxStates)
+    states.update(scrapedStates)
+    states.update(dict.fromkeys(flashed, "flashed"))
+
+    destroyed = _getKeysInStates(scrapedStates, DESTROYED_STATES)
+    previousFlashed = _getKeysInStates(previousStates, FLASHED_STATES)
+    previousDestroyed = _getKeysInStates(previousStates, DESTROYED_STATES)
+    common = states.keys() & previousStates.keys()
+    report = {
+        "states": states,
+        "newlyFlashed": flashed - previousFlashed,
+        "newlyDestroyed": _getKeysInStates(states, DESTROYED_STATES) - previousDestroyed,
+        "reactivated": (previousDestroyed & scrapedStates.keys()) - destroyed,
+        "changed": {key for key, _ in set(states.items()) - set(previousStates.items()) if key in common},
+        "added": states.keys() - previousStates.keys() if previousStates else set(),
+        "removed": previousStates.keys() - states.keys(),
+        "flashedDestroyed": flashed & destroyed,
+        "flashedNotInGpx": (flashedKeys - gpxFlashed) & gpxStates.keys(),
+    }
+    for section in REPORT_SECTIONS:
+        report[section] = sorted(report[section])
+    return report
+
+
+def formatReconciliationReport(report: dict, maxNames: int = 20, names: dict = None) -> str:
+    """Formats a reconciliation report, one line per non empty section.
+
+    Args:
+        report (dict): Report returned by reconcileInvaderStates.
+        maxNames (int, optional): Maximum number of names listed per section. Defaults to 20.
+        names (dict, optional): Names by canonical key, e.g. from getNamesFromTable. Defaults to formatInvaderKey.
+
+    Returns:
+        str: Report.
+    """
+    lines = [f"{len(report['states'])} invaders reconciled"]
+    for section, title in REPORT_SECTIONS.items():
+        keys = report[section]
+        if keys:
+            listed = ", ".join((names or {}).get(key) or formatInvaderKey(key) for key in keys[:maxNames])
+            lines.append(f"{title} ({len(keys)}): {listed}{', ...' if len(keys) > maxNames else ''}")
+    return "\n".join(lines)
+
+
+def loadReconciledStates(path: Path) -> dict:
+    """Loads the reconciled states saved by the previous run, empty if there is none.
+
+    Args:
+        path (Path): Path of the json states.
+
+    Returns:
+        dict: Dict of states by canonical key.
+    """
+    path = Path(path)
+    if not path.exists():
+        return {}
+    states = {}
+    for name, state in json.loads(path.read_text(encoding="utf-8")).items():
+        key = getInvaderKey(name)
+        if key is not None:
+            states[key] = state
+    return states
+
+
+def saveReconciledStates(states: dict, path: Path, cities: Iterable[str] = None) -> None:
+    """Saves reconciled states for the next run. With cities, the saved states of the other cities are kept.
+
+    Args:
+        states (dict): Dict of states by canonical key.
+        path (Path): Path of the json states.
+        cities (Iterable[str], optional): City prefixes reconciled in this run, whose saved states are replaced.
+            Defaults to None, all the saved states being replaced.
+    """
+    path = Path(path)
+    if cities is not None:
+        cities = {city.upper() for city in cities}
+        savedStates = loadReconciledStates(path)
+        states = {**{key: state for key, state in savedStates.items() if key[0] not in cities}, **states}
+    temporaryPath = path.with_name(path.name + ".tmp")
+    temporaryPath.write_text(
+        json.dumps({formatInvaderKey(key): states[key] for key in sorted(states)}, ensure_ascii=False, indent=1),
+        encoding="utf-8",
+        )
+    temporaryPath.replace(path)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlencode
+
+
+INDEX_FILE_NAME = "index.json"
+DEFAULT_TTL = 24*3600
+DEFAULT_MAX_BYTES = 50*1024*1024
+
+
+class CacheMissError(LookupError):
+    """Raised in offline mode when a response is not cached."""
+
+
+class ResponseCache:
+    """Persistent cache of http responses, keyed by method, url and form data.
+
+    Bodies are stored one file per response next to a json index holding their validators
+    (ETag, Last-Modified), storage and access times. Least recently used responses are evicted
+    once the bodies exceed maxBytes. Access times of cache hits are only kept in memory until the
+    next store or flush, use the cache as a context manager or call flush once done.
+    """
+
+    def __init__(self, folderPath: Path, ttl: float = DEFAULT_TTL, maxBytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        """
+        Args:
+            folderPath (Path): Folder of the cache.
+            ttl (float, optional): Time during which a response is served without request (in s). Defaults to 1 day.
+            maxBytes (int, optional): Maximum size of the cached bodies (in bytes). Defaults to 50 MB.
+            offline (bool, optional): If True, responses are only served from cache. Defaults to False.
+        """
+        self.folderPath = Path(folderPath)
+        self.folderPath.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._dirty = False
+        indexPath = self.folderPath/INDEX_FILE_NAME
+        self._index = json.loads(indexPath.read_text(encoding="utf-8")) if indexPath.exists() else {}
+
+    @staticmethod
+    def getKey(method: str, url: str, data: dict = None) -> str:
+        """Returns the cache key of a request.
+
+        Args:
+            method (str): GET or POST.
+            url (str): Url of the request.
+            data (dict, optional): Form data. Defaults to None.
+
+        Returns:
+            str: Key of the request.
+        """
+        form = urlencode(sorted((data or {}).items()))
+        return hashlib.sha256(f"{method.upper()} {url}\n{form}".encode("utf-8")).hexdigest()
+
+    def _getBodyPath(self, key: str) -> Path:
+        return self.folderPath/(key + ".html")
+
+    def _saveIndex(self) -> None:
+        indexPath = self.folderPath/INDEX_FILE_NAME
+        temporaryPath = indexPath.with_name(INDEX_FILE_NAME + ".tmp")
+        temporaryPath.write_text(json.dumps(self._index), encoding="utf-8")
+        os.replace(temporaryPath, indexPath)
+        self._dirty = False
+
+    def flush(self) -> None:
+        """Saves the index if access times changed since it was last saved."""
+        with self._lock:
+            if self._dirty:
+                self._saveIndex()
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.flush()
+
+    def get(self, key: str) -> dict:
+        """Gets a cached response.
+
+        Args:
+            key (str): Key of the request.
+
+        Returns:
+            dict: Body, etag, lastModified and fresh status of the response, None if not cached.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            # Read under the lock, so that a concurrent eviction cannot remove the body half way
+            try:
+                body = self._getBodyPath(key).read_text(encoding="utf-8")
+            except FileNotFoundError:
+                del self._index[key]
+                self._dirty = True
+                return None
+            # Persisted with the next store or flush, so that eviction stays least recently used across runs
+            entry["accessedAt"] = time.time()
+            self._dirty = True
+        return {
+            "body": body,
+            "etag": entry.get("etag"),
+            "lastModified": entry.get("lastModified"),
+            "fresh": time.time() - entry["storedAt"] < self.ttl,
+        }
+
+    def put(self, key: str, body: str, etag: str = None, lastModified: str = None) -> None:
+        """Stores a response, then evicts least recently used responses if the cache is too large.
+        Bodies larger than the whole cache are not stored, and the previous response of the key is removed.
+
+        Args:
+            key (str): Key of the request.
+            body (str): Body of the response.
+            etag (str, optional): ETag header of the response. Defaults to None.
+            lastModified (str, optional): Last-Modified header of the response. Defaults to None.
+        """
+        data = body.encode("utf-8")
+        with self._lock:
+            if len(data) > self.maxBytes:
+                if self._index.pop(key, None) is not None:
+                    self._getBodyPath(key).unlink(missing_ok=True)
+                    self._saveIndex()
+                return
+            self._getBodyPath(key).write_bytes(data)
+            now = time.time()
+            self._index[key] = {
+                "size": len(data), "storedAt": now, "accessedAt": now, "etag": etag, "lastModified": lastModified
+            }
+            self._evict()
+            self._saveIndex()
+
+    def refresh(self, key: str) -> None:
+        """Marks a cached response as fresh again, after the server answered it was not modified.
+
+        Args:
+            key (str): Key of the request.
+        """
+        with self._lock:
+            if key in self._index:
+                self._index[key]["storedAt"] = time.time()
+                self._saveIndex()
+
+    def _evict(self) -> None:
+        totalSize = sum(entry["size"] for entry in self._index.values())
+        for key in sorted(self._index.keys(), key=lambda key: self._index[key]["accessedAt"]):
+            if totalSize <= self.maxBytes:
+                break
+            totalSize -= self._index.pop(key)["size"]
+            self._getBodyPath(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """Removes all the cached responses."""
+        with self._lock:
+            for key in list(self._index.keys()):
+                self._getBodyPath(key).unlink(missing_ok=True)
+            self._index = {}
+            self._saveIndex()
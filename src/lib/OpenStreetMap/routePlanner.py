@@ -0,0 +1,315 @@
+import numpy as np
+import gpxpy
+import gpxpy.gpx
+from typing import Iterable
+import src.lib.OpenStreetMap.invadersEditor as invadersEditor
+from src.lib.OpenStreetMap.invadersTable import InvadersTable, STATES
+from src.lib.OpenStreetMap.spatialIndex import computeHaversineDistances
+
+
+UNREACHABLE_STATES = ("flashed", "Détruit", "destroyed", "Non visible")
+DEFAULT_NEIGHBORS = 10
+MAX_SEGMENT_LENGTH = 3
+
+
+def computeDistanceMatrix(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Computes the (points, points) haversine distance matrix of points in a single broadcast pass.
+
+    Args:
+        latitudes (np.ndarray): Latitudes of the points (in degrees).
+        longitudes (np.ndarray): Longitudes of the points (in degrees).
+
+    Returns:
+        np.ndarray: Distances (in m).
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    return computeHaversineDistances(latitudes[:, np.newaxis], longitudes[:, np.newaxis], latitudes, longitudes)
+
+
+def getNeighborLists(distances: np.ndarray, nNeighbors: int = DEFAULT_NEIGHBORS) -> list:
+    """Returns the nNeighbors nearest other points of each point, nearest first."""
+    nPoints = len(distances)
+    nNeighbors = min(nNeighbors, nPoints - 1)
+    if nNeighbors <= 0:
+        return [[] for _ in range(nPoints)]
+    masked = distances + np.diag(np.full(nPoints, np.inf))
+    neighbors = np.argpartition(masked, nNeighbors - 1, axis=1)[:, :nNeighbors]
+    order = np.argsort(np.take_along_axis(masked, neighbors, axis=1), axis=1)
+    return np.take_along_axis(neighbors, order, axis=1).tolist()
+
+
+def planNearestNeighborTour(distances: np.ndarray, start: int = 0) -> list:
+    """Builds a tour by always walking to the nearest unvisited point.
+
+    Args:
+        distances (np.ndarray): (points, points) distance matrix.
+        start (int, optional): First point. Defaults to 0.
+
+    Returns:
+        list: Points in visiting order.
+    """
+    nPoints = len(distances)
+    visited = np.zeros(nPoints, dtype=bool)
+    tour = [start]
+    visited[start] = True
+    current = start
+    for _ in range(nPoints - 1):
+        current = int(np.argmin(np.where(visited, np.inf, distances[current])))
+        visited[current] = True
+        tour.append(current)
+    return tour
+
+
+def improveTour2Opt(tour: list, distanceRows: list, neighbors: list) -> list:
+    """Improves a closed tour with 2-opt moves restricted to neighbor lists, with don't look bits.
+    For each point, only the edges towards its nearest neighbors shorter than its current edges are tried.
+
+    Args:
+        tour (list): Points in visiting order.
+        distanceRows (list): Distance matrix as nested lists.
+        neighbors (list): Neighbor lists, as returned by getNeighborLists.
+
+    Returns:
+        list: Improved tour.
+    """
+    tour = list(tour)
+    nPoints = len(tour)
+    if nPoints < 4:
+        return tour
+    positions = [0]*nPoints
+    for position, point in enumerate(tour):
+        positions[point] = position
+    active = list(tour)
+    isActive = [True]*nPoints
+    while active:
+        a = active.pop()
+        isActive[a] = False
+        improved = False
+        for direction in (1, -1):
+            i = positions[a]
+            b = tour[(i + direction) % nPoints]
+            dAB = distanceRows[a][b]
+            for c in neighbors[a]:
+                dAC = distanceRows[a][c]
+                if dAC >= dAB:
+                    break
+                j = positions[c]
+                d = tour[(j + direction) % nPoints]
+                if c == b or d == a:
+                    continue
+                delta = dAC + distanceRows[b][d] - dAB - distanceRows[c][d]
+                if delta < -1e-9:
+                    # Replacing a-b and c-d by a-c and b-d reverses the path from b to c, or its complement
+                    if direction == 1:
+                        start, end = i + 1, j
+                    else:
+                        start, end = j, i - 1
+                    if start > end:
+                        start, end = end + 1, start - 1
+                    tour[start:end + 1] = tour[start:end + 1][::-1]
+                    for position in range(start, end + 1):
+                        positions[tour[position]] = position
+                    for point in (a, b, c, d):
+                        if not isActive[point]:
+                            isActive[point] = True
+                            active.append(point)
+                    improved = True
+                    break
+            if improved:
+                break
+    return tour
+
+
+def improveTourOrOpt(tour: list, distanceRows: list, neighbors: list, maxSegmentLength: int = MAX_SEGMENT_LENGTH) -> list:
+    """Improves a closed tour by moving segments of 1 to maxSegmentLength points next to a neighbor of their ends,
+    in either orientation, until no move shortens the tour.
+
+    Args:
+        tour (list): Points in visiting order.
+        distanceRows (list): Distance matrix as nested lists.
+        neighbors (list): Neighbor lists, as returned by getNeighborLists.
+        maxSegmentLength (int, optional): Longest moved segment. Defaults to MAX_SEGMENT_LENGTH.
+
+    Returns:
+        list: Improved tour.
+    """
+    tour = list(tour)
+    nPoints = len(tour)
+    if nPoints < maxSegmentLength + 3:
+        return tour
+    positions = [0]*nPoints
+    for position, point in enumerate(tour):
+        positions[point] = position
+    improved = True
+    while improved:
+        improved = False
+        for segmentLength in range(1, maxSegmentLength + 1):
+            for i in range(nPoints):
+                # Segment starting at position i, between p and n
+                segment = [tour[(i + k) % nPoints] for k in range(segmentLength)]
+                first, last = segment[0], segment[-1]
+                p = tour[(i - 1) % nPoints]
+                n = tour[(i + segmentLength) % nPoints]
+                removeGain = distanceRows[p][first] + distanceRows[last][n] - distanceRows[p][n]
+                bestDelta, bestMove = -1e-9, None
+                for end, other in ((first, last), (last, first)):
+                    for c in neighbors[end]:
+                        dEndC = distanceRows[end][c]
+                        if dEndC >= removeGain:
+                            break
+                        if c in segment:
+                            continue
+                        # Between c and its successor or its predecessor e, end being next to c
+                        for after in (True, False):
+                            e = tour[(positions[c] + (1 if after else -1)) % nPoints]
+                            if e in segment:
+                                continue
+                            delta = dEndC + distanceRows[other][e] - distanceRows[c][e] - removeGain
+                            if delta < bestDelta:
+                                bestDelta, bestMove = delta, (c, end, after)
+                if bestMove is None:
+                    continue
+                c, end, after = bestMove
+                rest = [tour[(i + segmentLength + k) % nPoints] for k in range(nPoints - segmentLength)]
+                position = rest.index(c)
+                if after:
+                    ordered = segment if end == first else segment[::-1]
+                    tour = rest[:position + 1] + ordered + rest[position + 1:]
+                else:
+                    ordered = segment[::-1] if end == first else segment
+                    tour = rest[:position] + ordered + rest[position:]
+                for position, point in enumerate(tour):
+                    positions[point] = position
+                improved = True
+    return tour
+
+
+def getRouteLength(route: list, distances: np.ndarray) -> float:
+    """Returns the length of an open route (in m)."""
+    route = np.asarray(route, dtype=np.int64)
+    return float(np.sum(distances[route[:-1], route[1:]]))
+
+
+def planRoute(latitudes: np.ndarray, longitudes: np.ndarray, start: int = None,
+              nNeighbors: int = DEFAULT_NEIGHBORS) -> list:
+    """Plans a short walking route through points, with nearest neighbour construction then
+    2-opt and Or-opt improvements restricted to neighbor lists.
+
+    The open route is solved as a closed tour through an extra point, at the same distance of every point,
+    or next to the start point only when one is given.
+
+    Args:
+        latitudes (np.ndarray): Latitudes of the points (in degrees).
+        longitudes (np.ndarray): Longitudes of the points (in degrees).
+        start (int, optional): First point of the route. Defaults to None, any point.
+        nNeighbors (int, optional): Number of neighbors tried for each point. Defaults to DEFAULT_NEIGHBORS.
+
+    Returns:
+        list: Points in walking order.
+    """
+    nPoints = len(latitudes)
+    if nPoints < 3:
+        return list(range(nPoints)) if start in (None, 0) else [start, 1 - start]
+    distances = computeDistanceMatrix(latitudes, longitudes)
+    extended = np.zeros((nPoints + 1, nPoints + 1))
+    extended[:nPoints, :nPoints] = distances
+    if start is not None:
+        # Any route costs this once, leaving the start point costs it twice
+        extended[nPoints, :nPoints] = extended[:nPoints, nPoints] = np.max(distances)*nPoints + 1
+        extended[nPoints, start] = extended[start, nPoints] = 0
+    distanceRows = extended.tolist()
+    neighbors = getNeighborLists(extended, nNeighbors)
+    tour = planNearestNeighborTour(extended, start=nPoints)
+    tour = improveTour2Opt(tour, distanceRows, neighbors)
+    tour = improveTourOrOpt(tour, distanceRows, neighbors)
+    tour = improveTour2Opt(tour, distanceRows, neighbors)
+    position = tour.index(nPoints)
+    route = tour[position + 1:] + tour[:position]
+    if start is not None and route[0] != start:
+        route.reverse()
+    return route
+
+
+def getRouteRows(table: InvadersTable, excludedStates: Iterable[str] = UNREACHABLE_STATES,
+                 startLatitude: float = None, startLongitude: float = None) -> np.ndarray:
+    """Plans the walking order of the invaders of a table left to flash.
+
+    Args:
+        table (InvadersTable): Table of the invaders, with updated states.
+        excludedStates (Iterable[str], optional): States of the invaders left out. Defaults to UNREACHABLE_STATES.
+        startLatitude (float, optional): Latitude of the start position (in degrees). Defaults to None.
+        startLongitude (float, optional): Longitude of the start position (in degrees). Defaults to None.
+
+    Returns:
+        np.ndarray: Rows of the invaders in walking order, starting at the nearest one of the start position if any.
+    """
+    rows = np.flatnonzero(~np.isin(table.stateCodes, [STATES.index(state) for state in excludedStates]))
+    if len(rows) == 0:
+        return rows
+    latitudes, longitudes = table.latitudes[rows], table.longitudes[rows]
+    start = None
+    if startLatitude is not None and startLongitude is not None:
+        start = int(np.argmin(computeHaversineDistances(startLatitude, startLongitude, latitudes, longitudes)))
+    return rows[planRoute(latitudes, longitudes, start=start)]
+
+
+def createRouteGpx(table: InvadersTable, rows: np.ndarray, name: str) -> gpxpy.gpx.GPX:
+    """Builds the gpx of a route through invaders, their waypoints in walking order and the route itself.
+
+    Args:
+        table (InvadersTable): Table of the invaders.
+        rows (np.ndarray): Rows of the invaders in walking order.
+        name (str): Name of the gpx and of its route.
+
+    Returns:
+        gpxpy.gpx.GPX: Gpx of the route, to be saved with gpxLib.saveGpx.
+    """
+    gpx = invadersEditor.createInvaderGpx(name)
+    route = gpxpy.gpx.GPXRoute(name=name)
+    for row in rows:
+        waypoint = table.getWaypoint(row)
+        waypoint.type = name
+        gpx.waypoints.append(waypoint)
+        route.points.append(gpxpy.gpx.GPXRoutePoint(
+            latitude=waypoint.latitude, longitude=waypoint.longitude, name=waypoint.name
+            ))
+    gpx.routes.append(route)
+    return gpx
+
+
+def planInvadersRoute(invadersDict: dict, name: str, excludedStates: Iterable[str] = UNREACHABLE_STATES,
+                      startLatitude: float = None, startLongitude: float = None) -> gpxpy.gpx.GPX:
+    """Plans the route through the invaders left to flash of a dict of invaders by city,
+    as updated by invadersEditor.updateInvadersDictFromStateDict.
+
+    Args:
+        invadersDict (dict): Dict of gpxpy waypoints by number by city.
+        name (str): Name of the gpx and of its route.
+        excludedStates (Iterable[str], optional): States of the invaders left out. Defaults to UNREACHABLE_STATES.
+        startLatitude (float, optional): Latitude of the start position (in degrees). Defaults to None.
+        startLongitude (float, optional): Longitude of the start position (in degrees). Defaults to None.
+
+    Returns:
+        gpxpy.gpx.GPX: Gpx of the route, to be saved with gpxLib.saveGpx.
+    """
+    table = InvadersTable.fromInvadersDict(invadersDict)
+    rows = getRouteRows(table, excludedStates, startLatitude, startLongitude)
+    return createRouteGpx(table, rows, name)
+
+
+if __name__ == "__main__":
+    import time
+    # Planning time and route length against the nearest neighbour route, on random points over a city
+    rng = np.random.default_rng(0)
+    for nPoints in [100, 1000]:
+        latitudes = 48.85 + rng.uniform(-0.05, 0.05, nPoints)
+        longitudes = 2.35 + rng.uniform(-0.08, 0.08, nPoints)
+        start = time.perf_counter()
+        route = planRoute(latitudes, longitudes, start=0)
+        elapsed = time.perf_counter() - start
+        distances = computeDistanceMatrix(latitudes, longitudes)
+        assert sorted(route) == list(range(nPoints)) and route[0] == 0
+        nearestLength = getRouteLength(planNearestNeighborTour(distances, start=0), distances)
+        print(f"{nPoints} points in {elapsed:.3f} s: {getRouteLength(route, distances)/1e3:.1f} km "
+              f"(nearest neighbour {nearestLength/1e3:.1f} km)")
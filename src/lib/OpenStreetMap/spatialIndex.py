@@ -0,0 +1,290 @@
+import numpy as np
+from typing import Iterable
+import src.lib.OpenStreetMap.gpx as gpxLib
+import src.lib.OpenStreetMap.invadersEditor as invadersEditor
+from src.lib.OpenStreetMap.invadersTable import InvadersTable, STATES
+from src.lib.lazyImport import lazyImport
+
+scipy = lazyImport("scipy")
+
+
+EARTH_RADIUS = 6371008.8
+BRUTE_FORCE_RATIO = 1/16
+
+
+def computeHaversineDistances(latitudes1, longitudes1, latitudes2, longitudes2) -> np.ndarray:
+    """Computes great circle distances between points, broadcast against each other.
+
+    Args:
+        latitudes1 (np.ndarray): Latitudes of the first points (in degrees).
+        longitudes1 (np.ndarray): Longitudes of the first points (in degrees).
+        latitudes2 (np.ndarray): Latitudes of the second points (in degrees).
+        longitudes2 (np.ndarray): Longitudes of the second points (in degrees).
+
+    Returns:
+        np.ndarray: Distances (in m).
+    """
+    latitudes1, longitudes1 = np.radians(latitudes1), np.radians(longitudes1)
+    latitudes2, longitudes2 = np.radians(latitudes2), np.radians(longitudes2)
+    a = (np.sin((latitudes2 - latitudes1)/2)**2
+         + np.cos(latitudes1)*np.cos(latitudes2)*np.sin((longitudes2 - longitudes1)/2)**2)
+    return 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def convertToUnitVectors(latitudes, longitudes) -> np.ndarray:
+    """Converts coordinates (in degrees) into (points, 3) cartesian vectors on the unit sphere."""
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    cosLatitudes = np.cos(latitudes)
+    return np.stack([cosLatitudes*np.cos(longitudes), cosLatitudes*np.sin(longitudes), np.sin(latitudes)], axis=-1)
+
+
+def convertToChordLength(distance: float) -> float:
+    """Converts a great circle distance (in m) into the chord length between its ends on the unit sphere."""
+    return 2*np.sin(min(distance/EARTH_RADIUS, np.pi)/2)
+
+
+class InvadersSpatialIndex:
+    """Spatial index of the invaders of a table, for nearest, radius and bounding box queries filtered by state.
+
+    Coordinates are indexed as unit sphere vectors in a KD-tree, so that chord distances order points as
+    great circle distances do, whatever their latitude. States are read from the table at query time:
+    state updates only touch the table, the tree being rebuilt only when coordinates change.
+    """
+
+    def __init__(self, table: InvadersTable):
+        """
+        Args:
+            table (InvadersTable): Table of the invaders, shared with the index.
+        """
+        self.table = table
+        self._buildTree()
+
+    def _buildTree(self) -> None:
+        self._tree = scipy.spatial.cKDTree(convertToUnitVectors(self.table.latitudes, self.table.longitudes))
+
+    @classmethod
+    def fromInvadersDict(cls, invadersDict: dict) -> "InvadersSpatialIndex":
+        """Builds the index of a dict of invaders by city, as returned by invadersEditor.getGpxInvaders.
+
+        Args:
+            invadersDict (dict): Dict of gpxpy waypoints by number by city.
+
+        Returns:
+            InvadersSpatialIndex: Index of the invaders.
+        """
+        return cls(InvadersTable.fromInvadersDict(invadersDict))
+
+    def updateStates(self, stateDict: dict, showFlashed: bool = True) -> "InvadersSpatialIndex":
+        """Updates the states of the indexed invaders, as invadersEditor.updateInvadersDictFromStateDict does.
+
+        Args:
+            stateDict (dict): Dict of invader states by name.
+            showFlashed (bool, optional): If True, flashed invaders keep their color. Defaults to True.
+
+        Returns:
+            InvadersSpatialIndex: The updated index.
+        """
+        self.table.updateFromStateDict(stateDict, showFlashed=showFlashed)
+        return self
+
+    def updateFromInvadersDict(self, invadersDict: dict) -> "InvadersSpatialIndex":
+        """Reads back the colors and coordinates of a dict of invaders by city, once updated by
+        invadersEditor.updateInvadersDictFromStateDict. Only changed rows are updated, and the tree is rebuilt
+        only if invaders were added or moved.
+
+        Args:
+            invadersDict (dict): Dict of gpxpy waypoints by number by city.
+
+        Returns:
+            InvadersSpatialIndex: The updated index.
+        """
+        rows, colors = [], []
+        moved = False
+        for city in invadersDict.keys():
+            for number, waypoint in invadersDict[city].items():
+                row = self.table.getRow(f"{city}_{number}")
+                if row is None:
+                    # Added invaders renumber the rows, the table is rebuilt from the dict
+                    self.table = InvadersTable.fromInvadersDict(invadersDict)
+                    self._buildTree()
+                    return self
+                if (self.table.latitudes[row] != waypoint.latitude) or (self.table.longitudes[row] != waypoint.longitude):
+                    self.table.latitudes[row] = waypoint.latitude
+                    self.table.longitudes[row] = waypoint.longitude
+                    moved = True
+                color = gpxLib.getWaypointProperty(waypoint=waypoint, property=gpxLib.WAYPOINT_PROPERTIES.COLOR)
+                if color != self.table.colors.values[self.table.colorCodes[row]]:
+                    rows.append(row)
+                    colors.append(color)
+        if rows:
+            rows = np.array(rows, dtype=np.int64)
+            self.table.setColors(rows, colors)
+            states = [invadersEditor.getInvaderStateFromColor(color) for color in colors]
+            self.table.stateCodes[rows] = [STATES.index(state) if state in STATES else STATES.index("OK") for state in states]
+        if moved:
+            self._buildTree()
+        return self
+
+    def _getMask(self, states: Iterable[str] = None, excludedStates: Iterable[str] = None,
+                 colors: Iterable[str] = None) -> np.ndarray:
+        """Returns the boolean mask of the rows passing the filters, None if there is no filter."""
+        mask = None
+        if states is not None:
+            mask = np.isin(self.table.stateCodes, [STATES.index(state) for state in states])
+        if excludedStates is not None:
+            excluded = np.isin(self.table.stateCodes, [STATES.index(state) for state in excludedStates])
+            mask = ~excluded if mask is None else mask & ~excluded
+        if colors is not None:
+            colorCodes = [self.table.colors.codes[color] for color in colors if color in self.table.colors.codes]
+            matching = np.isin(self.table.colorCodes, colorCodes)
+            mask = matching if mask is None else mask & matching
+        return mask
+
+    def _sortByDistance(self, latitude: float, longitude: float, rows: np.ndarray) -> tuple:
+        distances = computeHaversineDistances(latitude, longitude, self.table.latitudes[rows], self.table.longitudes[rows])
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+    def queryNearest(self, latitude: float, longitude: float, k: int = 1, states: Iterable[str] = None,
+                     excludedStates: Iterable[str] = None, colors: Iterable[str] = None) -> tuple:
+        """Finds the k nearest invaders of a position, among the ones passing the filters.
+
+        Args:
+            latitude (float): Latitude of the position (in degrees).
+            longitude (float): Longitude of the position (in degrees).
+            k (int, optional): Number of invaders. Defaults to 1.
+            states (Iterable[str], optional): Only keeps invaders in these states. Defaults to None.
+            excludedStates (Iterable[str], optional): Skips invaders in these states, e.g. ["flashed"]. Defaults to None.
+            colors (Iterable[str], optional): Only keeps invaders of these hex colors. Defaults to None.
+
+        Returns:
+            tuple: Rows of the invaders in the table and their distances (in m), nearest first.
+        """
+        nRows = len(self.table)
+        mask = self._getMask(states, excludedStates, colors)
+        candidates = nRows if mask is None else int(np.count_nonzero(mask))
+        k = min(k, candidates)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if mask is not None and candidates < BRUTE_FORCE_RATIO*nRows:
+            # Few candidates, they are all measured
+            rows, distances = self._sortByDistance(latitude, longitude, np.flatnonzero(mask))
+            return rows[:k], distances[:k]
+        # Nearest points of the whole tree are requested until enough of them pass the filters
+        point = convertToUnitVectors(latitude, longitude)
+        kQuery = k
+        while True:
+            _, rows = self._tree.query(point, k=min(kQuery, nRows))
+            rows = np.atleast_1d(rows)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= k or kQuery >= nRows:
+                break
+            kQuery *= 4
+        rows, distances = self._sortByDistance(latitude, longitude, rows)
+        return rows[:k], distances[:k]
+
+    def queryRadius(self, latitude: float, longitude: float, radius: float, states: Iterable[str] = None,
+                    excludedStates: Iterable[str] = None, colors: Iterable[str] = None) -> tuple:
+        """Finds the invaders within a distance of a position, among the ones passing the filters.
+
+        Args:
+            latitude (float): Latitude of the position (in degrees).
+            longitude (float): Longitude of the position (in degrees).
+            radius (float): Maximum distance (in m).
+            states (Iterable[str], optional): Only keeps invaders in these states. Defaults to None.
+            excludedStates (Iterable[str], optional): Skips invaders in these states, e.g. ["flashed"]. Defaults to None.
+            colors (Iterable[str], optional): Only keeps invaders of these hex colors. Defaults to None.
+
+        Returns:
+            tuple: Rows of the invaders in the table and their distances (in m), nearest first.
+        """
+        point = convertToUnitVectors(latitude, longitude)
+        rows = np.array(self._tree.query_ball_point(point, convertToChordLength(radius)), dtype=np.int64)
+        mask = self._getMask(states, excludedStates, colors)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        rows, distances = self._sortByDistance(latitude, longitude, rows)
+        inside = distances <= radius
+        return rows[inside], distances[inside]
+
+    def queryBoundingBox(self, south: float, west: float, north: float, east: float, states: Iterable[str] = None,
+                         excludedStates: Iterable[str] = None, colors: Iterable[str] = None) -> np.ndarray:
+        """Finds the invaders inside a latitude/longitude box, such as a map viewport, among the ones passing the filters.
+        Boxes crossing the antimeridian have a west bound greater than their east bound.
+
+        Args:
+            south (float): Minimum latitude (in degrees).
+            west (float): Minimum longitude (in degrees).
+            north (float): Maximum latitude (in degrees).
+            east (float): Maximum longitude (in degrees).
+            states (Iterable[str], optional): Only keeps invaders in these states. Defaults to None.
+            excludedStates (Iterable[str], optional): Skips invaders in these states, e.g. ["flashed"]. Defaults to None.
+            colors (Iterable[str], optional): Only keeps invaders of these hex colors. Defaults to None.
+
+        Returns:
+            np.ndarray: Rows of the invaders in the table.
+        """
+        width = (east - west) % 360
+        centerLatitude = (south + north)/2
+        centerLongitude = west + width/2
+        # The ball around the box center reaching its farthest corner holds the whole box
+        radius = np.max(computeHaversineDistances(
+            centerLatitude, centerLongitude, np.array([south, south, north, north]), np.array([west, east, west, east])
+            ))
+        if radius < np.pi*EARTH_RADIUS/2 and width <= 180:
+            point = convertToUnitVectors(centerLatitude, centerLongitude)
+            rows = np.array(self._tree.query_ball_point(point, convertToChordLength(radius)), dtype=np.int64)
+        else:
+            rows = np.arange(len(self.table))
+        latitudes = self.table.latitudes[rows]
+        inside = (latitudes >= south) & (latitudes <= north) & ((self.table.longitudes[rows] - west) % 360 <= width)
+        rows = rows[inside]
+        mask = self._getMask(states, excludedStates, colors)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return np.sort(rows)
+
+    def getNames(self, rows: np.ndarray) -> list:
+        """Returns the names (CITY_number) of the invaders of rows."""
+        return [self.table.getName(row) for row in rows]
+
+
+if __name__ == "__main__":
+    import time
+    # Brute force check and timing of the queries, on random invaders around Paris
+    rng = np.random.default_rng(0)
+    nInvaders = 20000
+    table = InvadersTable(
+        cities=["PA", "VRS", "MARS", "LY"], cityCodes=np.arange(nInvaders) % 4, numbers=np.arange(nInvaders)//4 + 1,
+        numberWidths=np.full(nInvaders, 4), latitudes=48.85 + rng.normal(0, 0.05, nInvaders),
+        longitudes=2.35 + rng.normal(0, 0.08, nInvaders), colors=[invadersEditor.COLOR_DICT[state] for state in STATES],
+        colorCodes=np.zeros(nInvaders), stateCodes=rng.integers(0, len(STATES), nInvaders),
+        icons=[None], iconCodes=np.zeros(nInvaders), backgrounds=[None], backgroundCodes=np.zeros(nInvaders),
+        hidden=[None], hiddenCodes=np.zeros(nInvaders),
+        )
+    start = time.perf_counter()
+    index = InvadersSpatialIndex(table)
+    print(f"index of {nInvaders} invaders built in {(time.perf_counter() - start)*1e3:.1f} ms")
+    latitude, longitude = 48.8566, 2.3522
+    allDistances = computeHaversineDistances(latitude, longitude, table.latitudes, table.longitudes)
+    unflashed = table.stateCodes != STATES.index("flashed")
+
+    start = time.perf_counter()
+    rows, distances = index.queryNearest(latitude, longitude, k=10, excludedStates=["flashed"])
+    print(f"10 nearest unflashed in {(time.perf_counter() - start)*1e3:.2f} ms")
+    assert np.allclose(distances, np.sort(allDistances[unflashed])[:10])
+
+    start = time.perf_counter()
+    rows, distances = index.queryRadius(latitude, longitude, 500, excludedStates=["flashed"])
+    print(f"{len(rows)} unflashed within 500 m in {(time.perf_counter() - start)*1e3:.2f} ms")
+    assert set(rows.tolist()) == set(np.flatnonzero(unflashed & (allDistances <= 500)).tolist())
+
+    start = time.perf_counter()
+    rows = index.queryBoundingBox(48.85, 2.33, 48.87, 2.37, states=["OK"])
+    print(f"{len(rows)} OK in viewport in {(time.perf_counter() - start)*1e3:.2f} ms")
+    inBox = (table.latitudes >= 48.85) & (table.latitudes <= 48.87) & (table.longitudes >= 2.33) & (table.longitudes <= 2.37)
+    assert np.array_equal(rows, np.flatnonzero(inBox & (table.stateCodes == STATES.index("OK"))))
+
+    index.updateStates({table.getName(row): "Détruit" for row in rows})
+    assert np.array_equal(rows, index.queryBoundingBox(48.85, 2.33, 48.87, 2.37, states=["Détruit"]))
@@ -0,0 +1,94 @@
+import json
+import logging
+import datetime
+from pathlib import Path
+import src.lib.OpenStreetMap.invaderSpotter as invaderSpotter
+import src.lib.OpenStreetMap.invadersEditor as invadersEditor
+
+
+def loadStateSnapshot(snapshotPath: Path) -> dict:
+    """Loads the persisted invader states.
+
+    Args:
+        snapshotPath (Path): Path of the json snapshot.
+
+    Returns:
+        dict: Snapshot with the last synced month (YYYYMM) by city and the invader states by name.
+    """
+    snapshotPath = Path(snapshotPath)
+    if not snapshotPath.exists():
+        return {"lastSynced": {}, "states": {}}
+    return json.loads(snapshotPath.read_text(encoding="utf-8"))
+
+
+def saveStateSnapshot(snapshot: dict, snapshotPath: Path) -> None:
+    """Saves the invader states.
+
+    Args:
+        snapshot (dict): Snapshot with the last synced month (YYYYMM) by city and the invader states by name.
+        snapshotPath (Path): Path of the json snapshot.
+    """
+    snapshotPath = Path(snapshotPath)
+    snapshotPath.parent.mkdir(parents=True, exist_ok=True)
+    snapshotPath.write_text(json.dumps(snapshot, ensure_ascii=False, indent=1), encoding="utf-8")
+
+
+def getInvaderCity(name: str) -> str:
+    """Returns the city prefix of an invader name (CITY_number)."""
+    return name.split('_')[0].upper()
+
+
+def syncInvaderStates(cities: list, snapshotPath: Path, client: invaderSpotter.InvaderSpotterClient = None,
+                      today: datetime.date = None) -> dict:
+    """Refreshes the states of the invaders of cities from the news page, starting from a persisted snapshot.
+    News deltas since the last synced month of each city are applied to the snapshot. Cities never synced,
+    older than the oldest month of the news page or cited with an unknown new state are fully crawled instead.
+
+    Args:
+        cities (list): City prefixes.
+        snapshotPath (Path): Path of the json snapshot, updated after the sync.
+        client (invaderSpotter.InvaderSpotterClient, optional): Client of the site. Defaults to a new client
+            caching the pages in invaderSpotter.DEFAULT_CACHE_PATH.
+        today (datetime.date, optional): Date of the sync. Defaults to today.
+
+    Returns:
+        dict: Dict of invader states by name, for the invaders of the cities.
+    """
+    if today is None:
+        today = datetime.date.today()
+    currentMonth = f"{today.year}{today.month:02d}"
+    cities = [city.upper() for city in cities]
+    snapshot = loadStateSnapshot(snapshotPath)
+    lastSynced = snapshot["lastSynced"]
+    states = snapshot["states"]
+
+    crawlCities = {city for city in cities if city not in lastSynced}
+    syncedCities = {city for city in cities if city in lastSynced}
+    with invaderSpotter.openClient(client) as client:
+        if syncedCities:
+            monthsDict = invadersEditor.parseInvaderSpotterNews(client.fetchNewsPage())
+            oldestMonth = min(monthsDict.keys(), default=currentMonth)
+            for city in syncedCities:
+                if lastSynced[city] < oldestMonth:
+                    crawlCities.add(city)
+            # The last synced month is applied again, its news may have grown since the sync
+            for month in sorted(monthsDict.keys()):
+                stateDict, unresolvedList = invadersEditor.getStateDictFromNews(monthsDict[month])
+                for name, state in stateDict.items():
+                    city = getInvaderCity(name)
+                    if city in syncedCities and city not in crawlCities and month >= lastSynced[city]:
+                        states[name] = state
+                for name in unresolvedList:
+                    city = getInvaderCity(name)
+                    if city in syncedCities and month >= lastSynced[city]:
+                        crawlCities.add(city)
+
+        if crawlCities:
+            logging.info(f"Full crawl of {sorted(crawlCities)}")
+            crawledStates = invadersEditor.getInvaderSpotterStateInfos(dict.fromkeys(sorted(crawlCities)), client=client)
+            states = {name: state for name, state in states.items() if getInvaderCity(name) not in crawlCities}
+            states.update(crawledStates)
+    for city in cities:
+        lastSynced[city] = currentMonth
+    saveStateSnapshot({"lastSynced": lastSynced, "states": states}, snapshotPath)
+    return {name: state for name, state in states.items() if getInvaderCity(name) in cities}
@@ -1,4 +1,13 @@
 import logging
+import functools
+import numpy as np
+
+
+HEX_DIGITS = np.full(256, 255, dtype=np.uint8)
+HEX_DIGITS[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10)
+HEX_DIGITS[np.frombuffer(b"abcdef", dtype=np.uint8)] = np.arange(10, 16)
+HEX_DIGITS[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+HEX_CHARACTERS = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
 
 
 def convertRGBtoHEX(rgbList: list[int, int, int]) -> str:
@@ -60,4 +69,83 @@ def saturateHEX(hexColor: str, factor: float) -> str:
     rgbList = convertHEXToRGB(hexColor)
     rgbList = saturateRGB(rgbList, factor)
     saturatedHexColor = convertRGBtoHEX(rgbList)
-    return saturatedHexColor
\ No newline at end of file
+    return saturatedHexColor
+
+
+def convertHEXArrayToRGB(hexColors: list[str]) -> np.ndarray:
+    """Converts hex color strs to rgb values, all at once.
+
+    Args:
+        hexColors (list[str]): Hex colors (#000000).
+
+    Returns:
+        np.ndarray: (N, 3) uint8 array of R, G and B values.
+    """
+    digits = np.array([hexColor.lstrip('#') for hexColor in hexColors], dtype="S6")
+    digits = HEX_DIGITS[digits.view(np.uint8).reshape(-1, 6)]
+    if np.any(digits == 255):
+        raise ValueError("Invalid hex color")
+    return digits[:, 0::2]*16 + digits[:, 1::2]
+
+
+def convertRGBArrayToHEX(rgbArray: np.ndarray) -> list[str]:
+    """Converts rgb values to hex color strs, all at once.
+
+    Args:
+        rgbArray (np.ndarray): (N, 3) array of R, G and B values.
+
+    Returns:
+        list[str]: Hex colors (#000000).
+    """
+    rgbArray = np.asarray(rgbArray).astype(np.uint8).reshape(-1, 3)
+    characters = np.empty((len(rgbArray), 7), dtype=np.uint8)
+    characters[:, 0] = ord('#')
+    characters[:, 1::2] = HEX_CHARACTERS[rgbArray >> 4]
+    characters[:, 2::2] = HEX_CHARACTERS[rgbArray & 15]
+    return characters.view("S7").ravel().astype(str).tolist()
+
+
+def saturateRGBArray(rgbArray: np.ndarray, factor) -> np.ndarray:
+    """saturate rgb colors according to factors, broadcast against the colors
+
+    Args:
+        rgbArray (np.ndarray): (N, 3) array of R, G and B values.
+        factor (float, np.ndarray): saturation factor (min 0), one for all colors or one per color.
+
+    Returns:
+        np.ndarray: (N, 3) uint8 array of saturated R, G and B values.
+    """
+    factor = np.asarray(factor, dtype=np.float64)
+    if np.any(factor <= 0):
+        logging.warning("Cannot input a factor lower than 0, set to 0")
+        factor = np.maximum(factor, 0)
+    if factor.ndim == 1:
+        factor = factor[:, np.newaxis]
+    return np.minimum(np.asarray(rgbArray, dtype=np.float64)*factor, 255).astype(np.uint8)
+
+
+def saturateHEXArray(hexColors: list[str], factor) -> list[str]:
+    """saturate hex colors according to factors, broadcast against the colors
+
+    Args:
+        hexColors (list[str]): Hex colors (#000000).
+        factor (float, np.ndarray): saturation factor (min 0), one for all colors or one per color.
+
+    Returns:
+        list[str]: saturated hex colors.
+    """
+    return convertRGBArrayToHEX(saturateRGBArray(convertHEXArrayToRGB(hexColors), factor))
+
+
+@functools.lru_cache(maxsize=256)
+def getSaturatedHEX(hexColor: str, factor: float) -> str:
+    """Memoized saturateHEX, for the few colors styling many waypoints.
+
+    Args:
+        hexColor (str): Hex color (#000000).
+        factor (float): saturation factor (min 0).
+
+    Returns:
+        str: saturated hex str.
+    """
+    return saturateHEX(hexColor, factor)
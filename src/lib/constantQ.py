@@ -0,0 +1,271 @@
+import time
+import functools
+import numpy as np
+from src import constants
+from src.lib import stft
+from src.lib.lazyImport import lazyImport
+
+scipy = lazyImport("scipy")
+plt = lazyImport("matplotlib.pyplot")
+
+
+# ------------------------------------------ Constant Q constants ------------------------------------------------------
+DEFAULT_BINS_PER_OCTAVE = 12
+DEFAULT_HOP_LENGTH = 512
+# Spectral kernel values under this fraction of the peak of their bin are dropped
+KERNEL_SPARSITY = 0.01
+# Half band lowpass applied before each decimation by 2
+DECIMATION_TAPS = 63
+# Fraction of the Nyquist frequency below which decimated octaves are free of filter roll off and aliasing
+DECIMATION_PASSBAND = 0.85
+
+
+def getConstantQFrequencies(fmin: float, fmax: float, binsPerOctave: int = DEFAULT_BINS_PER_OCTAVE) -> np.ndarray:
+    """Returns the log spaced center frequencies of the constant Q bins from fmin up to fmax (excluded).
+
+    Args:
+        fmin (float): Frequency of the first bin (in Hz).
+        fmax (float): Frequency limit of the bins (in Hz).
+        binsPerOctave (int, optional): Number of bins per octave. Defaults to DEFAULT_BINS_PER_OCTAVE.
+
+    Returns:
+        np.ndarray: Center frequencies (in Hz).
+    """
+    nBins = int(np.ceil(binsPerOctave*np.log2(fmax/fmin) - 1e-9))
+    return fmin*2**(np.arange(nBins)/binsPerOctave)
+
+
+def getKernelLength(fs: float, fmin: float, binsPerOctave: int = DEFAULT_BINS_PER_OCTAVE) -> int:
+    """Returns the length of the longest temporal kernel of an octave starting at fmin,
+    Q periods of its lowest frequency, Q = 1/(2^(1/binsPerOctave) - 1) so that adjacent bins just resolve.
+
+    Args:
+        fs (float): Sampling frequency (in Hz).
+        fmin (float): Frequency of the first bin of the octave (in Hz).
+        binsPerOctave (int, optional): Number of bins per octave. Defaults to DEFAULT_BINS_PER_OCTAVE.
+
+    Returns:
+        int: Kernel length (in samples).
+    """
+    q = 1/(2**(1/binsPerOctave) - 1)
+    return int(np.ceil(q*fs/fmin))
+
+
+@functools.lru_cache(maxsize=16)
+def getConstantQKernel(fs: float, fmin: float, binsPerOctave: int = DEFAULT_BINS_PER_OCTAVE, nfft: int = None,
+                       dtype: str = "complex128") -> tuple:
+    """Builds (or gets from cache) the sparse spectral kernel of one octave of constant Q bins.
+    Each row is the conjugated positive frequency spectrum of a hann windowed complex exponential
+    centered in an nfft frame, so that the bins of a frame are its rfft times the kernel.
+    A full scale sine reads 1 on its bin.
+
+    Args:
+        fs (float): Sampling frequency of the analysed signal (in Hz).
+        fmin (float): Frequency of the first bin of the octave (in Hz).
+        binsPerOctave (int, optional): Number of bins per octave. Defaults to DEFAULT_BINS_PER_OCTAVE.
+        nfft (int, optional): Fft size, at least getKernelLength. Defaults to the next power of 2.
+        dtype (str, optional): Complex type of the kernel. Defaults to 'complex128'.
+
+    Returns:
+        tuple: Center frequencies and (binsPerOctave, nfft//2+1) sparse kernel.
+    """
+    kernelLength = getKernelLength(fs, fmin, binsPerOctave)
+    if nfft is None:
+        nfft = int(2**np.ceil(np.log2(kernelLength)))
+    if nfft < kernelLength:
+        raise ValueError(f"nfft {nfft} shorter than the {kernelLength} samples kernel of {fmin} Hz")
+
+    frequencies = fmin*2**(np.arange(binsPerOctave)/binsPerOctave)
+    temporalKernels = np.zeros((binsPerOctave, nfft), dtype=complex)
+    for idx, frequency in enumerate(frequencies):
+        length = getKernelLength(fs, frequency, binsPerOctave)
+        window = np.hanning(length)
+        n = np.arange(length) - (length - 1)/2
+        start = (nfft - length + 1)//2
+        temporalKernels[idx, start:start + length] = 2*window/np.sum(window)*np.exp(2j*np.pi*frequency*n/fs)
+    # sum(x*conj(k)) = sum(X*conj(K))/nfft, the negative frequencies of the analytic kernels being negligible
+    spectralKernels = np.conj(np.fft.fft(temporalKernels, axis=1)[:, :nfft//2 + 1])/nfft
+    magnitudes = np.abs(spectralKernels)
+    spectralKernels[magnitudes < KERNEL_SPARSITY*magnitudes.max(axis=1, keepdims=True)] = 0
+    kernel = scipy.sparse.csr_matrix(spectralKernels.astype(dtype))
+    return frequencies, kernel
+
+
+class ConstantQAnalyzer:
+    """Streaming multirate constant Q transform.
+
+    Only the top octave is analysed at fs: each lower octave is the previous one lowpassed and decimated by 2,
+    so that all the octaves share the same small nfft and the same cached kernel, and their frames are taken
+    every hopLength/2^octave decimated samples to stay aligned. Frames are centered on multiples of hopLength,
+    the first one on the first sample, and the group delay of the decimation filters is compensated.
+    """
+
+    def __init__(self, fs: float, fmin: float = constants.inputs.AUDIO_BANDWIDTH[0],
+                 fmax: float = constants.inputs.AUDIO_BANDWIDTH[1], binsPerOctave: int = DEFAULT_BINS_PER_OCTAVE,
+                 hopLength: int = DEFAULT_HOP_LENGTH, channels: int = 1, nfft: int = None, dtype: np.dtype = np.float32):
+        """
+        Args:
+            fs (float): Sampling frequency (in Hz).
+            fmin (float, optional): Frequency of the first bin (in Hz). Defaults to AUDIO_BANDWIDTH[0].
+            fmax (float, optional): Frequency limit of the bins (in Hz), at most DECIMATION_PASSBAND*fs/2.
+                Defaults to AUDIO_BANDWIDTH[1].
+            binsPerOctave (int, optional): Number of bins per octave. Defaults to DEFAULT_BINS_PER_OCTAVE.
+            hopLength (int, optional): Hop between frames (in samples), a multiple of 2^(octaves-1).
+                Defaults to DEFAULT_HOP_LENGTH.
+            channels (int, optional): Number of channels. Defaults to 1.
+            nfft (int, optional): Fft size of every octave. Defaults to the next power of 2 of the kernel length.
+            dtype (np.dtype, optional): Sample type, float32 or float64. Defaults to np.float32.
+        """
+        if fmax > DECIMATION_PASSBAND*fs/2:
+            raise ValueError(f"fmax {fmax} Hz above {DECIMATION_PASSBAND} times the Nyquist frequency {fs/2} Hz")
+        self.fs = fs
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.frequencies = getConstantQFrequencies(fmin, fmax, binsPerOctave)
+        self.nOctaves = -(-len(self.frequencies)//binsPerOctave)
+        if hopLength % 2**(self.nOctaves - 1):
+            raise ValueError(f"hopLength {hopLength} is not a multiple of 2^{self.nOctaves - 1} for {self.nOctaves} octaves")
+        self.hopLength = hopLength
+        # Octaves are counted down from the highest bin, all analysed with the kernel of the top octave at fs,
+        # the extra bins of the lowest octave being dropped
+        topFmin = self.frequencies[-1]*2**(-(binsPerOctave - 1)/binsPerOctave)
+        kernelDtype = np.result_type(self.dtype, np.complex64).name
+        _, self._kernel = getConstantQKernel(fs, topFmin, binsPerOctave, nfft, kernelDtype)
+        self.nfft = int(2**np.ceil(np.log2(getKernelLength(fs, topFmin, binsPerOctave)))) if nfft is None else nfft
+        self._window = np.ones(self.nfft, dtype=self.dtype)
+        self._lowpass = scipy.signal.firwin(DECIMATION_TAPS, 0.5).astype(self.dtype)
+        groupDelay = (DECIMATION_TAPS - 1)//2
+        self._filterStates = [np.zeros((DECIMATION_TAPS - 1, channels), dtype=self.dtype) for _ in range(self.nOctaves)]
+        self._decimationCounts = [0]*self.nOctaves
+        # Samples to drop from the next blocks, starting with the delay of the decimation filters
+        self._skips = [int(round(groupDelay*(2**octave - 1)/2**octave)) for octave in range(self.nOctaves)]
+        self._buffers = [np.zeros((self.nfft//2, channels), dtype=self.dtype) for _ in range(self.nOctaves)]
+        self._pending = [np.zeros((binsPerOctave, 0, channels), dtype=kernelDtype) for _ in range(self.nOctaves)]
+
+    def _decimate(self, octave: int, signal: np.ndarray) -> np.ndarray:
+        """Lowpasses octave - 1 samples and keeps every other one, the filter state and parity carrying across blocks."""
+        if not len(signal):
+            return signal
+        filtered, self._filterStates[octave] = scipy.signal.lfilter(
+            self._lowpass, 1, signal, axis=0, zi=self._filterStates[octave])
+        start = -self._decimationCounts[octave] % 2
+        self._decimationCounts[octave] += len(signal)
+        return filtered[start::2].astype(self.dtype, copy=False)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Analyses a block of samples.
+
+        Args:
+            block (np.ndarray): (samples, channels) block, or (samples,) for a single channel.
+
+        Returns:
+            np.ndarray: (bins, frames, channels) constant Q coefficients of the frames completed by the block.
+        """
+        signal = np.asarray(block, dtype=self.dtype).reshape(len(block), self.channels)
+        for octave in range(self.nOctaves):
+            if octave > 0:
+                signal = self._decimate(octave, signal)
+            skip = min(self._skips[octave], len(signal))
+            self._skips[octave] -= skip
+            buffer = np.concatenate([self._buffers[octave], signal[skip:]])
+            hop = self.hopLength//2**octave
+            spectra = stft.computeStft(buffer, hop, self.nfft, window=self._window)
+            nFrames = spectra.shape[1]
+            if nFrames:
+                coefficients = (self._kernel @ spectra.reshape(len(spectra), -1)).reshape((-1,) + spectra.shape[1:])
+                self._pending[octave] = np.concatenate([self._pending[octave], coefficients], axis=1)
+            self._buffers[octave] = buffer[nFrames*hop:]
+            # Hops longer than nfft also skip the samples between frames that are not received yet
+            self._skips[octave] += max(nFrames*hop - len(buffer), 0)
+
+        # Lower octaves need more samples after the center of a frame, frames are returned once all octaves have them
+        nReady = min(pending.shape[1] for pending in self._pending)
+        coefficients = np.concatenate([pending[:, :nReady] for pending in reversed(self._pending)])
+        self._pending = [pending[:, nReady:] for pending in self._pending]
+        return coefficients[len(coefficients) - len(self.frequencies):]
+
+    def flush(self) -> np.ndarray:
+        """Completes the frames waiting for the samples following the last block, as if it were followed by silence.
+
+        Returns:
+            np.ndarray: (bins, frames, channels) constant Q coefficients.
+        """
+        latency = (self.nfft//2 + DECIMATION_TAPS)*2**(self.nOctaves - 1)
+        return self.process(np.zeros((latency, self.channels), dtype=self.dtype))
+
+
+def computeConstantQ(x: np.ndarray, fs: float, fmin: float = constants.inputs.AUDIO_BANDWIDTH[0],
+                     fmax: float = None, binsPerOctave: int = DEFAULT_BINS_PER_OCTAVE,
+                     hopLength: int = DEFAULT_HOP_LENGTH, nfft: int = None) -> tuple:
+    """Computes the constant Q transform of a signal with ConstantQAnalyzer.
+
+    Args:
+        x (np.ndarray): (samples,) or (samples, channels) signal, float32 signals are analysed in float32.
+        fs (float): Sampling frequency (in Hz).
+        fmin (float, optional): Frequency of the first bin (in Hz). Defaults to AUDIO_BANDWIDTH[0].
+        fmax (float, optional): Frequency limit of the bins (in Hz).
+            Defaults to AUDIO_BANDWIDTH[1], at most DECIMATION_PASSBAND*fs/2.
+        binsPerOctave (int, optional): Number of bins per octave. Defaults to DEFAULT_BINS_PER_OCTAVE.
+        hopLength (int, optional): Hop between frames (in samples), a multiple of 2^(octaves-1).
+            Defaults to DEFAULT_HOP_LENGTH.
+        nfft (int, optional): Fft size of every octave. Defaults to the next power of 2 of the kernel length.
+
+    Returns:
+        tuple: Center frequencies and (bins, 1 + samples//hopLength[, channels]) constant Q coefficients.
+    """
+    x = np.asarray(x)
+    if fmax is None:
+        fmax = min(constants.inputs.AUDIO_BANDWIDTH[1], DECIMATION_PASSBAND*fs/2)
+    dtype = np.float32 if x.dtype == np.float32 else np.float64
+    channels = 1 if x.ndim == 1 else x.shape[1]
+    analyzer = ConstantQAnalyzer(fs, fmin, fmax, binsPerOctave, hopLength, channels, nfft, dtype)
+    coefficients = np.concatenate([analyzer.process(x), analyzer.flush()], axis=1)[:, :1 + len(x)//hopLength]
+    if x.ndim == 1:
+        coefficients = coefficients[:, :, 0]
+    return analyzer.frequencies, coefficients
+
+
+if __name__ == "__main__":
+    # Benchmark against the stft resolving fmin with a single large nfft
+    fs = constants.dsp.DEFAULT_RATE
+    duration = 20
+    t = np.arange(duration*fs)/fs
+    testFrequencies = [55, 440, 3520]
+    x = sum(0.3*np.sin(2*np.pi*frequency*t) for frequency in testFrequencies).astype(np.float32)
+    x = np.stack([x, 0.5*x], axis=1)
+
+    getConstantQKernel.cache_clear()
+    start = time.perf_counter()
+    frequencies, coefficients = computeConstantQ(x, fs, fmin=27.5, hopLength=512)
+    cqTime = time.perf_counter() - start
+    start = time.perf_counter()
+    computeConstantQ(x, fs, fmin=27.5, hopLength=512)
+    cachedTime = time.perf_counter() - start
+    largeNfft = int(2**np.ceil(np.log2(getKernelLength(fs, 27.5))))
+    start = time.perf_counter()
+    stft.computeStft(x[:, 0], 512, largeNfft)
+    stftTime = time.perf_counter() - start
+    print(f"constant Q: {len(frequencies)} bins x {coefficients.shape[1]} frames x {coefficients.shape[2]} channels "
+          f"in {cachedTime:.2f} s ({cqTime:.2f} s on the first call, loading scipy and building the kernel)")
+    print(f"stft nfft={largeNfft}: {largeNfft//2 + 1} bins x 1 channel in {stftTime:.2f} s")
+
+    # Peaks of the middle frame, and a streaming run in audio sized blocks giving the same coefficients
+    magnitudes = np.abs(coefficients[:, coefficients.shape[1]//2, 0])
+    peaks = frequencies[np.argsort(magnitudes)[-len(testFrequencies):]]
+    print(f"peaks: {np.sort(peaks).round(1)} Hz, levels {np.sort(magnitudes)[-len(testFrequencies):].round(3)}")
+    analyzer = ConstantQAnalyzer(fs, fmin=27.5, hopLength=512, channels=2)
+    start = time.perf_counter()
+    streamed = np.concatenate([analyzer.process(block) for block in np.array_split(x, len(x)//480)]
+                              + [analyzer.flush()], axis=1)[:, :coefficients.shape[1]]
+    streamTime = time.perf_counter() - start
+    print(f"streaming in 10 ms blocks: {duration/streamTime:.0f}x real time, "
+          f"max deviation {np.abs(streamed - coefficients).max():.2e}")
+
+    plt.figure()
+    plt.pcolormesh(np.arange(coefficients.shape[1])*512/fs, frequencies,
+                   20*np.log10(np.abs(coefficients[:, :, 0]) + 1e-6), shading="nearest")
+    plt.yscale("log")
+    plt.xlabel("Time (s)")
+    plt.ylabel("Frequency (Hz)")
+    plt.colorbar(label="Level (dBFS)")
+    plt.show()
@@ -1,10 +1,6 @@
 from pathlib import Path
-import soundfile
-import sounddevice
 import numpy as np
 import numpy.fft as fft
-import matplotlib.pyplot as plt
-import scipy.signal
 
 
 def keepFftPositiveF(fastft: np.ndarray) -> np.ndarray:
@@ -0,0 +1,136 @@
+import functools
+import numpy as np
+from src import constants
+from src.lib import signalGeneration
+
+
+@functools.lru_cache(maxsize=16)
+def getHarmonicWindows(fs: int, sweepRate: float, nHarmonics: int, windowLength: int) -> tuple:
+    """Gets the positions of the harmonic impulse responses of a swept sine deconvolution and their window.
+    The n-th harmonic response is located L*ln(n) seconds before the linear one.
+
+    Args:
+        fs (int): Sampling frequency (in Hz).
+        sweepRate (float): Rate L of the swept sine (in s).
+        nHarmonics (int): Number of harmonics, including the fundamental.
+        windowLength (int): Length of each harmonic window (in indexes).
+
+    Returns:
+        tuple: (nHarmonics, windowLength) indexes relative to the linear impulse peak, and the window.
+    """
+    preDelay = windowLength//8
+    offsets = np.round(sweepRate*np.log(np.arange(1, nHarmonics + 1))*fs).astype(int)
+    indexes = -offsets[:, np.newaxis] - preDelay + np.arange(windowLength)
+    # Half hanning fade in before the peak, flat, then half hanning fade out on the last quarter
+    fadeOutLength = windowLength//4
+    window = np.ones(windowLength)
+    window[:preDelay] = np.hanning(2*preDelay)[:preDelay]
+    window[windowLength - fadeOutLength:] = np.hanning(2*fadeOutLength)[fadeOutLength:]
+    indexes.setflags(write=False)
+    window.setflags(write=False)
+    return indexes, window
+
+
+def computeHarmonicResponses(
+        capture: np.ndarray, sweep: np.ndarray, fs: int = constants.dsp.DEFAULT_RATE,
+        f0: float = constants.inputs.AUDIO_BANDWIDTH[0], f1: float = constants.inputs.AUDIO_BANDWIDTH[1],
+        duration: float = constants.inputs.SWEPTSINE_DURATION_LONG, novak: bool = True,
+        nHarmonics: int = 5, windowLength: int = None) -> tuple:
+    """Computes the frequency responses of the fundamental and the harmonics of every channel of a swept sine capture,
+    from a single deconvolution (based on https://www.ant-novak.com/publications/papers/2010_ieee_novak.pdf).
+
+    Args:
+        capture (np.ndarray): (samples, channels) recording of the swept sine, or a single channel.
+        sweep (np.ndarray): Played swept sine.
+        fs (int, optional): Sampling frequency (in Hz). Defaults to DEFAULT_RATE.
+        f0 (float, optional): Start frequency of the sweep (in Hz). Defaults to AUDIO_BANDWIDTH[0].
+        f1 (float, optional): End frequency of the sweep (in Hz). Defaults to AUDIO_BANDWIDTH[1].
+        duration (float, optional): Duration given to generateSweptsine (in s). Defaults to SWEPTSINE_DURATION_LONG.
+        novak (bool, optional): Whether the sweep was generated with novaks conditions. Defaults to True.
+        nHarmonics (int, optional): Number of harmonics, including the fundamental. Defaults to 5.
+        windowLength (int, optional): Length of the harmonic windows (in indexes).
+            Defaults to the largest power of 2 fitting between the 2 last harmonics.
+
+    Returns:
+        tuple: Frequency list and (nHarmonics, bins, channels) responses, the n-th harmonic response
+            at frequency n*f being the one excited at f.
+    """
+    capture = np.asarray(capture)
+    if capture.ndim == 1:
+        capture = capture[:, np.newaxis]
+    fs = int(fs)
+    sweepRate = signalGeneration.getSweptSineRate(f0=f0, f1=f1, duration=duration, novak=novak)
+    if windowLength is None:
+        spacing = sweepRate*np.log(nHarmonics/(nHarmonics - 1))*fs if nHarmonics > 1 else len(sweep)
+        windowLength = int(2**np.floor(np.log2(min(spacing, fs))))
+
+    # Single deconvolution of all channels, regularized outside of the swept band
+    nfft = int(2**np.ceil(np.log2(len(capture) + len(sweep))))
+    captureFft = np.fft.rfft(capture, nfft, axis=0)
+    sweepFft = np.fft.rfft(sweep, nfft)
+    frequencyList = np.fft.rfftfreq(nfft, 1/fs)
+    sweepPower = np.abs(sweepFft)**2
+    inBand = (frequencyList >= f0) & (frequencyList <= f1)
+    regularization = np.where(inBand, 1e-6, 1)*np.max(sweepPower)
+    inverseFilter = np.conj(sweepFft)/(sweepPower + regularization)
+    impulseResponse = np.fft.irfft(captureFft*inverseFilter[:, np.newaxis], nfft, axis=0)
+
+    # Harmonics are windowed around the linear impulse, found on the sum of the channels
+    peak = int(np.argmax(np.sum(np.abs(impulseResponse[:nfft//2]), axis=1)))
+    indexes, window = getHarmonicWindows(fs, sweepRate, nHarmonics, windowLength)
+    harmonicImpulses = impulseResponse[(indexes + peak) % nfft]*window[:, np.newaxis]
+    responses = np.fft.rfft(harmonicImpulses, axis=1)
+    return np.fft.rfftfreq(windowLength, 1/fs), responses
+
+
+def computeHarmonicDistortion(
+        capture: np.ndarray, sweep: np.ndarray, fs: int = constants.dsp.DEFAULT_RATE,
+        f0: float = constants.inputs.AUDIO_BANDWIDTH[0], f1: float = constants.inputs.AUDIO_BANDWIDTH[1],
+        duration: float = constants.inputs.SWEPTSINE_DURATION_LONG, novak: bool = True,
+        nHarmonics: int = 5, windowLength: int = None) -> tuple:
+    """Computes HD2..HDn and THD versus excitation frequency of every channel of a swept sine capture.
+
+    Args:
+        capture (np.ndarray): (samples, channels) recording of the swept sine, or a single channel.
+        sweep (np.ndarray): Played swept sine.
+        fs (int, optional): Sampling frequency (in Hz). Defaults to DEFAULT_RATE.
+        f0 (float, optional): Start frequency of the sweep (in Hz). Defaults to AUDIO_BANDWIDTH[0].
+        f1 (float, optional): End frequency of the sweep (in Hz). Defaults to AUDIO_BANDWIDTH[1].
+        duration (float, optional): Duration given to generateSweptsine (in s). Defaults to SWEPTSINE_DURATION_LONG.
+        novak (bool, optional): Whether the sweep was generated with novaks conditions. Defaults to True.
+        nHarmonics (int, optional): Number of harmonics, including the fundamental. Defaults to 5.
+        windowLength (int, optional): Length of the harmonic windows (in indexes).
+            Defaults to the largest power of 2 fitting between the 2 last harmonics.
+
+    Returns:
+        tuple: Frequency list, (nHarmonics-1, bins, channels) HD2..HDn ratios and (bins, channels) THD ratio,
+            nan where the harmonic was not excited.
+    """
+    frequencyList, responses = computeHarmonicResponses(
+        capture, sweep, fs, f0, f1, duration, novak, nHarmonics, windowLength
+        )
+    nBins = len(frequencyList)
+    # The response excited at f lies at bin n*f of the n-th harmonic spectrum
+    orders = np.arange(2, nHarmonics + 1)[:, np.newaxis]
+    harmonicBins = orders*np.arange(nBins)
+    valid = (harmonicBins < nBins) & (frequencyList >= f0) & (orders*frequencyList <= f1)
+    harmonics = np.abs(responses[orders - 1, np.minimum(harmonicBins, nBins - 1)])
+    fundamental = np.abs(responses[0])
+    hd = np.where(valid[..., np.newaxis], harmonics/np.maximum(fundamental, 1e-20), np.nan)
+    thd = np.where(valid[0][:, np.newaxis], np.sqrt(np.nansum(hd**2, axis=0)), np.nan)
+    return frequencyList, hd, thd
+
+
+if __name__ == "__main__":
+    # Weakly nonlinear system, expected HD2 = 0.05*amp and HD3 = 0.0025*amp**2
+    fs = 48000
+    f0, f1, duration = 20, 20000, 5
+    amp = 0.5
+    _, sweep, _ = signalGeneration.generateSweptsine(amp=amp, f0=f0, f1=f1, duration=duration, fs=fs, novak=True)
+    capture = np.concatenate([np.zeros(1000), sweep, np.zeros(fs)])
+    capture = np.stack([capture + 0.1*capture**2 + 0.01*capture**3, capture], axis=-1)
+    frequencyList, hd, thd = computeHarmonicDistortion(capture, sweep, fs, f0, f1, duration)
+    idx = np.argmin(np.abs(frequencyList - 1000))
+    print(f"HD2 at 1 kHz: {hd[0, idx, 0]:.4f} (expected {0.05*amp:.4f})")
+    print(f"HD3 at 1 kHz: {hd[1, idx, 0]:.5f} (expected {0.0025*amp**2:.5f})")
+    print(f"THD at 1 kHz of the linear channel: {thd[idx, 1]:.2e}")
@@ -0,0 +1,52 @@
+import sys
+import types
+import importlib
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in of a module, importing it on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attribute: str):
+        module = self._load()
+        try:
+            return getattr(module, attribute)
+        except AttributeError:
+            # Submodules not imported by their package, e.g. scipy.signal, are imported on first access too
+            submoduleName = f"{self.__name__}.{attribute}"
+            try:
+                return importlib.import_module(submoduleName)
+            except ModuleNotFoundError as error:
+                # Missing dependencies of an existing submodule are reported as such
+                if error.name != submoduleName:
+                    raise
+                raise AttributeError(f"module '{self.__name__}' has no attribute '{attribute}'") from None
+
+    def __dir__(self) -> list:
+        return dir(self._load())
+
+
+def lazyImport(name: str) -> types.ModuleType:
+    """Imports a module on first use, so that heavy dependencies (plotting, audio devices, scraping)
+    are only paid for by the code actually using them.
+
+    Args:
+        name (str): Full name of the module, e.g. "matplotlib.pyplot".
+
+    Returns:
+        types.ModuleType: The module if already imported, else a stand-in importing it on first attribute access.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return _LazyModule(name)
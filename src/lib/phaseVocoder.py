@@ -0,0 +1,260 @@
+import time
+import fractions
+import numpy as np
+from src import constants
+from src.lib import stft
+from src.lib.lazyImport import lazyImport
+
+scipy = lazyImport("scipy")
+
+
+# ------------------------------------------ Phase vocoder constants ---------------------------------------------------
+DEFAULT_NDFT = 2048
+# Synthesis hop, as a fraction of ndft
+DEFAULT_HOP_FRACTION = 4
+
+
+def _wrapPhase(phase: np.ndarray) -> np.ndarray:
+    """Wraps phases to [-pi, pi)."""
+    return phase - 2*np.pi*np.round(phase/(2*np.pi))
+
+
+def lockPhases(phases: np.ndarray, magnitudes: np.ndarray, analysisPhases: np.ndarray) -> np.ndarray:
+    """Identity phase locking: each bin keeps its phase offset to the closest spectral peak of its frame,
+    so that the bins of a partial stay coherent instead of drifting apart (phasiness).
+    Peaks keep the phase accumulated on their bin.
+
+    Args:
+        phases (np.ndarray): (bins, frames[, channels]) synthesis phases.
+        magnitudes (np.ndarray): (bins, frames[, channels]) magnitudes.
+        analysisPhases (np.ndarray): (bins, frames[, channels]) phases of the analysed frames.
+
+    Returns:
+        np.ndarray: (bins, frames[, channels]) locked phases.
+    """
+    nBins = len(magnitudes)
+    isPeak = np.zeros(magnitudes.shape, dtype=bool)
+    isPeak[1:-1] = (magnitudes[1:-1] > magnitudes[:-2]) & (magnitudes[1:-1] >= magnitudes[2:])
+    binIdx = np.arange(nBins).reshape((-1,) + (1,)*(magnitudes.ndim - 1))
+    # Closest peak at or below and at or above each bin, -1 and nBins when there is none
+    below = np.maximum.accumulate(np.where(isPeak, binIdx, -1), axis=0)
+    above = np.flip(np.minimum.accumulate(np.flip(np.where(isPeak, binIdx, nBins), axis=0), axis=0), axis=0)
+    useBelow = (above >= nBins) | ((below >= 0) & (binIdx - below <= above - binIdx))
+    peakIdx = np.where(useBelow, below, above)
+    peakIdx = np.where((peakIdx < 0) | (peakIdx >= nBins), binIdx, peakIdx)
+    return (np.take_along_axis(phases, peakIdx, axis=0)
+            + analysisPhases - np.take_along_axis(analysisPhases, peakIdx, axis=0))
+
+
+def _stretchFrames(stftFrames: np.ndarray, step: float, hop: int, phaseLocking: bool,
+                   startTime: float = 0.0, startPhase: np.ndarray = None) -> tuple:
+    """Resamples STFT frames at fractional frame times with the phase vocoder.
+
+    Args:
+        stftFrames (np.ndarray): (bins, frames[, channels]) analysed frames.
+        step (float): Analysed frames per synthesised frame, 1/stretchRatio.
+        hop (int): Hop of the analysed frames (in samples).
+        phaseLocking (bool): Applies identity phase locking.
+        startTime (float, optional): Time of the first synthesised frame (in analysed frames). Defaults to 0.
+        startPhase (np.ndarray, optional): Phase of the first synthesised frame. Defaults to its analysed phase.
+
+    Returns:
+        tuple: (bins, outFrames[, channels]) synthesised frames, time and phase of the next synthesised frame.
+    """
+    nBins, nFrames = stftFrames.shape[:2]
+    times = startTime + step*np.arange(max(int(np.ceil((nFrames - 1 - startTime)/step)), 0))
+    if not len(times):
+        return np.zeros((nBins, 0) + stftFrames.shape[2:], dtype=stftFrames.dtype), startTime, startPhase
+    frameIdx = np.minimum(times.astype(int), nFrames - 2)
+    fraction = (times - frameIdx).reshape((1, -1) + (1,)*(stftFrames.ndim - 2)).astype(stftFrames.real.dtype)
+    # Magnitudes and phases of each analysed frame are computed once, even when read by several synthesised frames
+    frameMagnitudes = np.abs(stftFrames)
+    framePhases = np.angle(stftFrames)
+    magnitudes = (1 - fraction)*frameMagnitudes[:, frameIdx] + fraction*frameMagnitudes[:, frameIdx + 1]
+
+    # Phase advance of each bin over a hop: its expected advance plus its wrapped deviation
+    omega = (np.pi*hop/(nBins - 1)*np.arange(nBins)).reshape((-1,) + (1,)*(stftFrames.ndim - 1))
+    leftPhases = framePhases[:, frameIdx]
+    advances = omega + _wrapPhase(framePhases[:, frameIdx + 1] - leftPhases - omega)
+    if startPhase is None:
+        startPhase = leftPhases[:, 0].astype(float)
+    # Phase of frame j: start phase plus the advances of the frames before it
+    cumulated = np.cumsum(advances, axis=1)
+    phases = startPhase[:, np.newaxis] + cumulated - advances
+    nextPhase = _wrapPhase(startPhase + cumulated[:, -1])
+    phases = _wrapPhase(phases).astype(magnitudes.dtype)
+    if phaseLocking:
+        phases = lockPhases(phases, magnitudes, leftPhases)
+    stretched = np.empty(magnitudes.shape, dtype=stftFrames.dtype)
+    stretched.real = magnitudes*np.cos(phases)
+    stretched.imag = magnitudes*np.sin(phases)
+    return stretched, times[-1] + step, nextPhase
+
+
+def stretchStft(stftFrames: np.ndarray, stretchRatio: float, hop: int, phaseLocking: bool = True) -> np.ndarray:
+    """Time stretches a (bins, frames[, channels]) STFT, all the frames at once.
+
+    Args:
+        stftFrames (np.ndarray): Short term fourier transform, as given by stft.computeStft.
+        stretchRatio (float): Output duration over input duration, 2 plays twice slower.
+        hop (int): Hop of the STFT (in samples), also the hop of the stretched STFT.
+        phaseLocking (bool, optional): Applies identity phase locking. Defaults to True.
+
+    Returns:
+        np.ndarray: (bins, stretched frames[, channels]) Short term fourier transform.
+    """
+    stretched, _, _ = _stretchFrames(stftFrames, 1/stretchRatio, hop, phaseLocking)
+    return stretched
+
+
+class PhaseVocoder:
+    """Streaming phase vocoder time stretch.
+
+    Input blocks are analysed every hop samples, frames are resampled at 1/stretchRatio analysed frames per hop,
+    keeping the last synthesis time and phase between blocks, then overlap added with the tail of the previous block.
+    Frames are centered on multiples of the hop, so that output sample n plays input sample n/stretchRatio.
+    """
+
+    def __init__(self, stretchRatio: float, ndft: int = DEFAULT_NDFT, hop: int = None, channels: int = 1,
+                 phaseLocking: bool = True, dtype: np.dtype = np.float32):
+        """
+        Args:
+            stretchRatio (float): Output duration over input duration, 2 plays twice slower.
+            ndft (int, optional): Fft size. Defaults to DEFAULT_NDFT.
+            hop (int, optional): Analysis and synthesis hop (in samples), dividing ndft/2.
+                Defaults to ndft/DEFAULT_HOP_FRACTION.
+            channels (int, optional): Number of channels. Defaults to 1.
+            phaseLocking (bool, optional): Applies identity phase locking. Defaults to True.
+            dtype (np.dtype, optional): Sample type, float32 or float64. Defaults to np.float32.
+        """
+        self.stretchRatio = stretchRatio
+        self.ndft = ndft
+        self.hop = ndft//DEFAULT_HOP_FRACTION if hop is None else hop
+        if (ndft//2) % self.hop:
+            raise ValueError(f"hop {self.hop} does not divide ndft/2 = {ndft//2}")
+        self.channels = channels
+        self.phaseLocking = phaseLocking
+        self.dtype = np.dtype(dtype)
+        # Squared sine windows overlapping every hop sum to ndft/(2*hop)
+        self._window = stft.getSineWindow(ndft).astype(self.dtype)*np.asarray(2*self.hop/ndft, dtype=self.dtype)
+        self._inputBuffer = np.zeros((ndft//2, channels), dtype=self.dtype)
+        self._frames = np.zeros((ndft//2 + 1, 0, channels), dtype=np.result_type(self.dtype, np.complex64))
+        self._time = 0.0
+        self._phase = None
+        self._outputTail = np.zeros((ndft - self.hop, channels), dtype=self.dtype)
+        # The first synthesised frame is centered on the first output sample
+        self._discard = ndft//2
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Stretches a block of samples.
+
+        Args:
+            block (np.ndarray): (samples, channels) block, or (samples,) for a single channel.
+
+        Returns:
+            np.ndarray: (samples, channels) stretched samples completed by the block.
+        """
+        signal = np.asarray(block, dtype=self.dtype).reshape(len(block), self.channels)
+        buffer = np.concatenate([self._inputBuffer, signal])
+        analysed = stft.computeStft(buffer, self.hop, self.ndft)
+        self._inputBuffer = buffer[analysed.shape[1]*self.hop:]
+        self._frames = np.concatenate([self._frames, analysed], axis=1)
+
+        stretched, self._time, self._phase = _stretchFrames(
+            self._frames, 1/self.stretchRatio, self.hop, self.phaseLocking, self._time, self._phase)
+        # Frames before the next synthesis time are not needed anymore
+        dropped = max(min(int(self._time), self._frames.shape[1] - 1), 0)
+        self._frames = self._frames[:, dropped:]
+        self._time -= dropped
+
+        nFrames = stretched.shape[1]
+        if not nFrames:
+            return np.zeros((0, self.channels), dtype=self.dtype)
+        output = stft.computeIstft(stretched, self.hop, self.ndft, window=self._window)
+        output[:len(self._outputTail)] += self._outputTail
+        self._outputTail = output[nFrames*self.hop:]
+        output = output[:nFrames*self.hop]
+        discard = min(self._discard, len(output))
+        self._discard -= discard
+        return output[discard:]
+
+    def flush(self) -> np.ndarray:
+        """Completes the output of the last samples, as if they were followed by silence.
+
+        Returns:
+            np.ndarray: (samples, channels) stretched samples.
+        """
+        # Output lags by about ndft samples, that is ndft/stretchRatio input samples
+        latency = int(np.ceil(2*self.ndft*max(1, 1/self.stretchRatio)))
+        return self.process(np.zeros((latency, self.channels), dtype=self.dtype))
+
+
+def timeStretch(x: np.ndarray, stretchRatio: float, ndft: int = DEFAULT_NDFT, hop: int = None,
+                phaseLocking: bool = True) -> np.ndarray:
+    """Time stretches a signal without changing its pitch, with PhaseVocoder.
+
+    Args:
+        x (np.ndarray): (samples,) or (samples, channels) signal, float32 signals are processed in float32.
+        stretchRatio (float): Output duration over input duration, 2 plays twice slower.
+        ndft (int, optional): Fft size. Defaults to DEFAULT_NDFT.
+        hop (int, optional): Hop (in samples), dividing ndft/2. Defaults to ndft/DEFAULT_HOP_FRACTION.
+        phaseLocking (bool, optional): Applies identity phase locking. Defaults to True.
+
+    Returns:
+        np.ndarray: (round(samples*stretchRatio)[, channels]) stretched signal.
+    """
+    x = np.asarray(x)
+    dtype = np.float32 if x.dtype == np.float32 else np.float64
+    channels = 1 if x.ndim == 1 else x.shape[1]
+    vocoder = PhaseVocoder(stretchRatio, ndft, hop, channels, phaseLocking, dtype)
+    y = np.concatenate([vocoder.process(x), vocoder.flush()])[:int(round(len(x)*stretchRatio))]
+    return y[:, 0] if x.ndim == 1 else y
+
+
+def pitchShift(x: np.ndarray, semitones: float, ndft: int = DEFAULT_NDFT, hop: int = None,
+               phaseLocking: bool = True) -> np.ndarray:
+    """Shifts the pitch of a signal without changing its duration: time stretch, then resampling to the input length.
+
+    Args:
+        x (np.ndarray): (samples,) or (samples, channels) signal.
+        semitones (float): Pitch shift (in semitones).
+        ndft (int, optional): Fft size. Defaults to DEFAULT_NDFT.
+        hop (int, optional): Hop (in samples), dividing ndft/2. Defaults to ndft/DEFAULT_HOP_FRACTION.
+        phaseLocking (bool, optional): Applies identity phase locking. Defaults to True.
+
+    Returns:
+        np.ndarray: Shifted signal, with the shape of x.
+    """
+    ratio = fractions.Fraction(2**(semitones/12)).limit_denominator(1000)
+    stretched = timeStretch(x, float(ratio), ndft, hop, phaseLocking)
+    shifted = scipy.signal.resample_poly(stretched, ratio.denominator, ratio.numerator, axis=0).astype(stretched.dtype)
+    padding = [(0, max(len(x) - len(shifted), 0))] + [(0, 0)]*(shifted.ndim - 1)
+    return np.pad(shifted, padding)[:len(x)]
+
+
+if __name__ == "__main__":
+    # Throughput against real time, offline and in 10 ms blocks, and pitch of the stretched signal
+    fs = constants.dsp.DEFAULT_RATE
+    duration = 30
+    t = np.arange(duration*fs)/fs
+    x = (0.5*np.sin(2*np.pi*440*t) + 0.2*np.sin(2*np.pi*1250*t)).astype(np.float32)
+    x = np.stack([x, x], axis=1)
+    for stretchRatio in [0.5, 0.8, 1.25, 2.0]:
+        for phaseLocking in [False, True]:
+            start = time.perf_counter()
+            y = timeStretch(x, stretchRatio, phaseLocking=phaseLocking)
+            offlineTime = time.perf_counter() - start
+            vocoder = PhaseVocoder(stretchRatio, channels=2, phaseLocking=phaseLocking)
+            start = time.perf_counter()
+            streamed = np.concatenate([vocoder.process(block) for block in np.array_split(x, len(x)//480)]
+                                      + [vocoder.flush()])[:len(y)]
+            streamTime = time.perf_counter() - start
+            spectrum = np.abs(np.fft.rfft(y[len(y)//4:len(y)//4 + fs, 0]))
+            print(f"ratio {stretchRatio:4.2f} locking {phaseLocking!s:5s}: {len(y)/fs:5.1f} s output, "
+                  f"offline {duration/offlineTime:5.0f}x real time, streaming {duration/streamTime:4.0f}x real time, "
+                  f"peak {np.argmax(spectrum)} Hz, stream deviation {np.abs(streamed - y).max():.1e}")
+    start = time.perf_counter()
+    shifted = pitchShift(x, 3)
+    spectrum = np.abs(np.fft.rfft(shifted[len(x)//4:len(x)//4 + fs, 0]))
+    print(f"pitch shift +3 semitones: {duration/(time.perf_counter() - start):.0f}x real time, "
+          f"peak {np.argmax(spectrum)} Hz (expected {440*2**(3/12):.0f} Hz)")
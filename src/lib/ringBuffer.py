@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class RingBuffer:
+    """Preallocated multichannel ring buffer for a single producer and a single consumer.
+
+    The producer only moves the write counter and the consumer only moves the read counter,
+    so a sounddevice callback can write while another thread reads without any lock.
+    Counters are total frame counts, positions in the buffer are taken modulo its capacity.
+    """
+
+    def __init__(self, capacity: int, channels: int = 1, dtype: np.dtype = np.float32):
+        """
+        Args:
+            capacity (int): Number of frames the buffer can hold.
+            channels (int, optional): Number of channels. Defaults to 1.
+            dtype (np.dtype, optional): Sample type. Defaults to np.float32.
+        """
+        self.capacity = int(capacity)
+        self.channels = int(channels)
+        self._buffer = np.zeros((self.capacity, self.channels), dtype=dtype)
+        self._writeCount = 0
+        self._readCount = 0
+        self.overruns = 0
+        self.underruns = 0
+
+    @property
+    def availableRead(self) -> int:
+        """Number of frames written and not read yet."""
+        return self._writeCount - self._readCount
+
+    @property
+    def availableWrite(self) -> int:
+        """Number of frames that can be written without overwriting unread frames."""
+        return self.capacity - (self._writeCount - self._readCount)
+
+    def _getViews(self, count: int, nFrames: int) -> tuple:
+        start = count % self.capacity
+        firstLength = min(nFrames, self.capacity - start)
+        return self._buffer[start:start + firstLength], self._buffer[:nFrames - firstLength]
+
+    def getWriteViews(self, nFrames: int) -> tuple:
+        """Gets zero copy views on the next free frames, split in 2 when they wrap around the end of the buffer.
+
+        Args:
+            nFrames (int): Number of frames wanted, limited to the available space.
+
+        Returns:
+            tuple: First and second (possibly empty) views, to fill before calling commitWrite.
+        """
+        return self._getViews(self._writeCount, min(nFrames, self.availableWrite))
+
+    def commitWrite(self, nFrames: int) -> None:
+        """Publishes frames filled through getWriteViews to the consumer.
+
+        Args:
+            nFrames (int): Number of frames written.
+        """
+        self._writeCount += nFrames
+
+    def getReadViews(self, nFrames: int) -> tuple:
+        """Gets zero copy views on the oldest unread frames, split in 2 when they wrap around the end of the buffer.
+
+        Args:
+            nFrames (int): Number of frames wanted, limited to the available frames.
+
+        Returns:
+            tuple: First and second (possibly empty) views, to consume before calling commitRead.
+        """
+        return self._getViews(self._readCount, min(nFrames, self.availableRead))
+
+    def commitRead(self, nFrames: int) -> None:
+        """Releases frames read through getReadViews to the producer.
+
+        Args:
+            nFrames (int): Number of frames read.
+        """
+        self._readCount += nFrames
+
+    def write(self, block: np.ndarray) -> int:
+        """Copies a (frames, channels) block into the buffer. Frames that do not fit are dropped and counted as an overrun.
+
+        Args:
+            block (np.ndarray): Block of frames.
+
+        Returns:
+            int: Number of frames written.
+        """
+        first, second = self.getWriteViews(len(block))
+        nFrames = len(first) + len(second)
+        if nFrames < len(block):
+            self.overruns += 1
+        first[:] = block[:len(first)]
+        second[:] = block[len(first):nFrames]
+        self.commitWrite(nFrames)
+        return nFrames
+
+    def read(self, out: np.ndarray) -> int:
+        """Copies the oldest frames into a (frames, channels) array. Missing frames are counted as an underrun.
+
+        Args:
+            out (np.ndarray): Destination array, filled from its start.
+
+        Returns:
+            int: Number of frames read.
+        """
+        first, second = self.getReadViews(len(out))
+        nFrames = len(first) + len(second)
+        if nFrames < len(out):
+            self.underruns += 1
+        out[:len(first)] = first
+        out[len(first):nFrames] = second
+        self.commitRead(nFrames)
+        return nFrames
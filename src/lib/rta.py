@@ -0,0 +1,162 @@
+import functools
+import numpy as np
+from src import constants
+from src.lib.ringBuffer import RingBuffer
+from src.lib.lazyImport import lazyImport
+
+sounddevice = lazyImport("sounddevice")
+plt = lazyImport("matplotlib.pyplot")
+
+
+@functools.lru_cache(maxsize=16)
+def getBandMasks(fs: int, nfft: int, fractionN: int = 3,
+                 bandwidth: tuple = tuple(constants.inputs.AUDIO_BANDWIDTH)) -> tuple:
+    """Builds the 1/N octave band masks of a real fft. Each bin is weighted by the fraction
+    of its width lying inside the band, so that narrow low frequency bands are never empty.
+
+    Args:
+        fs (int): Sampling frequency (in Hz).
+        nfft (int): Fft size.
+        fractionN (int, optional): Octave fraction, 1 for octave bands, 3 for third octave bands. Defaults to 3.
+        bandwidth (tuple, optional): Frequency range of the band centers (in Hz). Defaults to AUDIO_BANDWIDTH.
+
+    Returns:
+        tuple: Band center frequencies and (bands, bins) masks.
+    """
+    firstBand = int(np.ceil(fractionN*np.log2(bandwidth[0]/1000)))
+    lastBand = int(np.floor(fractionN*np.log2(bandwidth[1]/1000)))
+    centerFrequencies = 1000*2**(np.arange(firstBand, lastBand + 1)/fractionN)
+    centerFrequencies = centerFrequencies[centerFrequencies*2**(1/(2*fractionN)) < fs/2]
+    lowEdges = centerFrequencies[:, np.newaxis]*2**(-1/(2*fractionN))
+    highEdges = centerFrequencies[:, np.newaxis]*2**(1/(2*fractionN))
+    df = fs/nfft
+    binFrequencies = np.arange(nfft//2 + 1)*df
+    overlap = np.minimum(highEdges, binFrequencies + df/2) - np.maximum(lowEdges, binFrequencies - df/2)
+    masks = np.clip(overlap/df, 0, 1).astype(np.float32)
+    masks.setflags(write=False)
+    return centerFrequencies, masks
+
+
+class RealTimeAnalyzer:
+    """Streaming fractional octave analyzer.
+
+    Audio blocks are pushed from the audio callback into a ring buffer, update then analyses
+    every pending hop at once with a batched fft and the cached band masks, applies the
+    exponential time weighting and integrates the equivalent continuous level (Leq).
+    Levels are in dBFS, a full scale sine reads 0 dB.
+    """
+
+    def __init__(self, fs: int, channels: int = 1, fractionN: int = 3, nfft: int = 8192,
+                 timeWeighting: float = constants.dsp.TIME_WEIGHTING_FAST,
+                 bandwidth: list = constants.inputs.AUDIO_BANDWIDTH):
+        """
+        Args:
+            fs (int): Sampling frequency (in Hz).
+            channels (int, optional): Number of channels. Defaults to 1.
+            fractionN (int, optional): Octave fraction, 1 for octave bands, 3 for third octave bands. Defaults to 3.
+            nfft (int, optional): Fft size, hop is half of it. Defaults to 8192.
+            timeWeighting (float, optional): Time constant (in s). Defaults to TIME_WEIGHTING_FAST.
+            bandwidth (list, optional): Frequency range of the band centers (in Hz). Defaults to AUDIO_BANDWIDTH.
+        """
+        self.fs = int(fs)
+        self.channels = channels
+        self.nfft = nfft
+        self.hop = nfft//2
+        self.centerFrequencies, self._masks = getBandMasks(self.fs, nfft, fractionN, tuple(bandwidth))
+        self.ringBuffer = RingBuffer(capacity=max(8*nfft, self.fs), channels=channels)
+        self._window = np.hanning(nfft).astype(np.float32)[:, np.newaxis]
+        # Mean square of a windowed frame from its one sided spectrum (Parseval)
+        self._scale = 2/(nfft*np.sum(self._window**2))
+        self._history = np.zeros((nfft - self.hop, channels), dtype=np.float32)
+        self._alpha = np.exp(-self.hop/(timeWeighting*self.fs))
+        self._power = np.zeros((len(self.centerFrequencies), channels))
+        self._leqEnergy = np.zeros((len(self.centerFrequencies), channels))
+        self._leqFrames = 0
+
+    def push(self, block: np.ndarray) -> None:
+        """Pushes a (frames, channels) block, safe to call from an audio callback.
+
+        Args:
+            block (np.ndarray): Block of frames.
+        """
+        self.ringBuffer.write(block)
+
+    def update(self) -> np.ndarray:
+        """Analyses all the complete hops pushed since the last update.
+
+        Returns:
+            np.ndarray: (bands, channels) time weighted levels (in dB).
+        """
+        nHops = self.ringBuffer.availableRead//self.hop
+        if nHops > 0:
+            signal = np.empty((len(self._history) + nHops*self.hop, self.channels), dtype=np.float32)
+            signal[:len(self._history)] = self._history
+            self.ringBuffer.read(signal[len(self._history):])
+            self._history[:] = signal[len(signal) - len(self._history):]
+            # (hops, nfft, channels) frames
+            frames = np.lib.stride_tricks.sliding_window_view(signal, self.nfft, axis=0)[::self.hop]
+            frames = np.moveaxis(frames, -1, 1)*self._window
+            spectrum = np.fft.rfft(frames, axis=1)
+            bandPower = self._scale*np.matmul(self._masks, spectrum.real**2 + spectrum.imag**2)
+            # Exponential averaging of all the hops: p[k] = alpha*p[k-1] + (1 - alpha)*x[k]
+            decays = self._alpha**np.arange(nHops - 1, -1, -1)
+            self._power = self._alpha**nHops*self._power + (1 - self._alpha)*np.tensordot(decays, bandPower, axes=1)
+            self._leqEnergy += np.sum(bandPower, axis=0)
+            self._leqFrames += nHops
+        return self.getLevels()
+
+    def getLevels(self) -> np.ndarray:
+        """Returns the (bands, channels) time weighted levels (in dB)."""
+        return 10*np.log10(np.maximum(self._power, 1e-20)) + 10*np.log10(2)
+
+    def getLeq(self) -> np.ndarray:
+        """Returns the (bands, channels) equivalent continuous levels since the last reset (in dB)."""
+        energy = self._leqEnergy/max(self._leqFrames, 1)
+        return 10*np.log10(np.maximum(energy, 1e-20)) + 10*np.log10(2)
+
+    def resetLeq(self) -> None:
+        """Restarts the Leq integration."""
+        self._leqEnergy[:] = 0
+        self._leqFrames = 0
+
+
+def runRta(fs: int, mapping: list, fractionN: int = 3, updateRate: float = 10,
+           timeWeighting: float = constants.dsp.TIME_WEIGHTING_FAST, nfft: int = None) -> None:
+    """Displays live fractional octave levels of input channels until the figure is closed.
+
+    Args:
+        fs (int): Sampling frequency (in Hz).
+        mapping (list): Input mapping list (channel numbers start at 1).
+        fractionN (int, optional): Octave fraction, 1 for octave bands, 3 for third octave bands. Defaults to 3.
+        updateRate (float, optional): Display updates per second (in Hz). Defaults to 10.
+        timeWeighting (float, optional): Time constant (in s). Defaults to TIME_WEIGHTING_FAST.
+        nfft (int, optional): Fft size. Defaults to about 170 ms of signal.
+    """
+    if nfft is None:
+        nfft = int(2**np.ceil(np.log2(fs/6)))
+    channelIdx = np.asarray(mapping) - 1
+    analyzer = RealTimeAnalyzer(fs, channels=max(mapping), fractionN=fractionN, nfft=nfft, timeWeighting=timeWeighting)
+
+    def callback(indata, frames, time, status):
+        analyzer.push(indata)
+
+    plt.figure()
+    bandIdx = np.arange(len(analyzer.centerFrequencies))
+    width = 0.8/len(channelIdx)
+    bars = [plt.bar(bandIdx + idx*width, np.zeros(len(bandIdx)), width=width, bottom=-120, label=f"Ch {channel+1}")
+            for idx, channel in enumerate(channelIdx)]
+    plt.xticks(bandIdx, [f"{f:.0f}" for f in analyzer.centerFrequencies], rotation=90)
+    plt.ylim(-120, 0)
+    plt.grid()
+    plt.legend()
+    with sounddevice.InputStream(samplerate=fs, channels=max(mapping), dtype='float32', callback=callback):
+        while plt.fignum_exists(plt.gcf().number):
+            levels = analyzer.update()
+            for idx, channel in enumerate(channelIdx):
+                for bar, level in zip(bars[idx], levels[:, channel]):
+                    bar.set_height(level + 120)
+            plt.pause(1/updateRate)
+
+
+if __name__ == "__main__":
+    runRta(fs=48000, mapping=[1, 2], fractionN=3)
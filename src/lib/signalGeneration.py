@@ -1,12 +1,12 @@
-import scipy.io.wavfile
-import scipy.signal
-import matplotlib.pyplot as plt
 import logging
 import numpy
 from pathlib import Path
-import soundfile
-import constants.dsp
-import constants.inputs
+from src import constants
+from src.lib.lazyImport import lazyImport
+
+scipy = lazyImport("scipy")
+plt = lazyImport("matplotlib.pyplot")
+soundfile = lazyImport("soundfile")
 
 
 # ------------------------------------------ Generation constants ------------------------------------------------------
@@ -50,13 +50,10 @@ def generateSweptsine(
     if temporal_array is None:
         temporal_array = numpy.linspace(0, duration, int(duration * fs))
 
+    L = getSweptSineRate(f0=f0, f1=f1, duration=duration, novak=novak)
     if novak is True:
-        temporal_array = None
-        L = numpy.floor((f0 * duration) / numpy.log(f1 / f0)) / f0
         newDuration = L * numpy.log(f1 / f0)
-        temporal_array = numpy.linspace(0, duration, int(newDuration * fs))
-    else:
-        L = duration / numpy.log(f1 / f0)
+        temporal_array = numpy.linspace(0, newDuration, int(newDuration * fs))
     instFreq = f0 * numpy.exp(temporal_array / L)
     signal = amp * numpy.sin(2 * numpy.pi * f0 * L * (numpy.exp(temporal_array / L) - 1))
     if fade is True:
@@ -64,6 +61,28 @@ def generateSweptsine(
     return temporal_array, signal, instFreq
 
 
+def getSweptSineRate(
+    f0: float = constants.inputs.AUDIO_BANDWIDTH[0],
+    f1: float = constants.inputs.AUDIO_BANDWIDTH[1],
+    duration: float = constants.inputs.SWEPTSINE_DURATION_LONG,
+    novak: bool = False,
+) -> float:
+    """Returns the rate L of an exponential swept sine, its instantaneous frequency being f0*exp(t/L).
+
+    Args:
+        f0 (float): Start frequency (in Hz).
+        f1 (float): End frequency (in Hz).
+        duration (float): Duration (in seconds) of the swept sine.
+        novak (bool): If True, rounds L so that f0*L is an integer, as in novaks condition.
+
+    Returns:
+        float: Rate of the swept sine (in seconds).
+    """
+    if novak is True:
+        return numpy.floor((f0 * duration) / numpy.log(f1 / f0)) / f0
+    return duration / numpy.log(f1 / f0)
+
+
 def generateSweptsineWithPulses(
     amp: float = constants.inputs.FULL_SCALE_AMPLITUDE,
     f0: float = constants.inputs.AUDIO_BANDWIDTH[0],
@@ -0,0 +1,108 @@
+import numpy as np
+from src import constants
+from src.lib.lazyImport import lazyImport
+
+scipy = lazyImport("scipy")
+
+
+# ------------------------------------------ Smoothing constants -------------------------------------------------------
+SMOOTHING_MODE_COMPLEX = "complex"
+SMOOTHING_MODE_POWER = "power"
+DEFAULT_SMOOTHING_POINTS = 512
+
+# Weighting matrices, keyed by frequency grid, fraction, output points and bandwidth.
+_SMOOTHING_MATRIX_CACHE = {}
+
+
+def getLogFrequencyList(bandwidth: list = constants.inputs.AUDIO_BANDWIDTH,
+                        nPoints: int = DEFAULT_SMOOTHING_POINTS) -> np.ndarray:
+    """Returns log spaced frequencies over a bandwidth.
+
+    Args:
+        bandwidth (list, optional): Frequency range (in Hz). Defaults to AUDIO_BANDWIDTH.
+        nPoints (int, optional): Number of frequencies. Defaults to DEFAULT_SMOOTHING_POINTS.
+
+    Returns:
+        np.ndarray: Log spaced frequency list (in Hz).
+    """
+    return np.geomspace(bandwidth[0], bandwidth[1], nPoints)
+
+
+def _getGridKey(frequencyList: np.ndarray) -> tuple:
+    """Identifies a linear fft frequency grid by its start, step and length."""
+    step = frequencyList[1] - frequencyList[0] if len(frequencyList) > 1 else 0
+    return float(frequencyList[0]), float(step), len(frequencyList)
+
+
+def getSmoothingMatrix(frequencyList: np.ndarray, fractionN: int = 3, nPoints: int = DEFAULT_SMOOTHING_POINTS,
+                       bandwidth: list = constants.inputs.AUDIO_BANDWIDTH) -> tuple:
+    """Builds (or gets from cache) the sparse 1/N octave weighting matrix of a linear frequency grid.
+    Each row averages the bins of a 1/N octave band centered on a log spaced output frequency,
+    bands narrower than a bin are linearly interpolated from their 2 closest bins.
+
+    Args:
+        frequencyList (np.ndarray): Linear frequency list of the spectra (in Hz).
+        fractionN (int, optional): Octave fraction, 3 for 1/3 octave smoothing. Defaults to 3.
+        nPoints (int, optional): Number of output frequencies. Defaults to DEFAULT_SMOOTHING_POINTS.
+        bandwidth (list, optional): Output frequency range (in Hz). Defaults to AUDIO_BANDWIDTH.
+
+    Returns:
+        tuple: Log spaced frequency list and (nPoints, bins) sparse weighting matrix.
+    """
+    frequencyList = np.asarray(frequencyList)
+    key = (_getGridKey(frequencyList), fractionN, nPoints, tuple(bandwidth))
+    if key in _SMOOTHING_MATRIX_CACHE:
+        return _SMOOTHING_MATRIX_CACHE[key]
+
+    logFrequencyList = getLogFrequencyList(bandwidth, nPoints)
+    halfBand = 2**(1/(2*fractionN))
+    lowIdx = np.searchsorted(frequencyList, logFrequencyList/halfBand, side="left")
+    highIdx = np.searchsorted(frequencyList, logFrequencyList*halfBand, side="right")
+    counts = highIdx - lowIdx
+
+    # Bands containing bins: equal weights on all of them
+    rows = np.repeat(np.arange(nPoints), counts)
+    cols = lowIdx.repeat(counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    weights = np.repeat(1/np.maximum(counts, 1), counts)
+
+    # Bands narrower than a bin: linear interpolation between the 2 closest bins
+    empty = np.flatnonzero(counts == 0)
+    rightIdx = np.clip(np.searchsorted(frequencyList, logFrequencyList[empty]), 1, len(frequencyList) - 1)
+    leftIdx = rightIdx - 1
+    fraction = (logFrequencyList[empty] - frequencyList[leftIdx])/(frequencyList[rightIdx] - frequencyList[leftIdx])
+    fraction = np.clip(fraction, 0, 1)
+    rows = np.concatenate([rows, empty, empty])
+    cols = np.concatenate([cols, leftIdx, rightIdx])
+    weights = np.concatenate([weights, 1 - fraction, fraction])
+
+    matrix = scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(nPoints, len(frequencyList)))
+    _SMOOTHING_MATRIX_CACHE[key] = (logFrequencyList, matrix)
+    return logFrequencyList, matrix
+
+
+def smoothSpectra(spectra: np.ndarray, frequencyList: np.ndarray, fractionN: int = 3,
+                  nPoints: int = DEFAULT_SMOOTHING_POINTS, bandwidth: list = constants.inputs.AUDIO_BANDWIDTH,
+                  mode: str = SMOOTHING_MODE_COMPLEX) -> tuple:
+    """Applies 1/N octave smoothing to a stack of spectra and decimates them on log spaced frequencies.
+
+    Args:
+        spectra (np.ndarray): (bins, curves) spectra, or a single spectrum.
+        frequencyList (np.ndarray): Linear frequency list of the spectra (in Hz).
+        fractionN (int, optional): Octave fraction, 3 for 1/3 octave smoothing. Defaults to 3.
+        nPoints (int, optional): Number of output frequencies. Defaults to DEFAULT_SMOOTHING_POINTS.
+        bandwidth (list, optional): Output frequency range (in Hz). Defaults to AUDIO_BANDWIDTH.
+        mode (str, optional): complex averages complex values,
+            power averages squared magnitudes and returns magnitudes. Defaults to 'complex'.
+
+    Returns:
+        tuple: Log spaced frequency list and (nPoints, curves) smoothed spectra.
+    """
+    logFrequencyList, matrix = getSmoothingMatrix(frequencyList, fractionN, nPoints, bandwidth)
+    spectra = np.asarray(spectra)
+    if mode == SMOOTHING_MODE_POWER:
+        smoothed = np.sqrt(matrix @ (spectra.real**2 + spectra.imag**2))
+    elif mode == SMOOTHING_MODE_COMPLEX:
+        smoothed = matrix @ spectra
+    else:
+        raise ValueError(f"Unknown smoothing mode: {mode}")
+    return logFrequencyList, smoothed
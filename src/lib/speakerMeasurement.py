@@ -1,9 +1,65 @@
+import logging
 import numpy
-import sounddevice
-import matplotlib.pyplot as plt
-import stft
-import time
-import signalGeneration
+from src.lib import stft
+from src.lib import signalGeneration
+from src.lib import smoothing
+from src.lib.ringBuffer import RingBuffer
+from src.lib.lazyImport import lazyImport
+
+sounddevice = lazyImport("sounddevice")
+plt = lazyImport("matplotlib.pyplot")
+
+
+def playAndRecord(signal: numpy.ndarray, fs: int, mapping: list, blockSize: int=1024) -> numpy.ndarray:
+    """Plays a signal and records input channels while it plays.
+    The audio callback pushes input blocks into a ring buffer that is drained by the calling thread,
+    so the capture lasts exactly as long as the signal.
+
+    Args:
+        signal (numpy.ndarray): Output signal.
+        fs (int): Sample frequency.
+        mapping (list): Input mapping list (channel numbers start at 1).
+        blockSize (int, optional): Frames per audio callback. Defaults to 1024.
+
+    Returns:
+        numpy.ndarray: (frames, channels) recorded signal, one column per mapped input.
+    """
+    nFrames = len(signal)
+    inputChannels = max(mapping)
+    output = numpy.asarray(signal, dtype='float32')
+    ringBuffer = RingBuffer(capacity=max(16*blockSize, fs), channels=inputChannels)
+    recordedSignal = numpy.zeros((nFrames, inputChannels), dtype='float32')
+    position = [0]
+
+    def callback(indata, outdata, frames, time, status):
+        start = position[0]
+        n = max(min(frames, nFrames - start), 0)
+        outdata[:n, 0] = output[start:start+n]
+        outdata[n:] = 0
+        position[0] = start + frames
+        ringBuffer.write(indata)
+        if position[0] >= nFrames:
+            raise sounddevice.CallbackStop
+
+    with sounddevice.Stream(
+            samplerate=fs, blocksize=blockSize, channels=(inputChannels, 1), dtype='float32', callback=callback
+            ) as stream:
+        recorded = 0
+        while recorded < nFrames:
+            # Checked before reading: once the stream is inactive, its last block is already in the ring buffer
+            active = stream.active
+            available = min(ringBuffer.availableRead, nFrames - recorded)
+            if available > 0:
+                recorded += ringBuffer.read(recordedSignal[recorded:recorded+available])
+            elif active:
+                sounddevice.sleep(max(int(1000*blockSize/fs), 1))
+            else:
+                break
+    if recorded < nFrames:
+        raise RuntimeError(f"Stream stopped after {recorded} of {nFrames} frames")
+    if ringBuffer.overruns > 0:
+        logging.warning(f"{ringBuffer.overruns} overruns while recording")
+    return recordedSignal[:, numpy.asarray(mapping) - 1]
 
 
 def measureChannels(signal: numpy.ndarray, fs: int, mapping: list, averages: int=1, window: numpy.ndarray=None) -> tuple:
@@ -20,12 +76,7 @@ def measureChannels(signal: numpy.ndarray, fs: int, mapping: list, averages: int
         tuple: Tuple of frequecy list and fft complex amplitudes.
     """
     for nn in range(averages):
-        recordedSignal = sounddevice.playrec(
-                signal, samplerate=fs,
-                blocking=False,
-                input_mapping=mapping
-                )
-        time.sleep(1.25*(len(signal)/fs))
+        recordedSignal = playAndRecord(signal, fs, mapping)
         freq = stft.computeFftFreq(recordedSignal[:, 0], fs)
         signalFft = numpy.zeros((int(recordedSignal.shape[0]/2), recordedSignal.shape[1]), dtype='complex')
         for channel in range(recordedSignal.shape[1]):
@@ -65,9 +116,14 @@ def computeTransferFunction(fft1: numpy.ndarray, fft2:numpy.ndarray) -> numpy.nd
     return numpy.divide(fft1, fft2)
 
 
-def plotComplexImpedance(zImpList, frequencyList, bandwidth):
+def plotComplexImpedance(zImpList, frequencyList, bandwidth, fractionN: int=None):
     if isinstance(zImpList, list) is not True:
         zImpList = [zImpList]
+    if fractionN is not None:
+        frequencyList, zImpArray = smoothing.smoothSpectra(
+            numpy.stack(zImpList, axis=-1), frequencyList, fractionN=fractionN, bandwidth=bandwidth
+            )
+        zImpList = list(zImpArray.T)
     plt.figure()
     for idx, zImp in enumerate(zImpList):
         plt.subplot(211)
@@ -83,9 +139,16 @@ def plotComplexImpedance(zImpList, frequencyList, bandwidth):
     plt.show()
 
 
-def plotTransferFunction(frequencyList, tfList):
+def plotTransferFunction(frequencyList, tfList, fractionN: int=None):
     if isinstance(tfList, list) is not True:
         tfList = [tfList]
+    if fractionN is not None:
+        tfArray = numpy.stack(tfList, axis=-1)
+        _, magnitudeArray = smoothing.smoothSpectra(
+            tfArray, frequencyList, fractionN=fractionN, bandwidth=[20, 20000], mode=smoothing.SMOOTHING_MODE_POWER
+            )
+        frequencyList, tfArray = smoothing.smoothSpectra(tfArray, frequencyList, fractionN=fractionN, bandwidth=[20, 20000])
+        tfList = list((magnitudeArray*numpy.exp(1j*numpy.angle(tfArray))).T)
     plt.figure()
     for idx, tf in enumerate(tfList):
         plt.subplot(211)
@@ -102,7 +165,7 @@ def plotTransferFunction(frequencyList, tfList):
     plt.show()
 
 
-def measureMultipleSpeakersImpedances(signal, fs, averages, nSpeakers, rValue, bandwidth):
+def measureMultipleSpeakersImpedances(signal, fs, averages, nSpeakers, rValue, bandwidth, fractionN: int=None):
     speaker = 1
     stop = False
     zImpList = []
@@ -118,13 +181,13 @@ def measureMultipleSpeakersImpedances(signal, fs, averages, nSpeakers, rValue, b
             speaker += 1
         else:
             stop = True
-    plotComplexImpedance(zImpList=zImpList, frequencyList=freq, bandwidth=bandwidth)
+    plotComplexImpedance(zImpList=zImpList, frequencyList=freq, bandwidth=bandwidth, fractionN=fractionN)
 
 
-def measureTransfertFunction(signal, fs, averages):
+def measureTransfertFunction(signal, fs, averages, fractionN: int=None):
     freq, signalFft = measureChannels(signal, fs, [1, 2], averages)
     tf = computeTransferFunction(signalFft[:, 0], signalFft[:, 1])
-    plotTransferFunction(frequencyList=freq, tfList=tf)
+    plotTransferFunction(frequencyList=freq, tfList=tf, fractionN=fractionN)
 
 
 if __name__ == "__main__":
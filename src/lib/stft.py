@@ -1,11 +1,13 @@
+import functools
 from pathlib import Path
-import soundfile
 import numpy as np
 import numpy.fft as fft
-import matplotlib.pyplot as plt
-import scipy.signal
-import chunks
-import fourierTransforms as ft
+from src.lib import fourierTransforms as ft
+from src.lib.lazyImport import lazyImport
+
+soundfile = lazyImport("soundfile")
+plt = lazyImport("matplotlib.pyplot")
+scipy = lazyImport("scipy")
 
 
 def computeFft(x: np.ndarray, n: int=None) -> np.ndarray:
@@ -42,42 +44,94 @@ def computeIfft(xfft: np.ndarray) -> np.ndarray:
     return x
 
 
-def computeStft(x: np.ndarray, overlapLength: int, ndft: int) -> np.ndarray:
-    """computes short term fourier transform of temporal signal.
+@functools.lru_cache(maxsize=16)
+def getSineWindow(ndft: int) -> np.ndarray:
+    """Periodic sine window, whose squares sum to 1 when overlapped by half, so that
+    the same window on analysis and synthesis reconstructs the signal.
 
     Args:
-        x (np.ndarray): signal.
-        overlapLength (int): length of overlapp between each chunk (in indexes).
         ndft (int): size of fourier transform.
 
     Returns:
-        np.ndarray: Short term fourier transform.
+        np.ndarray: read only window.
     """
-    framedSignal = chunks.frameSignal(x, ndft, overlapLength)
-    window = np.sin(np.linspace(0, np.pi, ndft))
-    stft = np.zeros((int(ndft/2+1),np.shape(framedSignal)[1]), dtype=complex)
-    for n in range(np.shape(stft)[1]):
-        stft[:, n] = computeFft(framedSignal[:, n]*window)
-    return stft
+    window = np.sin(np.pi*(np.arange(ndft) + 0.5)/ndft)
+    window.setflags(write=False)
+    return window
+
+
+def _expandWindow(window: np.ndarray, ndim: int, dtype: np.dtype) -> np.ndarray:
+    """Shapes a window to multiply (ndft, frames[, channels]) arrays."""
+    return np.asarray(window, dtype=dtype).reshape((-1,) + (1,)*(ndim - 1))
 
 
-def computeIstft(stft: np.ndarray, overlapLength: int, ndft: int) -> np.ndarray:
+def computeStft(x: np.ndarray, overlapLength: int, ndft: int, window: np.ndarray = None) -> np.ndarray:
+    """computes short term fourier transform of temporal signal, all the frames at once.
+
+    Args:
+        x (np.ndarray): (samples,) or (samples, channels) signal, float32 signals give a complex64 stft.
+        overlapLength (int): hop between the starts of 2 chunks (in indexes), ndft/2 for half overlapping chunks.
+        ndft (int): size of fourier transform.
+        window (np.ndarray, optional): analysis window. Defaults to getSineWindow(ndft).
+
+    Returns:
+        np.ndarray: (ndft//2+1, frames) or (ndft//2+1, frames, channels) Short term fourier transform.
+    """
+    x = np.asarray(x)
+    if not np.issubdtype(x.dtype, np.floating):
+        x = x.astype(float)
+    if window is None:
+        window = getSineWindow(ndft)
+    if len(x) < ndft:
+        return np.zeros((ndft//2 + 1, 0) + x.shape[1:], dtype=np.result_type(x.dtype, np.complex64))
+    # (frames, [channels,] ndft) views, then (ndft, frames[, channels])
+    frames = np.lib.stride_tricks.sliding_window_view(x, ndft, axis=0)[::overlapLength]
+    frames = np.moveaxis(frames, -1, 0)*_expandWindow(window, x.ndim + 1, x.dtype)
+    # numpy < 2 transforms in double precision whatever the input type
+    return fft.rfft(frames, axis=0).astype(np.result_type(x.dtype, np.complex64), copy=False)
+
+
+def overlapAndAdd(frames: np.ndarray, overlapLength: int) -> np.ndarray:
+    """Sums (ndft, frames[, channels]) chunks overlapping every overlapLength indexes,
+    with one vectorized addition per chunk overlapping a given one instead of one per chunk.
+
+    Args:
+        frames (np.ndarray): (ndft, frames[, channels]) chunks.
+        overlapLength (int): hop between the starts of 2 chunks (in indexes).
+
+    Returns:
+        np.ndarray: ((frames-1)*overlapLength + ndft[, channels]) signal.
+    """
+    ndft, nFrames = frames.shape[:2]
+    nShifts = -(-ndft//overlapLength)
+    # Chunks padded to nShifts hops, each hop of a chunk lands on the same hop of the signal
+    padded = np.zeros((nShifts*overlapLength,) + frames.shape[1:], dtype=frames.dtype)
+    padded[:ndft] = frames
+    hops = np.moveaxis(padded.reshape((nShifts, overlapLength) + frames.shape[1:]), 2, 0)
+    signal = np.zeros(((nFrames + nShifts - 1)*overlapLength,) + frames.shape[2:], dtype=frames.dtype)
+    for shift in range(nShifts):
+        signal[shift*overlapLength:(shift + nFrames)*overlapLength] += hops[:, shift].reshape((-1,) + frames.shape[2:])
+    return signal[:max(nFrames - 1, 0)*overlapLength + ndft]
+
+
+def computeIstft(stft: np.ndarray, overlapLength: int, ndft: int, window: np.ndarray = None) -> np.ndarray:
     """Computes signal from stft by applying inverse short term fourier transform.
 
     Args:
-        stft (np.ndarray): Short term fourier transform of a signal.   
-        overlapLength (int): length of overlapp between each chunk (in indexes).
+        stft (np.ndarray): (ndft//2+1, frames[, channels]) Short term fourier transform of a signal,
+            complex64 stfts give a float32 signal.
+        overlapLength (int): hop between the starts of 2 chunks (in indexes).
         ndft (int): size of fourier transform.
+        window (np.ndarray, optional): synthesis window. Defaults to getSineWindow(ndft).
 
     Returns:
-        np.ndarray: _description_
+        np.ndarray: ((frames-1)*overlapLength + ndft[, channels]) temporal signal.
     """
-    framedSignal = np.zeros((ndft,np.shape(stft)[1]))
-    window = np.sin(np.linspace(0, np.pi, ndft))
-    for n in range(np.shape(stft)[1]):
-        framedSignal[:, n] = computeIfft(stft[:, n])*window
-    signal = chunks.overlapAndAdd(framedSignal, overlapLength, ndft)
-    return signal
+    if window is None:
+        window = getSineWindow(ndft)
+    frames = fft.irfft(stft, n=ndft, axis=0).astype(np.asarray(stft).real.dtype, copy=False)
+    frames *= _expandWindow(window, frames.ndim, frames.dtype)
+    return overlapAndAdd(frames, overlapLength)
 
 
 def _processStft(stft: np.ndarray, fs: int, nfft: int):
@@ -90,8 +144,7 @@ def _processStft(stft: np.ndarray, fs: int, nfft: int):
     """
     b, a = scipy.signal.iirfilter(2, Wn=1000, fs=fs, btype="low", ftype="butter")
     _, h = scipy.signal.freqz(b=b, a=a, worN=int(nfft/2+1), fs=fs)
-    for n in range(np.shape(stft)[1]):
-        stft[:, n] = h*stft[:, n]
+    stft *= h.reshape((-1,) + (1,)*(stft.ndim - 1))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,202 @@
+import numpy as np
+
+
+class THIELE_SMALL_PARAMETERS:
+    RE = "Re"
+    LE = "Le"
+    FS = "Fs"
+    QMS = "Qms"
+    QES = "Qes"
+    QTS = "Qts"
+
+
+# Order of the fitted parameters along the last axis of the parameter arrays.
+_PARAMETERS_ORDER = [
+    THIELE_SMALL_PARAMETERS.RE,
+    THIELE_SMALL_PARAMETERS.LE,
+    THIELE_SMALL_PARAMETERS.FS,
+    THIELE_SMALL_PARAMETERS.QMS,
+    THIELE_SMALL_PARAMETERS.QES,
+]
+
+
+def _asBatch(zImp: np.ndarray) -> np.ndarray:
+    """Returns impedance curves as a (bins, curves) array."""
+    zImp = np.asarray(zImp)
+    if zImp.ndim == 1:
+        zImp = zImp[:, np.newaxis]
+    return zImp
+
+
+def computeImpedanceModel(frequencyList: np.ndarray, parameters: np.ndarray) -> np.ndarray:
+    """Computes the lumped element impedance of drivers:
+        Z(f) = Re + j*w*Le + Re*Qms/Qes / (1 + j*Qms*(f/Fs - Fs/f))
+
+    Args:
+        frequencyList (np.ndarray): Frequency list (in Hz).
+        parameters (np.ndarray): (curves, 5) array of Re, Le, Fs, Qms and Qes.
+
+    Returns:
+        np.ndarray: (bins, curves) complex impedance.
+    """
+    re, le, fs, qms, qes = np.moveaxis(np.atleast_2d(parameters), -1, 0)
+    f = np.asarray(frequencyList)[:, np.newaxis]
+    d = 1 + 1j*qms*(f/fs - fs/f)
+    return re + 1j*2*np.pi*f*le + re*qms/qes/d
+
+
+def findResonancePeak(zImp: np.ndarray, frequencyList: np.ndarray, bandwidth: list=None) -> tuple:
+    """Finds the resonance peak of impedance curves and estimates starting Thiele-Small parameters from it.
+
+    Args:
+        zImp (np.ndarray): (bins, curves) complex impedance, or a single curve.
+        frequencyList (np.ndarray): Frequency list (in Hz).
+        bandwidth (list, optional): Frequency range used for the search (in Hz). Defaults to the whole list.
+
+    Returns:
+        tuple: Index of the resonance peak and (curves, 5) array of estimated Re, Le, Fs, Qms and Qes.
+    """
+    zImp = _asBatch(zImp)
+    frequencyList = np.asarray(frequencyList)
+    if bandwidth is None:
+        bandwidth = [frequencyList[frequencyList > 0][0], frequencyList[-1]]
+    inBand = (frequencyList >= bandwidth[0]) & (frequencyList <= bandwidth[1]) & (frequencyList > 0)
+    bandIndexes = np.flatnonzero(inBand)
+    # The real part peaks exactly at Fs, even when Le makes |Z| rise at high frequencies
+    zReal = zImp[bandIndexes].real
+    f = frequencyList[bandIndexes]
+
+    peakIdx = np.argmax(zReal, axis=0)
+    curves = np.arange(zReal.shape[1])
+    fs = f[peakIdx]
+    zMax = zReal[peakIdx, curves]
+    re = np.maximum(np.min(zReal, axis=0), 1e-3)
+    r0 = np.maximum(zMax/re, 1 + 1e-3)
+
+    # Half power points of the motional resistance, where Qms*(f/Fs - Fs/f) = +-1
+    below = zReal < (re + zMax)/2
+    idx = np.arange(len(f))[:, np.newaxis]
+    lowIdx = np.max(np.where(below & (idx < peakIdx), idx, 0), axis=0)
+    highIdx = np.min(np.where(below & (idx > peakIdx), idx, len(f) - 1), axis=0)
+    f1 = f[lowIdx]
+    f2 = f[highIdx]
+    widths = np.where(f2 > f1, f2 - f1, fs)
+    qms = fs/widths
+    qes = qms/(r0 - 1)
+
+    # Voice coil inductance from the top of the band, where the motional part is negligible
+    le = np.maximum(zImp[bandIndexes[-1]].imag/(2*np.pi*f[-1]), 1e-6)
+
+    parameters = np.stack([re, le, fs, qms, qes], axis=-1)
+    return bandIndexes[peakIdx], parameters
+
+
+def fitThieleSmallParameters(
+        zImp: np.ndarray, frequencyList: np.ndarray, bandwidth: list=None, iterations: int=30,
+        initialParameters: np.ndarray=None) -> tuple:
+    """Fits Thiele-Small parameters of a batch of impedance curves at once.
+    A Levenberg-Marquardt least squares is run on all curves simultaneously,
+    warm started from the resonance peak of each curve.
+
+    Args:
+        zImp (np.ndarray): (bins, curves) complex impedance, or a single curve.
+        frequencyList (np.ndarray): Frequency list (in Hz).
+        bandwidth (list, optional): Frequency range used for the fit (in Hz). Defaults to the whole list.
+        iterations (int, optional): Number of Levenberg-Marquardt iterations. Defaults to 30.
+        initialParameters (np.ndarray, optional): (curves, 5) starting Re, Le, Fs, Qms and Qes.
+            Defaults to the estimation of findResonancePeak.
+
+    Returns:
+        tuple: Dict of (curves,) parameter arrays and (curves,) relative rms residual of the fits.
+    """
+    zImp = _asBatch(zImp)
+    frequencyList = np.asarray(frequencyList)
+    if bandwidth is None:
+        bandwidth = [frequencyList[frequencyList > 0][0], frequencyList[-1]]
+    if initialParameters is None:
+        _, initialParameters = findResonancePeak(zImp, frequencyList, bandwidth)
+    inBand = (frequencyList >= bandwidth[0]) & (frequencyList <= bandwidth[1]) & (frequencyList > 0)
+    # Curves first layout, (curves, bins), so that each curve normal equations are contiguous
+    f = frequencyList[inBand][np.newaxis, :]
+    zMeasured = np.ascontiguousarray(zImp[inBand].T)
+    weights = 1/np.maximum(np.abs(zMeasured), 1e-12)
+    omega = 2*np.pi*f
+    nBins = f.shape[1]
+
+    def computeResiduals(theta):
+        re, le, fs, qms, qes = np.exp(theta).T[..., np.newaxis]
+        res = re*qms/qes
+        zMotional = res/(1 + 1j*qms*(f/fs - fs/f))
+        residuals = (re + 1j*omega*le + zMotional - zMeasured)*weights
+        return residuals, (re, le, fs, qms, res, zMotional)
+
+    # Fitted in log space so that the parameters stay positive
+    theta = np.log(np.maximum(np.atleast_2d(initialParameters).astype(float), 1e-12))
+    damping = np.full(theta.shape[0], 1e-2)
+    jacobian = np.empty((theta.shape[0], theta.shape[1], 2*nBins))
+    stackedResiduals = np.empty((theta.shape[0], 2*nBins, 1))
+    residuals, state = computeResiduals(theta)
+    cost = np.sum(residuals.real**2 + residuals.imag**2, axis=1)
+    for _ in range(iterations):
+        re, le, fs, qms, res, zMotional = state
+        zMotional2 = zMotional*zMotional/res
+        # Derivatives of the weighted residuals with respect to the log of Re, Le, Fs, Qms and Qes
+        for idx, derivative in enumerate([
+            re + zMotional,
+            1j*omega*le,
+            1j*qms*(f/fs + fs/f)*zMotional2,
+            zMotional2,
+            -zMotional,
+        ]):
+            derivative = derivative*weights
+            jacobian[:, idx, :nBins] = derivative.real
+            jacobian[:, idx, nBins:] = derivative.imag
+        stackedResiduals[:, :nBins, 0] = residuals.real
+        stackedResiduals[:, nBins:, 0] = residuals.imag
+        # Real valued normal equations of the complex residuals, (curves, 5, 5)
+        jtj = jacobian @ jacobian.transpose(0, 2, 1)
+        jtr = jacobian @ stackedResiduals
+        diagonal = np.einsum('cpp->cp', jtj)
+        lhs = jtj + (damping[:, np.newaxis]*diagonal)[..., np.newaxis]*np.eye(jtj.shape[-1])
+        step = np.linalg.solve(lhs, -jtr)[..., 0]
+        newTheta = theta + step
+        newResiduals, newState = computeResiduals(newTheta)
+        newCost = np.sum(newResiduals.real**2 + newResiduals.imag**2, axis=1)
+        improved = newCost < cost
+        theta = np.where(improved[:, np.newaxis], newTheta, theta)
+        cost = np.where(improved, newCost, cost)
+        damping = np.where(improved, damping/3, damping*4)
+        residuals = np.where(improved[:, np.newaxis], newResiduals, residuals)
+        state = [np.where(improved[:, np.newaxis], new, old) for new, old in zip(newState, state)]
+        if np.all(np.max(np.abs(step), axis=1) < 1e-9):
+            break
+
+    parameters = np.exp(theta)
+    parametersDict = {name: parameters[:, idx] for idx, name in enumerate(_PARAMETERS_ORDER)}
+    qms = parametersDict[THIELE_SMALL_PARAMETERS.QMS]
+    qes = parametersDict[THIELE_SMALL_PARAMETERS.QES]
+    parametersDict[THIELE_SMALL_PARAMETERS.QTS] = qms*qes/(qms + qes)
+    rmsResiduals = np.sqrt(cost/nBins)
+    return parametersDict, rmsResiduals
+
+
+if __name__ == "__main__":
+    # Fit a batch of synthetic noisy drivers
+    nSpeakers = 64
+    frequencyList = np.linspace(0, 24000, 24001)
+    rng = np.random.default_rng(0)
+    trueParameters = np.stack([
+        rng.uniform(3, 7, nSpeakers),
+        rng.uniform(0.1e-3, 1e-3, nSpeakers),
+        rng.uniform(30, 120, nSpeakers),
+        rng.uniform(2, 8, nSpeakers),
+        rng.uniform(0.3, 0.8, nSpeakers),
+    ], axis=-1)
+    zImp = computeImpedanceModel(frequencyList[1:], trueParameters)
+    zImp = np.concatenate([np.full((1, nSpeakers), np.nan), zImp])
+    zImp += 0.02*(rng.standard_normal(zImp.shape) + 1j*rng.standard_normal(zImp.shape))
+    parametersDict, residuals = fitThieleSmallParameters(zImp, frequencyList, bandwidth=[5, 5000])
+    for idx, name in enumerate(_PARAMETERS_ORDER):
+        error = np.max(np.abs(parametersDict[name]/trueParameters[:, idx] - 1))
+        print(f"{name}: max relative error {error:.2e}")
+    print(f"max rms residual: {np.max(residuals):.2e}")
@@ -0,0 +1,106 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+
+CORE_MODULES = [
+    "src.lib.fourierTransforms",
+    "src.lib.stft",
+    "src.lib.constantQ",
+    "src.lib.phaseVocoder",
+    "src.lib.signalGeneration",
+    "src.lib.smoothing",
+    "src.lib.ringBuffer",
+    "src.lib.rta",
+    "src.lib.harmonicDistortion",
+    "src.lib.thieleSmall",
+    "src.lib.speakerMeasurement",
+    "src.lib.OpenStreetMap.invadersTable",
+    "src.lib.OpenStreetMap.spatialIndex",
+]
+IMPORT_BUDGET = 0.5
+HEAVY_MODULES = ["matplotlib", "sounddevice", "soundfile", "scipy.signal", "scipy.sparse", "scipy.spatial",
+                 "folium", "bs4", "requests"]
+IMPORT_PROGRAM = """\
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+# Heavy dependencies already imported by the caller must not hide the submodules bound lazily by the core modules
+PREIMPORTED_PROGRAM = """\
+import tempfile
+from pathlib import Path
+import folium
+from src.lib.OpenStreetMap import gpx
+records = [gpx.WaypointRecord(f"PA_{idx:02d}", 48.85 + idx*1e-3, 2.35, color="#ff0000") for idx in range(1, 11)]
+with tempfile.TemporaryDirectory() as folder:
+    for mode in [gpx.MAP_MODES.MARKERS, gpx.MAP_MODES.GEOJSON, gpx.MAP_MODES.CLUSTER]:
+        gpx.visualizeGpx(records, mode=mode, outputPath=Path(folder) / f"{mode}.html", openBrowser=False)
+"""
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(
+        description="Measures the import time of the core modules, each in a fresh interpreter, against a budget",
+        formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=2000, width=1000),
+    )
+    parser.add_argument("-b", "--budget", help="float maximum import time of each module (in s)", type=float, default=IMPORT_BUDGET)
+    parser.add_argument("-r", "--repeats", help="int number of measures of each module, the best one is kept", type=int, default=3)
+    args = parser.parse_args()
+    return args
+
+
+def measureImport(module: str, repeats: int = 3) -> tuple:
+    """Imports a module in fresh interpreters, from the repository root.
+
+    Args:
+        module (str): Full name of the module.
+        repeats (int, optional): Number of measures, the best one is kept. Defaults to 3.
+
+    Returns:
+        tuple: Best import time (in s) and heavy dependencies loaded by the import.
+    """
+    rootPath = Path(__file__).resolve().parents[2]
+    best, heavy = None, []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROGRAM.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=rootPath, capture_output=True, text=True, check=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["elapsed"] < best:
+            best = result["elapsed"]
+        heavy = result["heavy"]
+    return best, heavy
+
+
+def checkPreimportedUse() -> str:
+    """Renders maps in every mode in a fresh interpreter which imported folium before the core modules.
+
+    Returns:
+        str: Error output, empty if the maps were rendered.
+    """
+    rootPath = Path(__file__).resolve().parents[2]
+    result = subprocess.run([sys.executable, "-c", PREIMPORTED_PROGRAM], cwd=rootPath, capture_output=True, text=True)
+    return result.stderr.strip() if result.returncode else ""
+
+
+if __name__ == "__main__":
+    argument = getArgs()
+    failures = []
+    for module in CORE_MODULES:
+        elapsed, heavy = measureImport(module, argument.repeats)
+        print(f"{module:40s} {elapsed*1e3:7.1f} ms{'  loads ' + ', '.join(heavy) if heavy else ''}")
+        if elapsed > argument.budget:
+            failures.append(f"{module} imports in {elapsed:.3f} s, over the {argument.budget} s budget")
+        if heavy:
+            failures.append(f"{module} loads {', '.join(heavy)} at import")
+    error = checkPreimportedUse()
+    print(f"{'maps with folium imported first':40s} {'failed' if error else 'ok'}")
+    if error:
+        failures.append(f"maps fail when folium is imported first:\n{error}")
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,51 @@
+import argparse
+import numpy as np
+import logging
+import os, sys
+from pathlib import Path
+
+sys.path.append(Path(os.getcwd()).as_posix())
+from src.lib.OpenStreetMap import invadersEditor
+from src.lib.OpenStreetMap import invaderSpotter
+from src.lib.OpenStreetMap import responseCache
+from src.lib.OpenStreetMap import gpxCache
+from src.lib.OpenStreetMap import reconciliation
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(
+        description="Reconcile invader states of gpx colors, flash csv and invader-spotter, and report changes since last run",
+        formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=2000, width=1000),
+    )
+    parser.add_argument("-gpx", "--gpxPath", help="str path of space invaders gpx", default="ressources/Space Invaders.gpx")
+    parser.add_argument("-csv", "--csvPath", help="str path of flashed invaders csv", default=None)
+    parser.add_argument("-c", "--city", help="city filter prefixes, or all", nargs="+", default=["ROM"])
+    parser.add_argument("-p", "--previous", help="str path of the reconciled states, compared then updated", default="reconciledStates.json")
+    parser.add_argument("--cache-dir", help="str path of the invader-spotter pages cache", dest="cachePath", default=invaderSpotter.DEFAULT_CACHE_PATH)
+    parser.add_argument("--ttl", help="float time during which cached pages are used without request, in s", type=float, default=responseCache.DEFAULT_TTL)
+    parser.add_argument("--offline", help="Only uses cached pages, without any request", action="store_true")
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    argument = getArgs()
+    invadersTable = gpxCache.loadInvadersTable(gpxPath=argument.gpxPath)
+    cities = [city.upper() for city in argument.city]
+    if "ALL" in cities:
+        cities = invadersTable.getCityNames()
+    cityCodes = [invadersTable.cities.codes[city] for city in cities if city in invadersTable.cities.codes]
+    invadersTable = invadersTable.select(np.isin(invadersTable.cityCodes, cityCodes))
+    with invaderSpotter.createCachedClient(argument.cachePath, ttl=argument.ttl, offline=argument.offline) as client:
+        scrapedStates = reconciliation.getStatesFromStateDict(invadersEditor.getInvaderSpotterStateInfos(dict.fromkeys(cities), client=client))
+    flashedKeys = set()
+    if argument.csvPath is not None:
+        flashedKeys = reconciliation.getFlashedFromCSV(invadersEditor.openInvaderCSV(Path(argument.csvPath)))
+        flashedKeys = {key for key in flashedKeys if key[0] in cities}
+    report = reconciliation.reconcileInvaderStates(
+        scrapedStates, reconciliation.getStatesFromTable(invadersTable), flashedKeys,
+        reconciliation.loadReconciledStates(argument.previous), cities=cities,
+        )
+    print(reconciliation.formatReconciliationReport(report, names=reconciliation.getNamesFromTable(invadersTable)))
+    reconciliation.saveReconciledStates(report["states"], argument.previous, cities=cities)
@@ -5,7 +5,9 @@ from pathlib import Path
 
 sys.path.append(Path(os.getcwd()).as_posix())
 from src.lib.OpenStreetMap import gpx as gpxLib
-from src.lib.OpenStreetMap import invadersEditor
+from src.lib.OpenStreetMap import invadersPipeline
+from src.lib.OpenStreetMap import invaderSpotter
+from src.lib.OpenStreetMap import responseCache
 
 
 def getArgs():
@@ -14,8 +16,17 @@ def getArgs():
         formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=2000, width=1000),
     )
     parser.add_argument("-gpx", "--gpxPath", help="str path of space invaders gpx", default="ressources/Space Invaders.gpx")
-    parser.add_argument("-c", "--city", help="city filter prefix", default="ROM")
+    parser.add_argument("-c", "--city", help="city filter prefixes, or all", nargs="+", default=["ROM"])
     parser.add_argument("-f", "--flashed", help="Shows flashed invaders or not", default=False)
+    parser.add_argument("-s", "--snapshot", help="str path of invader states snapshot, refreshed from news when given", default=None)
+    parser.add_argument("-m", "--mapMode", help="map rendering mode", default=gpxLib.MAP_MODES.GEOJSON,
+                        choices=[gpxLib.MAP_MODES.MARKERS, gpxLib.MAP_MODES.GEOJSON, gpxLib.MAP_MODES.CLUSTER])
+    parser.add_argument("-r", "--route", help="str path of the gpx route through the invaders left to flash, planned when given", default=None)
+    parser.add_argument("-o", "--output", help="str path of the html map", default="waypoints_map.html")
+    parser.add_argument("--no-browser", help="Saves the map without opening it", dest="openBrowser", action="store_false")
+    parser.add_argument("--cache-dir", help="str path of the invader-spotter pages cache", dest="cachePath", default=invaderSpotter.DEFAULT_CACHE_PATH)
+    parser.add_argument("--ttl", help="float time during which cached pages are used without request, in s", type=float, default=responseCache.DEFAULT_TTL)
+    parser.add_argument("--offline", help="Only uses cached pages, without any request", action="store_true")
     args = parser.parse_args()
     return args
 
@@ -23,8 +34,9 @@ def getArgs():
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     argument = getArgs()
-    invadersDict = invadersEditor.getGpxInvaders(gpxPath=argument.gpxPath, cityFilter=argument.city)
-    stateDict = invadersEditor.getInvaderSpotterStateInfos(invadersDict)
-    invadersDict = invadersEditor.updateInvadersDictFromStateDict(invadersDict=invadersDict, stateDict=stateDict, showFlashed=argument.flashed)
-    newGpx = invadersEditor.createGpxFromInvadersDict(invadersDict=invadersDict, name='Space Invaders')
-    gpxLib.visualizeGpx(newGpx)
\ No newline at end of file
+    _, timings = invadersPipeline.runInvadersMapPipeline(
+        gpxPath=argument.gpxPath, cities=argument.city, snapshotPath=argument.snapshot, showFlashed=argument.flashed,
+        mapMode=argument.mapMode, outputPath=argument.output, openBrowser=argument.openBrowser, routePath=argument.route,
+        cachePath=argument.cachePath, ttl=argument.ttl, offline=argument.offline,
+        )
+    print(timings.getReport())
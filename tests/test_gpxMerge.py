@@ -0,0 +1,50 @@
+from pathlib import Path
+import pytest
+import src.lib.OpenStreetMap.gpx as gpxLib
+import src.lib.OpenStreetMap.gpxMerge as gpxMerge
+from src.lib.OpenStreetMap.invadersTable import InvadersTable
+
+
+SAMPLE_GPX_PATH = Path(__file__).resolve().parents[1]/"ressources"/"Space Invaders.gpx"
+
+
+@pytest.fixture
+def gpxFolder(tmp_path):
+    """Folder of two gpx files splitting the sample invaders, Paris in one and the other cities in the other."""
+    table = InvadersTable.fromGpx(SAMPLE_GPX_PATH)
+    isParis = table.cityCodes == table.cities.codes["PA"]
+    gpxLib.saveGpx(table.select(isParis).toGpx(name="Paris"), tmp_path/"paris.gpx")
+    gpxLib.saveGpx(table.select(~isParis).toGpx(name="Others"), tmp_path/"others.gpx")
+    return tmp_path
+
+
+def getRecordsByName(gpxPath: Path) -> dict:
+    return {record.name: record for record in gpxLib.iterGpxWaypoints(gpxPath)}
+
+
+@pytest.mark.parametrize("maxWorkers", [1, 2])
+def test_mergeKeepsWaypointFields(gpxFolder, maxWorkers):
+    expected = {**getRecordsByName(gpxFolder/"paris.gpx"), **getRecordsByName(gpxFolder/"others.gpx")}
+    outputPath = gpxMerge.mergeGpxFolder(gpxFolder, "merged", maxWorkers=maxWorkers)
+    records = getRecordsByName(outputPath)
+    assert records == expected
+    assert sum(record.time is not None for record in records.values()) == len(records)
+    assert sum(record.elevation is not None for record in records.values()) > 0
+
+
+def test_mergeLeavesInputFolderClean(gpxFolder):
+    outputPath = gpxMerge.mergeGpxFolder(gpxFolder, "merged", maxWorkers=1)
+    assert sorted(path.name for path in gpxFolder.iterdir()) == sorted([
+        "others.gpx", "paris.gpx", outputPath.name, gpxMerge.getManifestPath(outputPath).name,
+        gpxMerge.getCacheFolder(outputPath).name,
+        ])
+    (gpxFolder/"others.gpx").unlink()
+    gpxMerge.mergeGpxFolder(gpxFolder, "merged", maxWorkers=1)
+    assert [path.name for path in gpxMerge.getCacheFolder(outputPath).iterdir()] == ["paris.gpx.npz"]
+
+
+def test_incrementalMergeIsSkippedWhenInputsDidNotChange(gpxFolder):
+    outputPath = gpxMerge.mergeGpxFolder(gpxFolder, "merged", maxWorkers=1)
+    mtime = outputPath.stat().st_mtime_ns
+    assert gpxMerge.mergeGpxFolder(gpxFolder, "merged", maxWorkers=1) == outputPath
+    assert outputPath.stat().st_mtime_ns == mtime
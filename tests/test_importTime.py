@@ -0,0 +1,13 @@
+import pytest
+from src.scripts import importTimeBenchmark
+
+
+@pytest.mark.parametrize("module", importTimeBenchmark.CORE_MODULES)
+def test_coreModuleImportsWithinBudget(module):
+    elapsed, heavy = importTimeBenchmark.measureImport(module, repeats=3)
+    assert heavy == []
+    assert elapsed <= importTimeBenchmark.IMPORT_BUDGET
+
+
+def test_mapsRenderWithFoliumImportedFirst():
+    assert importTimeBenchmark.checkPreimportedUse() == ""
@@ -0,0 +1,114 @@
+from pathlib import Path
+import pytest
+from bs4 import BeautifulSoup
+from src.lib.OpenStreetMap import invaderSpotter, invaderSpotterReplay
+
+
+# Synthetic listing pages in the layout of the site, see invaderSpotterReplay.FIXTURE_PAGES_PATH
+PAGES_PATH = Path(__file__).resolve().parents[1]/"ressources"/"invaderSpotter"
+LISTING_PAGE_PATHS = sorted(PAGES_PATH.glob("*_*.html"))
+
+
+def parseListingRowsWithSoup(html: str) -> list:
+    """Previous parser of the listing pages, on a full BeautifulSoup tree, as reference."""
+    rows = []
+    for element in BeautifulSoup(html, "html.parser").find_all("tr", {"class": "haut"}):
+        content = element.contents[1]
+        state = content.text.split('Date')[0]
+        state = state.split(':  ')[-1]
+        name = content.text.split(' ')[0]
+        if '!' in state:
+            state = state.split(' !')[0]
+        if 'Instagram' in state:
+            state = state.split('Instagram')[0]
+        rows.append((name, state))
+    return rows
+
+
+def test_listingPagesArePresent():
+    assert len(LISTING_PAGE_PATHS) > 0
+
+
+@pytest.mark.parametrize("pagePath", LISTING_PAGE_PATHS, ids=lambda pagePath: pagePath.stem)
+def test_parseListingRowsMatchesSoupParser(pagePath):
+    html = pagePath.read_text(encoding="utf-8")
+    rows = invaderSpotter.parseListingRows(html)
+    assert [(name, state) for name, state, _ in rows] == parseListingRowsWithSoup(html)
+
+
+@pytest.mark.parametrize("pagePath", LISTING_PAGE_PATHS, ids=lambda pagePath: pagePath.stem)
+def test_parseListingRowsFields(pagePath):
+    city, page = pagePath.stem.rsplit('_', 1)
+    for name, state, date in invaderSpotter.parseListingRows(pagePath.read_text(encoding="utf-8")):
+        assert name.startswith(f"{city}_")
+        assert 10*int(page) < int(name.split('_')[1]) <= 10*(int(page) + 1)
+        assert state == state.strip() and '!' not in state and 'Instagram' not in state
+        assert date is not None
+
+
+def test_parseListingPageStopsPastLastPage():
+    cityPages = {}
+    for pagePath in LISTING_PAGE_PATHS:
+        city, page = pagePath.stem.rsplit('_', 1)
+        cityPages.setdefault(city, []).append(int(page))
+    for city, pages in cityPages.items():
+        lastPage = max(pages)
+        assert invaderSpotter.parseListingPage((PAGES_PATH/f"{city}_{lastPage}.html").read_text(encoding="utf-8")) == {}
+        for page in range(lastPage):
+            assert invaderSpotter.parseListingPage((PAGES_PATH/f"{city}_{page}.html").read_text(encoding="utf-8")) != {}
+
+
+def test_clientFetchesFixturePages():
+    expectedStates = {}
+    for pagePath in LISTING_PAGE_PATHS:
+        expectedStates.update(invaderSpotter.parseListingPage(pagePath.read_text(encoding="utf-8")))
+    server, baseUrl = invaderSpotterReplay.startReplayServer(PAGES_PATH)
+    try:
+        client = invaderSpotter.InvaderSpotterClient(baseUrl=baseUrl, requestsPerSecond=None)
+        assert client.getStateInfos(invaderSpotterReplay.getListingCities(PAGES_PATH)) == expectedStates
+    finally:
+        server.shutdown()
+
+
+def test_cachedClientRepeatedRunsSendNoRequest(tmp_path):
+    cities = invaderSpotterReplay.getListingCities(PAGES_PATH)
+    server, baseUrl = invaderSpotterReplay.startReplayServer(PAGES_PATH)
+    # Without lookahead the same pages are requested at each run, whatever the completion order
+    options = {"baseUrl": baseUrl, "requestsPerSecond": None, "lookahead": 1}
+    try:
+        with invaderSpotter.createCachedClient(tmp_path, **options) as client:
+            expectedStates = client.getStateInfos(cities)
+        server.RequestHandlerClass.requestCount = 0
+        with invaderSpotter.createCachedClient(tmp_path, **options) as client:
+            assert client.getStateInfos(cities) == expectedStates
+        assert server.RequestHandlerClass.requestCount == 0
+        with invaderSpotter.createCachedClient(tmp_path, ttl=0, **options) as client:
+            assert client.getStateInfos(cities) == expectedStates
+        assert server.RequestHandlerClass.requestCount > 0
+    finally:
+        server.shutdown()
+    with invaderSpotter.createCachedClient(tmp_path, ttl=0, offline=True, **options) as client:
+        assert client.getStateInfos(cities) == expectedStates
+        with pytest.raises(invaderSpotter.CacheMissError):
+            client.getStateInfos(["ZZZ"])
+
+
+@pytest.mark.parametrize("maxWorkers, lookahead", [(1, 1), (8, 2), (8, 4)])
+def test_iterStateInfosYieldsEachCityOnce(maxWorkers, lookahead):
+    cities = invaderSpotterReplay.getListingCities(PAGES_PATH)
+    expectedStates = {city: {} for city in cities}
+    for pagePath in LISTING_PAGE_PATHS:
+        expectedStates[pagePath.stem.rsplit('_', 1)[0]].update(
+            invaderSpotter.parseListingPage(pagePath.read_text(encoding="utf-8"))
+            )
+    expectedStates["ZZZ"] = {}
+    server, baseUrl = invaderSpotterReplay.startReplayServer(PAGES_PATH)
+    try:
+        client = invaderSpotter.InvaderSpotterClient(
+            baseUrl=baseUrl, maxWorkers=maxWorkers, requestsPerSecond=None, lookahead=lookahead
+            )
+        yielded = list(client.iterStateInfos(cities + ["ZZZ", cities[0]]))
+    finally:
+        server.shutdown()
+    assert sorted(city for city, _ in yielded) == sorted(cities + ["ZZZ"])
+    assert dict(yielded) == expectedStates
@@ -0,0 +1,56 @@
+from pathlib import Path
+import numpy as np
+import src.lib.OpenStreetMap.gpx as gpxLib
+import src.lib.OpenStreetMap.gpxCache as gpxCache
+from src.lib.OpenStreetMap.invadersTable import InvadersTable
+
+
+SAMPLE_GPX_PATH = Path(__file__).resolve().parents[1]/"ressources"/"Space Invaders.gpx"
+
+
+def getRecordsByName(gpxPath: Path) -> dict:
+    records = {}
+    for record in gpxLib.iterGpxWaypoints(gpxPath):
+        records.setdefault(record.name, record)
+    return records
+
+
+def test_gpxRoundTripKeepsWaypointFields(tmp_path):
+    table = InvadersTable.fromGpx(SAMPLE_GPX_PATH)
+    outputPath = tmp_path/"roundTrip.gpx"
+    gpxLib.saveGpx(table.toGpx(name="roundTrip"), outputPath)
+    expected = getRecordsByName(SAMPLE_GPX_PATH)
+    records = getRecordsByName(outputPath)
+    # Duplicates of the sample written with another zero padding are only kept once
+    assert len(records) == len(table) and len(expected) - len(records) == 3
+    assert all(record == expected[name] for name, record in records.items())
+    assert any(record.elevation is not None for record in records.values())
+    assert all(record.time is not None and record.type is not None for record in records.values())
+
+
+def test_gpxRoundTripTypesUntypedWaypointsWithGpxName(tmp_path):
+    records = [gpxLib.WaypointRecord("PA_01", 48.85, 2.35, color="#ffe808"),
+               gpxLib.WaypointRecord("PA_02", 48.86, 2.36, elevation=35.0, time="2022-11-06T17:58:45Z",
+                                     description="name=PA_02", type="Space Invaders")]
+    outputPath = tmp_path/"typed.gpx"
+    gpxLib.saveGpx(InvadersTable.fromRecords(records).toGpx(name="typed"), outputPath)
+    roundTrip = getRecordsByName(outputPath)
+    assert roundTrip["PA_01"] == records[0]._replace(type="typed")
+    assert roundTrip["PA_02"] == records[1]
+
+
+def test_cacheRoundTripKeepsWaypointFields(tmp_path):
+    gpxPath = tmp_path/"invaders.gpx"
+    gpxPath.write_bytes(SAMPLE_GPX_PATH.read_bytes())
+    table = gpxCache.loadInvadersTable(gpxPath)
+    cached = gpxCache.loadInvadersTable(gpxPath)
+    assert cached.toRecords() == table.toRecords()
+
+
+def test_concatenateAndSelectKeepWaypointFields():
+    table = InvadersTable.fromGpx(SAMPLE_GPX_PATH)
+    paris = table.selectCity("PA")
+    aix = table.selectCity("AIX")
+    stacked = InvadersTable.concatenate([aix, paris])
+    assert stacked.toRecords() == aix.toRecords() + paris.toRecords()
+    assert np.isnan(InvadersTable(numbers=[1, 2]).elevations).all()
@@ -0,0 +1,35 @@
+import sys
+import pytest
+from src.lib.lazyImport import lazyImport
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    """Package with a submodule depending on a missing module, not imported by the package."""
+    packagePath = tmp_path/"lazyPackage"
+    packagePath.mkdir()
+    (packagePath/"__init__.py").write_text("VALUE = 1\n")
+    (packagePath/"broken.py").write_text("import missingDependencyOfLazyPackage\n")
+    (packagePath/"working.py").write_text("VALUE = 2\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "lazyPackage"
+    for name in [name for name in sys.modules if name.startswith("lazyPackage")]:
+        del sys.modules[name]
+
+
+def test_lazyModuleLoadsOnFirstAccess(package):
+    module = lazyImport(package)
+    assert package not in sys.modules
+    assert module.VALUE == 1 and module.working.VALUE == 2
+    assert package in sys.modules
+
+
+def test_missingAttributeRaisesAttributeError(package):
+    with pytest.raises(AttributeError):
+        lazyImport(package).missing
+
+
+def test_missingDependencyOfSubmoduleIsReraised(package):
+    with pytest.raises(ModuleNotFoundError) as error:
+        lazyImport(package).broken
+    assert error.value.name == "missingDependencyOfLazyPackage"
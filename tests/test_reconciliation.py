@@ -0,0 +1,64 @@
+import pytest
+from src.lib.OpenStreetMap import reconciliation
+
+
+@pytest.mark.parametrize("name, defaultCity, key", [
+    ("PA_0012", None, ("PA", 12)),
+    ("pa_12", None, ("PA", 12)),
+    ("Space Invader PA_12, Paris", None, ("PA", 12)),
+    ("(LDN_105)", None, ("LDN", 105)),
+    ("0012", "ROM", ("ROM", 12)),
+    ("0012", None, None),
+    ("0000", "ROM", None),
+    ("Tour Eiffel", "PA", None),
+    (None, "PA", None),
+])
+def test_getInvaderKey(name, defaultCity, key):
+    assert reconciliation.getInvaderKey(name, defaultCity=defaultCity) == key
+
+
+def test_reconcileInvaderStatesJoinsSources():
+    scrapedStates = {("PA", 1): "OK", ("PA", 2): "Détruit", ("PA", 3): "Dégradé"}
+    gpxStates = {("PA", 1): "OK", ("PA", 2): "flashed", ("PA", 4): "Non visible"}
+    report = reconciliation.reconcileInvaderStates(scrapedStates, gpxStates, flashedKeys={("PA", 1)})
+    assert report["states"] == {
+        ("PA", 1): "flashed", ("PA", 2): "flashed", ("PA", 3): "Dégradé", ("PA", 4): "Non visible"
+    }
+    assert report["newlyFlashed"] == [("PA", 1), ("PA", 2)]
+    assert report["flashedDestroyed"] == [("PA", 2)]
+    assert report["flashedNotInGpx"] == [("PA", 1)]
+    # Nothing is added nor removed on a first run
+    assert report["added"] == [] and report["removed"] == []
+
+
+def test_reconcileInvaderStatesDiffsPreviousRun():
+    previousStates = {("PA", 1): "OK", ("PA", 2): "Détruit", ("PA", 3): "OK", ("PA", 5): "OK"}
+    scrapedStates = {("PA", 1): "Détruit", ("PA", 2): "OK", ("PA", 3): "Dégradé", ("PA", 6): "OK"}
+    report = reconciliation.reconcileInvaderStates(scrapedStates, previousStates=previousStates)
+    assert report["newlyDestroyed"] == [("PA", 1)]
+    assert report["reactivated"] == [("PA", 2)]
+    assert report["changed"] == [("PA", 1), ("PA", 2), ("PA", 3)]
+    assert report["added"] == [("PA", 6)]
+    assert report["removed"] == [("PA", 5)]
+
+
+def test_reconciledStatesRoundTrip(tmp_path):
+    path = tmp_path/"states.json"
+    states = {("PA", 1): "OK", ("PA", 1234): "Détruit", ("ROM", 2): "flashed"}
+    reconciliation.saveReconciledStates(states, path)
+    assert reconciliation.loadReconciledStates(path) == states
+    assert reconciliation.loadReconciledStates(tmp_path/"missing.json") == {}
+
+
+def test_runsOnOtherCitiesDoNotChangeTheDiff(tmp_path):
+    path = tmp_path/"states.json"
+    romeStates = {("ROM", 1): "OK", ("ROM", 2): "Détruit"}
+    parisStates = {("PA", 1): "OK"}
+    for cities, scrapedStates in [(["ROM"], romeStates), (["PA"], parisStates), (["ROM"], romeStates)]:
+        report = reconciliation.reconcileInvaderStates(
+            scrapedStates, previousStates=reconciliation.loadReconciledStates(path), cities=cities
+            )
+        reconciliation.saveReconciledStates(report["states"], path, cities=cities)
+        assert report["removed"] == []
+    assert report["added"] == [] and report["newlyDestroyed"] == [] and report["changed"] == []
+    assert reconciliation.loadReconciledStates(path) == {**romeStates, **parisStates}
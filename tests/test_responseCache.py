@@ -0,0 +1,51 @@
+import json
+from src.lib.OpenStreetMap.responseCache import ResponseCache, INDEX_FILE_NAME
+
+
+def readIndex(cache: ResponseCache) -> dict:
+    return json.loads((cache.folderPath/INDEX_FILE_NAME).read_text(encoding="utf-8"))
+
+
+def test_hitsOnlyPersistAccessTimesOnFlush(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.put("a", "body a")
+    storedIndex = readIndex(cache)
+    assert cache.get("a")["body"] == "body a"
+    assert readIndex(cache) == storedIndex
+    cache.flush()
+    assert readIndex(cache)["a"]["accessedAt"] > storedIndex["a"]["accessedAt"]
+
+
+def test_contextManagerFlushes(tmp_path):
+    with ResponseCache(tmp_path) as cache:
+        cache.put("a", "body a")
+        accessedAt = readIndex(cache)["a"]["accessedAt"]
+        cache.get("a")
+    assert readIndex(cache)["a"]["accessedAt"] > accessedAt
+
+
+def test_evictionIsLeastRecentlyUsedAcrossRuns(tmp_path):
+    with ResponseCache(tmp_path, maxBytes=12) as cache:
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        cache.get("a")
+    cache = ResponseCache(tmp_path, maxBytes=12)
+    cache.put("c", "cccc" + "c")
+    assert cache.get("a") is not None and cache.get("b") is None and cache.get("c") is not None
+
+
+def test_missingBodyIsAMiss(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.put("a", "body a")
+    (tmp_path/"a.html").unlink()
+    assert cache.get("a") is None
+    cache.flush()
+    assert "a" not in readIndex(cache)
+
+
+def test_oversizedBodyRemovesPreviousResponse(tmp_path):
+    cache = ResponseCache(tmp_path, maxBytes=8)
+    cache.put("a", "small")
+    cache.put("a", "much too large")
+    assert cache.get("a") is None
+    assert not (tmp_path/"a.html").exists()
@@ -0,0 +1,97 @@
+import datetime
+from pathlib import Path
+import pytest
+from src.lib.OpenStreetMap import invadersEditor, invaderSpotter, invaderSpotterReplay, stateSync
+
+
+PAGES_PATH = Path(__file__).resolve().parents[1]/"ressources"/"invaderSpotter"
+TODAY = datetime.date(2024, 11, 20)
+
+
+def getListingStates(city: str) -> dict:
+    states = {}
+    for pagePath in PAGES_PATH.glob(f"{city}_*.html"):
+        states.update(invaderSpotter.parseListingPage(pagePath.read_text(encoding="utf-8")))
+    return states
+
+
+@pytest.fixture
+def replay():
+    """Replay server of the fixture pages, and a client of it."""
+    server, baseUrl = invaderSpotterReplay.startReplayServer(PAGES_PATH)
+    server.RequestHandlerClass.requestCount = 0
+    yield server, invaderSpotter.InvaderSpotterClient(baseUrl=baseUrl, requestsPerSecond=None)
+    server.shutdown()
+
+
+@pytest.mark.parametrize("newsLine, cue, invaders", [
+    ("Destruction de PA_12, PA_13 et PA_14.", "Destruction", ["PA_12", "PA_13", "PA_14"]),
+    ("Réactivation de (ROM_09). Destruction de LDN_1", "Réactivation", ["ROM_09"]),
+    ("Destruction: PA_12) et PA_13;", "Destruction", ["PA_12", "PA_13"]),
+    ("Destruction de PA_12. Restauration de PA_13", "Destruction", ["PA_12"]),
+    ("Destruction de XPARIS_12 et PA_12345", "Destruction", []),
+])
+def test_findStatusFromNewsKeepsPunctuatedNames(newsLine, cue, invaders):
+    assert invadersEditor.findStatusFromNews(newsLine, cue) == invaders
+
+
+def test_parseNewsFixture():
+    monthsDict = invadersEditor.parseInvaderSpotterNews((PAGES_PATH/"news.html").read_text(encoding="utf-8"))
+    assert sorted(monthsDict.keys()) == ["202409", "202410", "202411"]
+    stateDict, unresolvedList = invadersEditor.getStateDictFromNews(monthsDict["202411"])
+    assert stateDict == {"ROM_02": "Détruit", "ROM_05": "Détruit", "PA_12": "OK", "LDN_02": "OK", "LDN_06": "OK"}
+    # The new state of a degraded invader is unknown
+    assert unresolvedList == ["NY_04"]
+
+
+def test_firstSyncCrawlsCities(replay, tmp_path):
+    _, client = replay
+    snapshotPath = tmp_path/"snapshot.json"
+    assert stateSync.syncInvaderStates(["rom"], snapshotPath, client=client, today=TODAY) == getListingStates("ROM")
+    assert stateSync.loadStateSnapshot(snapshotPath)["lastSynced"] == {"ROM": "202411"}
+
+
+def test_syncAppliesNewsDeltas(replay, tmp_path):
+    server, client = replay
+    snapshotPath = tmp_path/"snapshot.json"
+    states = {"ROM_02": "OK", "ROM_05": "OK", "ROM_09": "Détruit", "PA_03": "OK", "PA_05": "OK", "PA_12": "Détruit"}
+    stateSync.saveStateSnapshot({"lastSynced": {"ROM": "202410", "PA": "202410"}, "states": states}, snapshotPath)
+    syncedStates = stateSync.syncInvaderStates(["ROM", "PA"], snapshotPath, client=client, today=TODAY)
+    # Only news since the last synced month are applied, PA_03 being destroyed before
+    assert syncedStates == {
+        "ROM_02": "Détruit", "ROM_05": "Détruit", "ROM_09": "OK", "PA_03": "OK", "PA_05": "Détruit", "PA_12": "OK"
+    }
+    # Only the news page is requested
+    assert server.RequestHandlerClass.requestCount == 1
+    snapshot = stateSync.loadStateSnapshot(snapshotPath)
+    assert snapshot["lastSynced"] == {"ROM": "202411", "PA": "202411"}
+    assert snapshot["states"] == syncedStates
+
+
+def test_syncOnlyReturnsRequestedCities(replay, tmp_path):
+    _, client = replay
+    snapshotPath = tmp_path/"snapshot.json"
+    states = {"ROM_02": "OK", "PA_12": "Détruit"}
+    stateSync.saveStateSnapshot({"lastSynced": {"ROM": "202411", "PA": "202401"}, "states": states}, snapshotPath)
+    syncedStates = stateSync.syncInvaderStates(["ROM"], snapshotPath, client=client, today=TODAY)
+    assert syncedStates == {"ROM_02": "Détruit", "ROM_05": "Détruit"}
+    snapshot = stateSync.loadStateSnapshot(snapshotPath)
+    assert snapshot["lastSynced"] == {"ROM": "202411", "PA": "202401"}
+    assert snapshot["states"]["PA_12"] == "Détruit"
+
+
+def test_syncFallsBackToFullCrawlOfOutdatedCities(replay, tmp_path):
+    _, client = replay
+    snapshotPath = tmp_path/"snapshot.json"
+    stateSync.saveStateSnapshot({"lastSynced": {"AIX": "202401"}, "states": {"AIX_01": "OK", "AIX_99": "OK"}}, snapshotPath)
+    assert stateSync.syncInvaderStates(["AIX"], snapshotPath, client=client, today=TODAY) == getListingStates("AIX")
+
+
+@pytest.mark.parametrize("city, name", [("NY", "NY_04"), ("TK", "TK_04")])
+def test_syncFallsBackToFullCrawlOfUnresolvedCities(replay, tmp_path, city, name):
+    _, client = replay
+    snapshotPath = tmp_path/"snapshot.json"
+    stateSync.saveStateSnapshot({"lastSynced": {city: "202410"}, "states": {name: "Un peu dégradé"}}, snapshotPath)
+    syncedStates = stateSync.syncInvaderStates([city], snapshotPath, client=client, today=TODAY)
+    assert syncedStates == getListingStates(city)
+    assert syncedStates[name] != "Dégradé"